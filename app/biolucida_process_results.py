@@ -1,7 +1,7 @@
 import re
 
 from xml.etree import ElementTree
-from app.manifest_name_to_discover_name import biolucida_name_map
+from app.name_map_index import biolucida_name_map
 
 
 XMP_NS = {'xmp': 'http://ns.adobe.com/xap/1.0/', 'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#', 'x': 'adobe:ns:meta/'}
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -68,12 +69,56 @@ class Config(object):
     OSPARC_API_KEY = os.environ.get("OSPARC_API_KEY")
     OSPARC_API_SECRET = os.environ.get("OSPARC_API_SECRET")
     DIRECT_DOWNLOAD_LIMIT = int(os.environ.get("DIRECT_DOWNLOAD_LIMIT", "20971520"))
+    # Size of the chunks /s3-resource streams S3 objects in.
+    S3_STREAM_CHUNK_SIZE = int(os.environ.get("S3_STREAM_CHUNK_SIZE", "65536"))
+    # Ranges of a Range request closer than this are read from S3 with a single ranged get_object.
+    S3_RANGE_COALESCE_GAP = int(os.environ.get("S3_RANGE_COALESCE_GAP", "65536"))
+    S3_MAX_RANGES = int(os.environ.get("S3_MAX_RANGES", "16"))
     DEFAULT_S3_BUCKET_NAME = "prd-sparc-discover50-use1"
     NEUROLUCIDA_HOST = os.environ.get("NEUROLUCIDA_HOST", "https://sparc.biolucida.net:8081")
     SCI_CRUNCH_INTERLEX_HOST = os.environ.get("SCI_CRUNCH_INTERLEX_HOST", "https://scicrunch.org/api/1/elastic/Interlex_pr")
     SCI_CRUNCH_SCIGRAPH_HOST = os.environ.get("SCI_CRUNCH_SCIGRAPH_HOST", "https://scicrunch.org/api/1/sparc-scigraph")
     SCI_CRUNCH_CITATIONS_HOST = os.environ.get("SCI_CRUNCH_CITATIONS_HOST", "https://api.scicrunch.io/elastic/v2/SPARC_Citations_pr")
     SCI_CRUNCH_QDB_HOST = os.environ.get("SCI_CRUNCH_QDB_HOST", "https://services.scicrunch.io/quantdb/api/1/values")
+    SCI_CRUNCH_CONNECT_TIMEOUT = float(os.environ.get("SCI_CRUNCH_CONNECT_TIMEOUT", "5"))
+    SCI_CRUNCH_READ_TIMEOUT = float(os.environ.get("SCI_CRUNCH_READ_TIMEOUT", "60"))
+    SCI_CRUNCH_MAX_RETRIES = int(os.environ.get("SCI_CRUNCH_MAX_RETRIES", "2"))
+    SCI_CRUNCH_POOL_SIZE = int(os.environ.get("SCI_CRUNCH_POOL_SIZE", "10"))
+    SCI_CRUNCH_BREAKER_FAILURES = int(os.environ.get("SCI_CRUNCH_BREAKER_FAILURES", "5"))
+    SCI_CRUNCH_BREAKER_RESET = float(os.environ.get("SCI_CRUNCH_BREAKER_RESET", "30"))
+    SCI_CRUNCH_LATENCY_BUDGET = float(os.environ.get("SCI_CRUNCH_LATENCY_BUDGET", "5"))
+    LAST_GOOD_RESPONSE_TTL = int(os.environ.get("LAST_GOOD_RESPONSE_TTL", "604800"))
+    LAST_GOOD_RESPONSE_MAX_BYTES = int(os.environ.get("LAST_GOOD_RESPONSE_MAX_BYTES", "268435456"))
+    LAST_GOOD_REFRESH_INTERVAL = int(os.environ.get("LAST_GOOD_REFRESH_INTERVAL", "300"))
+    REVALIDATE_WORKERS = int(os.environ.get("REVALIDATE_WORKERS", "8"))
+    REVALIDATE_MAX_PENDING = int(os.environ.get("REVALIDATE_MAX_PENDING", "32"))
+    SINGLE_FLIGHT_TIMEOUT = float(os.environ.get("SINGLE_FLIGHT_TIMEOUT", "60"))
+    SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", os.path.join(tempfile.gettempdir(), "sparc-api-cache.sqlite3"))
+    DATASET_SEARCH_CACHE_TTL = int(os.environ.get("DATASET_SEARCH_CACHE_TTL", "300"))
+    DATASET_SEARCH_CACHE_MAX_BYTES = int(os.environ.get("DATASET_SEARCH_CACHE_MAX_BYTES", "268435456"))
+    BULK_DATASET_LOOKUP_LIMIT = int(os.environ.get("BULK_DATASET_LOOKUP_LIMIT", "100"))
+    PROVENANCE_CACHE_TTL = int(os.environ.get("PROVENANCE_CACHE_TTL", "2592000"))
+    PROVENANCE_CACHE_MAX_BYTES = int(os.environ.get("PROVENANCE_CACHE_MAX_BYTES", "67108864"))
+    DATASET_REPLICA_PATH = os.environ.get("DATASET_REPLICA_PATH", os.path.join(tempfile.gettempdir(), "sparc-api-datasets.sqlite3"))
+    DATASET_REPLICA_SYNC_INTERVAL = int(os.environ.get("DATASET_REPLICA_SYNC_INTERVAL", "3600"))
+    DATASET_REPLICA_MAX_AGE = int(os.environ.get("DATASET_REPLICA_MAX_AGE", "21600"))
+    FLATMAP_CACHE_TTL = int(os.environ.get("FLATMAP_CACHE_TTL", "86400"))
+    FLATMAP_CACHE_MAX_BYTES = int(os.environ.get("FLATMAP_CACHE_MAX_BYTES", "16777216"))
+    FACET_SNAPSHOT_TTL = int(os.environ.get("FACET_SNAPSHOT_TTL", "10800"))
+    FACET_SNAPSHOT_MAX_BYTES = int(os.environ.get("FACET_SNAPSHOT_MAX_BYTES", "16777216"))
+    PROCESSED_RESULT_CACHE_SIZE = int(os.environ.get("PROCESSED_RESULT_CACHE_SIZE", "2000"))
+    PROCESSED_RESULT_CACHE_MAX_BYTES = int(os.environ.get("PROCESSED_RESULT_CACHE_MAX_BYTES", "134217728"))
+    S3_METADATA_CACHE_TTL = int(os.environ.get("S3_METADATA_CACHE_TTL", "3600"))
+    S3_METADATA_CACHE_NEGATIVE_TTL = int(os.environ.get("S3_METADATA_CACHE_NEGATIVE_TTL", "60"))
+    S3_METADATA_CACHE_MAX_BYTES = int(os.environ.get("S3_METADATA_CACHE_MAX_BYTES", "16777216"))
+    S3_DISK_CACHE_PATH = os.environ.get("S3_DISK_CACHE_PATH", os.path.join(tempfile.gettempdir(), "sparc-api-s3-objects"))
+    S3_DISK_CACHE_MAX_BYTES = int(os.environ.get("S3_DISK_CACHE_MAX_BYTES", "1073741824"))
+    S3_DISK_CACHE_MAX_OBJECT_BYTES = int(os.environ.get("S3_DISK_CACHE_MAX_OBJECT_BYTES", "20971520"))
+    S3_KEY_INDEX_TTL = int(os.environ.get("S3_KEY_INDEX_TTL", "3600"))
+    S3_KEY_INDEX_MAX_BYTES = int(os.environ.get("S3_KEY_INDEX_MAX_BYTES", "67108864"))
+    S3_KEY_INDEX_MAX_KEYS = int(os.environ.get("S3_KEY_INDEX_MAX_KEYS", "50000"))
+    S3_HEAD_CONCURRENCY = int(os.environ.get("S3_HEAD_CONCURRENCY", "8"))
+    BULK_EXISTS_LIMIT = int(os.environ.get("BULK_EXISTS_LIMIT", "500"))
     README_API_KEY =  os.environ.get("README_API_KEY")
     HUBSPOT_API_TOKEN = os.environ.get("HUBSPOT_API_TOKEN")
     HUBSPOT_CLIENT_SECRET = os.environ.get("HUBSPOT_CLIENT_SECRET")
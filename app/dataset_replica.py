@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.scicrunch_requests import create_doi_aggregate, create_multiple_doi_query
+
+
+def normalise_doi(doi):
+    doi = str(doi).strip().lower()
+    if doi.startswith('doi:'):
+        doi = doi[len('doi:'):]
+
+    return doi
+
+
+class DatasetReplica(object):
+    """
+    Local copy of the published datasets of the SciCrunch index, stored in a SQLite file
+    shared by every gunicorn worker on the host.
+
+    The replica is filled by sync(), which pages through all the DOIs with the composite
+    aggregation used by /current_doi_list and then fetches their (projected) hits in batches.
+    Lookups answer with a SciCrunch shaped result so the usual processing applies, or None
+    when the replica cannot answer for sure (never synced, too old or a dataset is missing)
+    so the caller can ask the remote index instead.
+    """
+
+    def __init__(self, path, max_age, batch_size=100):
+        self.path = path
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._stats = {'hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+
+    def _connection(self):
+        # Connections are per thread and must not survive a fork into a new worker.
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS replica_datasets ('
+                           'discover_id TEXT NOT NULL, doi TEXT NOT NULL, hit TEXT NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS replica_datasets_discover_id ON replica_datasets (discover_id)')
+        connection.execute('CREATE INDEX IF NOT EXISTS replica_datasets_doi ON replica_datasets (doi)')
+        connection.execute('CREATE TABLE IF NOT EXISTS replica_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _meta(self, connection):
+        return {name: json.loads(value) for name, value in connection.execute('SELECT name, value FROM replica_meta')}
+
+    def _set_meta(self, connection, values):
+        connection.executemany('INSERT OR REPLACE INTO replica_meta (name, value) VALUES (?, ?)',
+                               [(name, json.dumps(value)) for name, value in values.items()])
+
+    def sync_if_stale(self, search, min_age):
+        """
+        Sync unless another worker synced or started syncing less than min_age seconds ago.
+        """
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                meta = self._meta(connection)
+                if now - max(meta.get('synced_at', 0), meta.get('sync_started_at', 0)) < min_age:
+                    connection.execute('COMMIT')
+                    return False
+                self._set_meta(connection, {'sync_started_at': now})
+                connection.execute('COMMIT')
+            except sqlite3.Error:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as err:
+            logging.warning(f'Dataset replica sync could not start: {err}')
+            return False
+
+        self.sync(search)
+        return True
+
+    def sync(self, search):
+        query = create_doi_aggregate()
+        composite = query['aggregations']['doi']['composite']
+        dois = []
+        while True:
+            aggregation = search(query)['aggregations']['doi']
+            buckets = aggregation.get('buckets', [])
+            dois.extend(bucket['key']['curie'] for bucket in buckets)
+            after_key = aggregation.get('after_key')
+            if len(buckets) < composite['size'] or after_key is None:
+                break
+            composite['after'] = after_key
+
+        # Each batch is written to a staging table as it arrives, the replica is only replaced once all are in.
+        connection = self._connection()
+        connection.execute('DROP TABLE IF EXISTS replica_datasets_new')
+        connection.execute('CREATE TABLE replica_datasets_new (discover_id TEXT NOT NULL, doi TEXT NOT NULL, hit TEXT NOT NULL)')
+        count = 0
+        total_is_object = False
+        for start in range(0, len(dois), self.batch_size):
+            results = search(create_multiple_doi_query(dois[start:start + self.batch_size]))
+            total_is_object = isinstance(results['hits']['total'], dict)
+            rows = []
+            for hit in results['hits']['hits']:
+                source = hit.get('_source', {})
+                discover_id = source.get('pennsieve', {}).get('identifier')
+                doi = source.get('item', {}).get('curie')
+                if discover_id is not None and doi is not None:
+                    rows.append((str(discover_id), normalise_doi(doi), json.dumps(hit, separators=(',', ':'))))
+            connection.executemany('INSERT INTO replica_datasets_new (discover_id, doi, hit) VALUES (?, ?, ?)', rows)
+            count += len(rows)
+
+        # Never replace a good replica with an empty one because of an upstream hiccup.
+        if not count:
+            connection.execute('DROP TABLE replica_datasets_new')
+            logging.warning('Dataset replica sync found no datasets, keeping the current replica')
+            return 0
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DROP TABLE replica_datasets')
+            connection.execute('ALTER TABLE replica_datasets_new RENAME TO replica_datasets')
+            connection.execute('CREATE INDEX replica_datasets_discover_id ON replica_datasets (discover_id)')
+            connection.execute('CREATE INDEX replica_datasets_doi ON replica_datasets (doi)')
+            self._set_meta(connection, {'synced_at': time.time(), 'datasets': count, 'total_is_object': total_is_object})
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            connection.execute('ROLLBACK')
+            raise
+
+        logging.info(f'Dataset replica synced {count} datasets')
+        return count
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _lookup(self, column, values):
+        if not values:
+            return None
+
+        try:
+            connection = self._connection()
+            meta = self._meta(connection)
+            if time.time() - meta.get('synced_at', 0) > self.max_age:
+                self._count('misses')
+                return None
+
+            placeholders = ', '.join('?' * len(values))
+            rows = connection.execute(f'SELECT {column}, hit FROM replica_datasets WHERE {column} IN ({placeholders}) '
+                                      f'ORDER BY rowid', list(values)).fetchall()
+        except sqlite3.Error as err:
+            logging.warning(f'Dataset replica lookup failed: {err}')
+            self._count('misses')
+            return None
+
+        # Anything not in the replica may have been published since the last sync.
+        if {row[0] for row in rows} != set(values):
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        total = len(rows)
+        if meta.get('total_is_object'):
+            total = {'value': total, 'relation': 'eq'}
+
+        return {'took': 0, 'timed_out': False, 'hits': {'total': total, 'hits': [json.loads(row[1]) for row in rows]}}
+
+    def find_by_doi(self, doi):
+        return self._lookup('doi', [normalise_doi(doi)])
+
+    def find_by_discover_ids(self, discover_ids):
+        return self._lookup('discover_id', list(dict.fromkeys(str(discover_id) for discover_id in discover_ids)))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        try:
+            meta = self._meta(self._connection())
+            stats['datasets'] = meta.get('datasets', 0)
+            stats['synced_at'] = meta.get('synced_at')
+        except sqlite3.Error as err:
+            logging.warning(f'Dataset replica stats failed: {err}')
+
+        return stats
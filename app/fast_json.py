@@ -0,0 +1,32 @@
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Dates and dataclasses are left to JSONEncoder.default so they are written as Flask writes them.
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class FastJSONEncoder(JSONEncoder):
+    """
+    The JSON encoder of the app (app.json_encoder), used by jsonify and for the dicts returned by views.
+
+    Compact, non ASCII escaped output (what jsonify writes with JSON_AS_ASCII off) is produced by
+    orjson when it is installed. Anything else, pretty printed output in debug mode, or values
+    orjson cannot write (integers over 64 bits, named tuples, ...) go through the standard
+    library encoder, which is also used when orjson is not installed.
+    """
+
+    def encode(self, o):
+        if orjson is None or self.indent is not None or self.ensure_ascii \
+                or self.item_separator != ',' or self.key_separator != ':':
+            return super().encode(o)
+
+        options = ORJSON_OPTIONS | orjson.OPT_SORT_KEYS if self.sort_keys else ORJSON_OPTIONS
+        try:
+            return orjson.dumps(o, default=self.default, option=options).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return super().encode(o)
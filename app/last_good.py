@@ -0,0 +1,175 @@
+import functools
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import Response, current_app, copy_current_request_context, request
+from werkzeug.exceptions import HTTPException
+
+from app.shared_cache import make_cache_key
+
+STALE_WARNING = '110 - "Response is Stale"'
+
+
+def _is_good(response):
+    # A streamed body can only be read once, by the client. Upstream failures are answered with a 5xx.
+    return response.status_code == 200 and not response.is_streamed and response.is_json
+
+
+class LastGoodResponses(object):
+    """
+    Keep the last good response of a route and serve it when its upstream is struggling.
+
+    The view runs in a worker thread and the request waits at most the latency budget for
+    it. When the view fails with a server error or the budget runs out, the last good
+    response is served instead, marked with a Warning header, while the view carries on in
+    the background and refreshes the stored copy. Without a stored copy the request waits
+    for the view as before.
+
+    Responses are kept per path, arguments and negotiated mimetype. Only one view runs per
+    key at a time, requests arriving while it runs wait for it within their own budget and
+    are then answered from the copy it stored. The stored copy is served straight away
+    while is_open() reports the circuit of the upstream open, and once max_pending views
+    are queued or running; without a stored copy the view then runs in the request thread.
+
+    A good response is only written to the cache when it differs from the stored copy, or
+    when that copy was written more than refresh_interval seconds ago.
+    """
+
+    def __init__(self, cache, budget, max_workers, max_pending=None, is_open=None, refresh_interval=300):
+        self.cache = cache
+        self.budget = budget
+        self.refresh_interval = refresh_interval
+        self.max_pending = max_workers * 4 if max_pending is None else max_pending
+        self.is_open = is_open
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='revalidate')
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {'fresh': 0, 'stale': 0, 'over_budget': 0, 'failed': 0, 'coalesced': 0, 'circuit_open': 0,
+                       'rejected': 0, 'stored': 0, 'unchanged': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _store(self, key, response):
+        if not _is_good(response):
+            return
+
+        try:
+            body = response.get_data()
+            digest = hashlib.sha256(body).hexdigest()
+            # The digest of the stored copy is kept apart from it, so checking it does not read the body. It expires
+            # after refresh_interval, the copy is then written again even when it has not changed.
+            digest_key = make_cache_key([key, 'digest'])
+            if self.cache.get_json(digest_key) == digest:
+                self._count('unchanged')
+                return
+
+            self.cache.set_json(key, {'mimetype': response.mimetype, 'body': body.decode('utf-8')})
+            self.cache.set_json(digest_key, digest, self.refresh_interval)
+            self._count('stored')
+        except Exception as ex:
+            logging.warning(f'Could not keep the last good response: {ex}')
+
+    def _done(self, key, future):
+        with self._lock:
+            del self._in_flight[key]
+
+    def _stale(self, key, warning=True):
+        stored = self.cache.get_json(key)
+        if stored is None:
+            return None
+
+        if not warning:
+            return Response(stored['body'], mimetype=stored['mimetype'])
+        self._count('stale')
+        return Response(stored['body'], mimetype=stored['mimetype'], headers={'Warning': STALE_WARNING})
+
+    def _wait(self, key, future):
+        # Another request is already running the view for this key, its response cannot be shared.
+        self._count('coalesced')
+        try:
+            good = _is_good(future.result(timeout=self.budget))
+        except Exception:
+            good = False
+
+        return self._stale(key, warning=not good)
+
+    def serve(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = make_cache_key([request.path, sorted(request.args.items(multi=True)), request.accept_mimetypes.best])
+
+            @copy_current_request_context
+            def render():
+                response = current_app.make_response(view(*args, **kwargs))
+                # Stored before the waiters are woken up, they are answered from the stored copy.
+                self._store(key, response)
+                return response
+
+            if self.is_open is not None and self.is_open():
+                stale = self._stale(key)
+                if stale is not None:
+                    self._count('circuit_open')
+                    return stale
+
+            with self._lock:
+                future = self._in_flight.get(key)
+                leader = future is None and len(self._in_flight) < self.max_pending
+                if leader:
+                    future = self._executor.submit(render)
+                    self._in_flight[key] = future
+            if leader:
+                future.add_done_callback(functools.partial(self._done, key))
+            elif future is not None:
+                response = self._wait(key, future)
+                if response is not None:
+                    return response
+                return render()
+            else:
+                self._count('rejected')
+                stale = self._stale(key)
+                if stale is not None:
+                    return stale
+                return render()
+
+            try:
+                response = future.result(timeout=self.budget)
+            except TimeoutError:
+                self._count('over_budget')
+                stale = self._stale(key)
+                if stale is not None:
+                    return stale
+                return future.result()
+            except Exception as err:
+                # Client errors are the answer to the request, not an upstream failure.
+                if isinstance(err, HTTPException) and err.code is not None and err.code < 500:
+                    raise
+                self._count('failed')
+                stale = self._stale(key)
+                if stale is not None:
+                    return stale
+                raise
+
+            if response.status_code >= 500:
+                self._count('failed')
+                stale = self._stale(key)
+                if stale is None:
+                    return response
+                response.close()
+                return stale
+
+            self._count('fresh')
+            return response
+
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._in_flight)
+        stats['cache'] = self.cache.stats()
+
+        return stats
@@ -10,10 +10,12 @@ from scripts.update_protocol_metrics import update_protocol_metrics, get_protoco
 from app.osparc.services import OSparcServices
 
 import botocore
+import copy
 import markdown
 import boto3
 import hashlib
 import hmac
+import ijson
 import base64
 import time
 import hubspot
@@ -31,7 +33,7 @@ from apscheduler.triggers.interval import IntervalTrigger
 from botocore.exceptions import ClientError
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, abort, jsonify, request
+from flask import Flask, Response, abort, jsonify, request
 from flask_cors import CORS
 from flask_marshmallow import Marshmallow
 from pennsieve import Pennsieve
@@ -45,7 +47,7 @@ from app.scicrunch_requests import create_doi_query, create_filter_request, crea
     create_identifier_query, create_pennsieve_identifier_query, create_field_query, create_request_body_for_curies, \
     create_onto_term_query, \
     create_multiple_doi_query, create_multiple_discoverId_query, create_anatomy_query, get_body_scaffold_dataset_id, \
-    create_multiple_mimetype_query, create_citations_query, create_dataset_flatmap_query
+    create_multiple_mimetype_query, create_citations_query, create_dataset_flatmap_query, get_facet_type_map
 from scripts.email_sender import EmailSender, feedback_email, issue_reporting_email, creation_request_confirmation_email, anbc_form_creation_request_confirmation_email, service_form_submission_request_confirmation_email
 from threading import Lock
 from xml.etree import ElementTree
@@ -54,9 +56,21 @@ from app.config import Config
 from app.dbtable import AnnotationTable, MapTable, ScaffoldTable, FeaturedDatasetIdSelectorTable, ProtocolMetricsTable
 from app.scicrunch_process_results import process_results, process_get_first_scaffold_info, reform_aggregation_results, \
     reform_curies_results, reform_dataset_results, reform_related_terms, reform_anatomy_results, \
-    reform_flatmap_query_result
+    reform_flatmap_query_result, reform_facet_results, process_results_stream, processed_result_cache, \
+    process_results_ndjson, process_results_stream_ndjson
+from app.provenance import ProvenanceResolver
+from app.dataset_replica import DatasetReplica
+from app.scicrunch_client import SciCrunchClient
 from app.serializer import ContactRequestSchema
+from app.fast_json import FastJSONEncoder
+from app.shared_cache import SharedCache, make_cache_key
+from app.single_flight import SingleFlight
+from app.last_good import LastGoodResponses
 from app.utilities import img_to_base64_str, get_path_from_mangled_list, get_extension
+from app.s3_disk_cache import S3DiskCache
+from app.s3_key_index import S3KeyIndex
+from app.s3_metadata import S3MetadataCache, is_stale_head_error
+from app.s3_resource import s3_object_response
 from app.osparc.osparc import start_simulation as do_start_simulation
 from app.osparc.osparc import check_simulation as do_check_simulation
 from app.biolucida_process_results import process_results as process_biolucida_results, process_result as process_biolucida_result
@@ -66,6 +80,9 @@ import uuid
 logging.basicConfig()
 
 app = Flask(__name__)
+app.json_encoder = FastJSONEncoder
+# Non ASCII characters are written as UTF-8 rather than escaped, which is what the fast encoder writes.
+app.config['JSON_AS_ASCII'] = False
 
 log_level = Config.LOG_LEVEL.upper()
 app.logger.setLevel(getattr(logging, log_level, logging.WARNING))
@@ -91,6 +108,32 @@ s3 = boto3.client(
 
 biolucida_lock = Lock()
 
+scicrunch = SciCrunchClient()
+# Coalesces identical Discover and Biolucida requests, SciCrunch requests are coalesced by the client.
+single_flight = SingleFlight(Config.SINGLE_FLIGHT_TIMEOUT)
+dataset_search_cache = SharedCache(Config.SHARED_CACHE_PATH, 'dataset_search',
+                                   Config.DATASET_SEARCH_CACHE_TTL, Config.DATASET_SEARCH_CACHE_MAX_BYTES)
+# Associated flatmaps of a (subject, dataset) pair only change when a dataset is republished.
+flatmap_cache = SharedCache(Config.SHARED_CACHE_PATH, 'flatmap', Config.FLATMAP_CACHE_TTL, Config.FLATMAP_CACHE_MAX_BYTES)
+# Sizes, ETags and existence of S3 objects, the head_object requests of /s3-resource, /exists and /segmentation_info.
+s3_metadata = S3MetadataCache(SharedCache(Config.SHARED_CACHE_PATH, 's3_metadata', Config.S3_METADATA_CACHE_TTL,
+                                          Config.S3_METADATA_CACHE_MAX_BYTES), Config.S3_METADATA_CACHE_NEGATIVE_TTL)
+# Copies of the objects served by /s3-resource, the scaffold files of popular datasets are requested over and over.
+s3_disk_cache = S3DiskCache(Config.S3_DISK_CACHE_PATH, Config.S3_DISK_CACHE_MAX_BYTES, Config.S3_DISK_CACHE_MAX_OBJECT_BYTES)
+# Keys of the objects of each dataset, for checking many paths at once.
+s3_key_index = S3KeyIndex(SharedCache(Config.SHARED_CACHE_PATH, 's3_key_index', Config.S3_KEY_INDEX_TTL,
+                                      Config.S3_KEY_INDEX_MAX_BYTES), Config.S3_KEY_INDEX_MAX_KEYS)
+# Bounds the head_object requests made at once for the paths the key index cannot answer.
+s3_head_executor = ThreadPoolExecutor(max_workers=Config.S3_HEAD_CONCURRENCY, thread_name_prefix='s3-head')
+# SciCrunch backed routes fall back to their last good response when SciCrunch is slow or failing.
+# Published datasets are looked up in a local replica of the SciCrunch index first.
+dataset_replica = DatasetReplica(Config.DATASET_REPLICA_PATH, Config.DATASET_REPLICA_MAX_AGE)
+last_good = LastGoodResponses(SharedCache(Config.SHARED_CACHE_PATH, 'last_good', Config.LAST_GOOD_RESPONSE_TTL,
+                                          Config.LAST_GOOD_RESPONSE_MAX_BYTES),
+                              Config.SCI_CRUNCH_LATENCY_BUDGET, Config.REVALIDATE_WORKERS, Config.REVALIDATE_MAX_PENDING,
+                              is_open=lambda: scicrunch.circuit_open(Config.SCI_CRUNCH_HOST),
+                              refresh_interval=Config.LAST_GOOD_REFRESH_INTERVAL)
+
 db_url = Config.DATABASE_URL
 if db_url and db_url.startswith("postgres://"):
     db_url = db_url.replace("postgres://", "postgresql://", 1)
@@ -153,6 +196,12 @@ def resource_not_found(e):
     return jsonify(error=str(e)), 404
 
 
+# Upstream requests a view does not handle itself (connection failures, open circuits, exhausted retries).
+@app.errorhandler(requests.exceptions.RequestException)
+def upstream_unreachable(e):
+    return jsonify({'error': str(e), 'message': 'An upstream service is not currently reachable, please try again later'}), 502
+
+
 @app.before_first_request
 def connect_to_pennsieve():
     global ps
@@ -189,6 +238,8 @@ services_scheduler = BackgroundScheduler()
 featured_dataset_id_scheduler = BackgroundScheduler()
 update_contentful_event_entries_scheduler = BackgroundScheduler()
 protocol_metrics_scheduler = BackgroundScheduler()
+facets_scheduler = BackgroundScheduler()
+dataset_replica_scheduler = BackgroundScheduler()
 
 # If nothing is stored in the DB than update it now
 protocol_metrics = get_protocol_metrics_table_state(protocolMetricsTable)
@@ -203,6 +254,14 @@ if not featured_dataset_id_scheduler.running:
     logging.info('Starting scheduler for featured dataset id acquisition')
     featured_dataset_id_scheduler.start()
 
+if not facets_scheduler.running:
+    logging.info('Starting scheduler for facet snapshots')
+    facets_scheduler.start()
+
+if not dataset_replica_scheduler.running:
+    logging.info('Starting scheduler for the dataset replica')
+    dataset_replica_scheduler.start()
+
 # Run monthly annotation states clean up
 if annotationtable:
     annotation_cleanup_scheduler = BackgroundScheduler()
@@ -318,6 +377,12 @@ def shutdown_schedulers():
     logging.info('Stopping scheduler for oSPARC services')
     if services_scheduler.running:
         services_scheduler.shutdown()
+    logging.info('Stopping scheduler for facet snapshots')
+    if facets_scheduler.running:
+        facets_scheduler.shutdown()
+    logging.info('Stopping scheduler for the dataset replica')
+    if dataset_replica_scheduler.running:
+        dataset_replica_scheduler.shutdown()
 
 
 atexit.register(shutdown_schedulers)
@@ -328,6 +393,24 @@ def health():
     return json.dumps({"status": "healthy"})
 
 
+# Latency and error counters for the upstream SciCrunch calls made by this worker.
+@app.route("/diagnostics/scicrunch")
+def scicrunch_diagnostics():
+    return jsonify({
+        'endpoints': scicrunch.stats(),
+        'circuit_breakers': scicrunch.breaker_stats(),
+        'last_good_responses': last_good.stats(),
+        'dataset_search_cache': dataset_search_cache.stats(),
+        'dataset_replica': dataset_replica.stats(),
+        'processed_results': processed_result_cache.stats(),
+        's3_metadata': s3_metadata.stats(),
+        's3_disk_cache': s3_disk_cache.stats(),
+        's3_key_index': s3_key_index.stats(),
+        'facet_snapshots': facet_snapshots.stats(),
+        'single_flight': {'scicrunch': scicrunch.single_flight.stats(), 'other': single_flight.stats()}
+    })
+
+
 @app.route("/contact", methods=["POST"])
 def contact():
     data = json.loads(request.data)
@@ -470,31 +553,38 @@ def find_associated_flatmap_for_subject():
     }
 
     try:
-        qdb_response = requests.get(f'{Config.SCI_CRUNCH_QDB_HOST}/inst', params=params, timeout=30)
+        qdb_response = scicrunch.get(f'{Config.SCI_CRUNCH_QDB_HOST}/inst', endpoint='flatmap_find_qdb', params=params, timeout=30)
         qdb_response.raise_for_status()
         if qdb_response.status_code == 200:
             data = qdb_response.json()
-            sci_crunch_params = {
-                "api_key": Config.KNOWLEDGEBASE_KEY
-            }
-            filtered_results = [item for item in data['result'] if item['dataset'] != target_dataset]
+            dataset_ids = [f"N:dataset:{item['dataset']}" for item in data['result'] if item['dataset'] != target_dataset]
             results = []
-            for result in filtered_results:
-                dataset_id = f"N:dataset:{result['dataset']}"
-                sci_crunch_query = create_dataset_flatmap_query(dataset_id)
-                try:
-                    knowledge_base_response = requests.post(f'{Config.SCI_CRUNCH_HOST}/_search', params=sci_crunch_params, json=sci_crunch_query)
-                    knowledge_base_response.raise_for_status()
-                    flatmap_data = knowledge_base_response.json()
-                    associated_flatmap_info = reform_flatmap_query_result(flatmap_data, target_subject, dataset_id)
-                    if associated_flatmap_info:
-                        results.append(associated_flatmap_info)
-                except requests.exceptions.ConnectionError:
-                    return abort(400, description="Unable to make a connection to SCI_CRUNCH_HOST.")
-                except requests.exceptions.Timeout:
-                    return abort(504, description='Request to SCI_CRUNCH_HOST timed out.')
-                except requests.exceptions.RequestException as e:
-                    return abort(502, description=f"Error while making a request to SCI_CRUNCH_HOST: {str(e)}")
+            pending = []
+            for dataset_id in dataset_ids:
+                cached = flatmap_cache.get_json(make_cache_key([target_subject, dataset_id]))
+                if cached is None:
+                    pending.append(dataset_id)
+                elif cached['result']:
+                    results.append((dataset_id, cached['result']))
+
+            # All the related datasets are searched with one batched request instead of one request each.
+            responses = dataset_msearch([create_dataset_flatmap_query(dataset_id) for dataset_id in pending]) if pending else []
+            failed = False
+            for dataset_id, flatmap_data in zip(pending, responses):
+                if not isinstance(flatmap_data, dict) or 'hits' not in flatmap_data:
+                    failed = True
+                    continue
+                associated_flatmap_info = reform_flatmap_query_result(flatmap_data, target_subject, dataset_id)
+                flatmap_cache.set_json(make_cache_key([target_subject, dataset_id]), {'result': associated_flatmap_info})
+                if associated_flatmap_info:
+                    results.append((dataset_id, associated_flatmap_info))
+
+            if failed and len(results) == 0:
+                return abort(502, description="Error while making a request to SCI_CRUNCH_HOST.")
+
+            # Keep the order in which QDB returned the datasets.
+            order = {dataset_id: index for index, dataset_id in enumerate(dataset_ids)}
+            results = [info for _, info in sorted(results, key=lambda result: order[result[0]])]
 
             if len(results) == 0:
                 return abort(404, description=f"No results for subject '{target_subject}' in dataset '{target_dataset}'.")
@@ -511,28 +601,73 @@ def find_associated_flatmap_for_subject():
         return abort(502, description=f"Error while making a request to SCI_CRUNCH_QDB_HOST: {str(e)}")
 
 
-@app.route("/exists/<path:path>")
-def url_exists(path, bucket_name=Config.DEFAULT_S3_BUCKET_NAME):
-    query_args = request.args
-    s3BucketName = query_args.get("s3BucketName", bucket_name)
-
+def s3_object_exists(bucket_name, path):
     try:
-        head_response = s3.head_object(
-            Bucket=s3BucketName,
-            Key=path,
-            RequestPayer="requester"
-        )
+        head_response = s3_metadata.head_object(s3, bucket_name, path)
     except ClientError:
-        return {'exists': 'false'}
+        return False
 
     content_length = head_response.get('ContentLength', 0)
 
-    if content_length > 0:
+    return content_length > 0
+
+
+@app.route("/exists/<path:path>")
+def url_exists(path, bucket_name=Config.DEFAULT_S3_BUCKET_NAME):
+    query_args = request.args
+    s3BucketName = query_args.get("s3BucketName", bucket_name)
+
+    if s3_object_exists(s3BucketName, path):
         return {'exists': 'true'}
 
     return {'exists': 'false'}
 
 
+# The published version of a dataset, None when the dataset replica does not know it.
+def published_dataset_version(discover_id):
+    results = dataset_replica.find_by_discover_ids([discover_id])
+    try:
+        return results['hits']['hits'][0]['_source']['pennsieve']['version']['identifier']
+    except (TypeError, KeyError, IndexError):
+        return None
+
+
+# Check whether many files exist with one call.
+# Expects a JSON body such as {"paths": ["217/files/derivative/scaffold_meta.json", ...], "s3BucketName": "..."}
+# and returns {"result": [{"path": ..., "exists": "true"}, ...]} in the order the paths were given.
+# The paths are looked up in the key index of their dataset, the others are checked with concurrent HEADs.
+@app.route("/exists", methods=["POST"])
+def bulk_url_exists(bucket_name=Config.DEFAULT_S3_BUCKET_NAME):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return abort(400, description="Expected a JSON body with a list of 'paths'.")
+    paths = data.get('paths', [])
+    s3BucketName = data.get('s3BucketName', request.args.get('s3BucketName', bucket_name))
+    if not isinstance(paths, list) or not paths or not all(isinstance(path, str) for path in paths):
+        return abort(400, description="Expected a JSON body with a list of 'paths'.")
+    if len(paths) > Config.BULK_EXISTS_LIMIT:
+        return abort(400, description=f"At most {Config.BULK_EXISTS_LIMIT} paths can be checked at once.")
+
+    exists = {}
+    unindexed = []
+    datasets = {}
+    for path in dict.fromkeys(paths):
+        prefix = s3_key_index.dataset_prefix(path)
+        datasets.setdefault(prefix, []).append(path)
+    for prefix, dataset_paths in datasets.items():
+        keys = None
+        if prefix is not None:
+            keys = s3_key_index.keys(s3, s3BucketName, prefix, published_dataset_version(prefix[:-1]))
+        if keys is None:
+            unindexed.extend(dataset_paths)
+        else:
+            exists.update((path, path in keys) for path in dataset_paths)
+
+    exists.update(zip(unindexed, s3_head_executor.map(lambda path: s3_object_exists(s3BucketName, path), unindexed)))
+
+    return jsonify({'result': [{'path': path, 'exists': 'true' if exists[path] else 'false'} for path in paths]})
+
+
 def fetch_discover_file_information(uri):
     # Fudge the URI from Sci-crunch
     uri = uri.replace('https://api.pennsieve.io/', 'https://api.pennsieve.io/discover/')
@@ -556,15 +691,13 @@ def get_discover_path():
     return abort(404, description=f'Failed to retrieve uri {uri}')
 
 
-def s3_header_check(path, bucket_name):
+# Returns (200, head_object response) when the object can be downloaded, (status, message) when it was not found
+# or cannot be accessed, and aborts with 413 when it is too big (unless check_size is False).
+def s3_header_check(path, bucket_name, check_size=True):
     try:
-        head_response = s3.head_object(
-            Bucket=bucket_name,
-            Key=path,
-            RequestPayer="requester"
-        )
+        head_response = s3_metadata.head_object(s3, bucket_name, path)
         content_length = head_response.get('ContentLength', Config.DIRECT_DOWNLOAD_LIMIT)
-        if content_length and not content_length < Config.DIRECT_DOWNLOAD_LIMIT:  # 20 MB
+        if check_size and content_length and not content_length < Config.DIRECT_DOWNLOAD_LIMIT:  # 20 MB
             return abort(413, description=f"File too big to download: {content_length}")
     except botocore.exceptions.ClientError as err:
         # NOTE: This case is required because of https://github.com/boto/boto3/issues/2442
@@ -575,21 +708,16 @@ def s3_header_check(path, bucket_name):
         else:
             return abort(err.response["Error"]["Code"], err.response["Error"]["Message"])
     else:
-        return (200, 'OK')
+        return (200, head_response)
 
 
-# Reverse proxy for objects from S3, a simple get object
-# operation. This is used by scaffoldvuer and its
-# important to keep the relative <path> for accessing
-# other required files.
-@app.route("/s3-resource/<path:path>")
-def direct_download_url(path, bucket_name=Config.DEFAULT_S3_BUCKET_NAME):
-    query_args = request.args
-    s3BucketName = query_args.get("s3BucketName", bucket_name)
-    s3_path = path  # Will modify s3_path if we find name mangling
+# Find the S3 object of a path, which may have been mangled, returns its key and head_object response.
+def resolve_s3_resource(path, s3BucketName, check_size=True):
+    # A mangled path that was resolved before is looked up directly.
+    s3_path = s3_metadata.resolved_key(s3BucketName, path) or path  # Will modify s3_path if we find name mangling
 
     # Check the header to see if too large or does not exist
-    response = s3_header_check(path, s3BucketName)
+    response = s3_header_check(s3_path, s3BucketName, check_size)
 
     # If the file does not exist, check if the name was mangled
     if response[0] == 404 or response[0] == 403:
@@ -598,41 +726,61 @@ def direct_download_url(path, bucket_name=Config.DEFAULT_S3_BUCKET_NAME):
             abort(404, description=f'Provided path was not found on the s3 resource')  # Abort if path did not change
 
         # Check the modified path
-        response2 = s3_header_check(s3_path_modified, s3BucketName)
-        if response2[0] == 200:
+        response = s3_header_check(s3_path_modified, s3BucketName, check_size)
+        if response[0] == 200:
             s3_path = s3_path_modified  # Modify the path if de-mangling was successful
-        elif response2[0] == 404:
+            s3_metadata.set_resolved_key(s3BucketName, path, s3_path)
+        elif response[0] == 404:
             abort(404, description=f'Provided path was not found on the s3 resource')
-        elif response2[0] == 403:
+        elif response[0] == 403:
             abort(403, description=f'There is a permission issue when accessing the file at specified path')
 
-    response = s3.get_object(
-        Bucket=s3BucketName,
-        Key=s3_path,
-        RequestPayer="requester"
-    )
+    return s3_path, response[1]
 
-    encode_base64 = request.args.get("encodeBase64")
-    resource = response["Body"].read()
-    if encode_base64 is not None:
-        return base64.b64encode(resource)
 
-    return resource
+# Head an object again once its cached head turned out to be out of date.
+def refresh_s3_head(path, bucket_name):
+    s3_metadata.evict(bucket_name, path)
+    status, head_response = s3_header_check(path, bucket_name, check_size=False)
+    if status != 200:
+        abort(status, description=head_response)
+
+    return head_response
+
+
+# Reverse proxy for objects from S3, a simple get object
+# operation. This is used by scaffoldvuer and its
+# important to keep the relative <path> for accessing
+# other required files.
+# The object is streamed to the client with its ETag and Last-Modified, conditional
+# requests for an object the client already has are answered with a 304.
+# Objects of DIRECT_DOWNLOAD_LIMIT bytes or more can only be read with Range requests.
+@app.route("/s3-resource/<path:path>")
+def direct_download_url(path, bucket_name=Config.DEFAULT_S3_BUCKET_NAME):
+    query_args = request.args
+    s3BucketName = query_args.get("s3BucketName", bucket_name)
+    # The size is checked against what is requested, the whole object or some ranges of it.
+    s3_path, head_response = resolve_s3_resource(path, s3BucketName, check_size=False)
+
+    encode_base64 = request.args.get("encodeBase64") is not None
+    return s3_object_response(s3, s3BucketName, s3_path, head_response, encode_base64, Config.S3_STREAM_CHUNK_SIZE,
+                              Config.DIRECT_DOWNLOAD_LIMIT, Config.S3_RANGE_COALESCE_GAP, s3_disk_cache, Config.S3_MAX_RANGES,
+                              refresh_head=lambda: refresh_s3_head(s3_path, s3BucketName))
 
 
 @app.route("/scicrunch-dataset/<doi1>/<doi2>")
 def sci_doi(doi1, doi2):
     doi = doi1.replace('DOI:', '') + '/' + doi2
-    data = create_doi_query(doi)
+    # The full dataset is passed through, it cannot be projected.
+    data = create_doi_query(doi, projected=False)
 
     try:
-        response = requests.post(
-            f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
-            json=data)
-        return response.json()
-    except requests.exceptions.HTTPError as err:
+        return scicrunch.passthrough(
+            'POST', f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
+            endpoint='sci_doi', json=data, accept_encoding=request.headers.get('Accept-Encoding'))
+    except requests.exceptions.RequestException as err:
         logging.error(err)
-        return json.dumps({'error': err})
+        return json.dumps({'error': str(err)})
 
 
 # /pubmed/<id> Used as a proxy for making requests to pubmed
@@ -658,34 +806,38 @@ def sci_organ():
     data = create_field_query(fields, curie, size, from_)
 
     try:
-        response = requests.post(
+        response = scicrunch.post(
             f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
-            json=data)
+            endpoint='sci_organ', json=data)
         return process_results(response.json())
-    except requests.exceptions.HTTPError as err:
+    except requests.exceptions.RequestException as err:
         logging.error(err)
-        return json.dumps({'error': err})
+        return json.dumps({'error': str(err)})
 
 
 @app.route("/dataset_info/using_doi")
+@last_good.serve
 def get_dataset_info_doi():
     doi = request.args.get('doi')
     raw = request.args.get('raw_response')
-    query = create_doi_query(doi)
+    fields = requested_fields()
+    query = create_doi_query(doi, projected=raw is None, fields=fields)
 
     if raw is None:
-        return reform_dataset_results(dataset_search(query))
+        return reform_dataset_results(dataset_replica.find_by_doi(doi) or dataset_search(query), fields)
 
-    return dataset_search(query)
+    return dataset_search_passthrough(query)
 
 
 @app.route("/dataset_info/using_multiple_dois")
 @app.route("/dataset_info/using_multiple_dois/")
+@last_good.serve
 def get_dataset_info_dois():
     dois = request.args.getlist('dois')
-    query = create_multiple_doi_query(dois)
+    fields = requested_fields()
+    query = create_multiple_doi_query(dois, fields=fields)
 
-    return process_results(dataset_search(query))
+    return dataset_search_stream(query, fields)
 
 
 @app.route("/multiple_dataset_info/using_multiple_mimetype")
@@ -693,37 +845,51 @@ def get_dataset_info_dois():
 def get_file_info_from_mimetype():
     # q here is a scicrunch query ie: "*jp2*+OR+*vnd.ome.xml*+OR+*jpx*"
     q = request.args.getlist('q')
-    query = create_multiple_mimetype_query(q)
+    fields = requested_fields()
+    query = create_multiple_mimetype_query(q, fields=fields)
 
-    return process_results(dataset_search(query))
+    return dataset_search_stream(query, fields)
 
 
 @app.route("/dataset_info/using_multiple_discoverIds")
 @app.route("/dataset_info/using_multiple_discoverIds/")
+@last_good.serve
 def get_dataset_info_discoverIds():
     discoverIds = request.args.getlist('discoverIds')
-    query = create_multiple_discoverId_query(discoverIds)
+    fields = requested_fields()
+    local_results = dataset_replica.find_by_discover_ids(discoverIds)
+    if local_results is not None:
+        if ndjson_requested():
+            return Response(process_results_ndjson(local_results, fields), mimetype=NDJSON_MIMETYPE)
+        return process_results(local_results, fields)
+
+    query = create_multiple_discoverId_query(discoverIds, fields=fields)
 
-    return process_results(dataset_search(query))
+    return dataset_search_stream(query, fields)
 
 
 @app.route("/dataset_info/using_title")
+@last_good.serve
 def get_dataset_info_title():
     title = request.args.get('title')
-    query = create_title_query(title)
+    fields = requested_fields()
+    query = create_title_query(title, fields=fields)
 
-    return reform_dataset_results(dataset_search(query))
+    return reform_dataset_results(dataset_search(query), fields)
 
 
 @app.route("/dataset_info/using_object_identifier")
+@last_good.serve
 def get_dataset_info_object_identifier():
     identifier = request.args.get('identifier')
-    query = create_identifier_query(identifier)
+    fields = requested_fields()
+    query = create_identifier_query(identifier, fields=fields)
 
-    return reform_dataset_results(dataset_search(query))
+    return reform_dataset_results(dataset_search(query), fields)
 
 
 @app.route("/dataset_info/anatomy")
+@last_good.serve
 def get_dataset_info_anatomy():
     identifier = request.args.get('identifier', -1)
     if identifier == -1:
@@ -735,89 +901,13 @@ def get_dataset_info_anatomy():
 
 
 @app.route("/dataset_info/using_pennsieve_identifier")
+@last_good.serve
 def get_dataset_info_pennsieve_identifier():
     identifier = request.args.get('identifier')
-    query = create_pennsieve_identifier_query(identifier)
-
-    return reform_dataset_results(dataset_search(query))
-
-
-def get_is_derived_from_with_identifier_or_path(discoverId, version, objects, identifier, matchingPath, datasetCache):
-    source_list = []
-    for item in objects:
-        if ((identifier and item.get("identifier") == identifier) or \
-            (matchingPath and item.get('dataset', {}).get('path', '') == matchingPath)):
-            datacite = item.get("datacite", {})
-            isDerivedFromPaths = datacite.get("isDerivedFrom", {}).get('path')
-            derivedfromdataset = item.get("derived_from_dataset", {})
-            derivedfromdatasetdoi = derivedfromdataset.get('uri')
-            derivedfromdatasetpath = derivedfromdataset.get('path')
-            flatmapUUID = item.get("associated_flatmap", {}).get('identifier')
-            if flatmapUUID:
-                source_list.append(
-                    {
-                        'discoverId': discoverId,
-                        'name': item['name'],
-                        'path': item['dataset']['path'],
-                        'version': version,
-                        'flatmapUUID': flatmapUUID
-                    }
-                )
-            if isDerivedFromPaths is not None:
-                for path in isDerivedFromPaths:
-                    path = path.replace('derivative/sub-f006/derivative/sub-f006', 'derivative/sub-f006')
-                    source_objects = get_is_derived_from_with_identifier_or_path(discoverId, version, objects, None, path, datasetCache)
-                    if len(source_objects) > 0:
-                        source_list.extend(source_objects)
-                    elif derivedfromdatasetdoi is None or derivedfromdatasetpath is None:
-                            data = {
-                                'discoverId': discoverId,
-                                'name': item['name'],
-                                'path': item['dataset']['path'],
-                                'version': version
-                            }
-                            source_list.append(data)
-            if derivedfromdatasetdoi is not None and derivedfromdatasetpath is not None:
-                for i in range(len(derivedfromdatasetdoi)):
-                    if 0 <= i < len(derivedfromdatasetpath):
-                        doi = derivedfromdatasetdoi[i].replace('https://doi.org/', '')
-                        source_list.extend(get_original_source(None, doi, None, derivedfromdatasetpath[i], datasetCache))
-
-    return source_list
-
-
-# Trace original source all the way till it is found
-# or reach an external dataset
-def get_original_source_in_dataset(dataset_info, identifier, matchingPath, datasetCache):
-    hits = dataset_info.get('hits', {}).get('hits', [])
-    #there should only be one result
-    if len(hits) == 1:
-        objects = hits[0].get('_source', {}).get('objects')
-        discoverId = hits[0].get('_source', {}).get('pennsieve', {}).get('identifier')
-        version = hits[0].get('_source', {}).get('pennsieve', {}).get('version', {}).get('identifier')
-        if objects is not None and discoverId is not None and version is not None:
-            return get_is_derived_from_with_identifier_or_path(discoverId, version, objects, identifier, matchingPath, datasetCache)
-    return []
-
-
-def get_original_source(identifier, doi, discoverId, path, datasetCache):
-    query = None
-    id = identifier
-    if identifier is not None:
-        query = create_identifier_query(identifier)
-    elif path is not None:
-        if doi is not None:
-            id = doi
-            newDOI = doi.replace('DOI:', '')
-            query = create_multiple_doi_query([newDOI])
-        elif discoverId is not None:
-             id = discoverId
-             query = create_multiple_discoverId_query([discoverId])
-    dataset_info = datasetCache.get(id, None)
-    if dataset_info is None:
-        dataset_info = dataset_search(query)
-        datasetCache[id] = dataset_info
-    return get_original_source_in_dataset(dataset_info, identifier, path, datasetCache)
+    fields = requested_fields()
+    query = create_pennsieve_identifier_query(identifier, fields=fields)
+
+    return reform_dataset_results(dataset_replica.find_by_discover_ids([identifier]) or dataset_search(query), fields)
 
 
 @app.route("/file_info/get_original_source")
@@ -826,9 +916,7 @@ def get_file_info_original_source():
     doi = request.args.get('doi')
     identifier = request.args.get('identifier')
     path = request.args.get('path')
-    #the following cache the datasetInfo
-    datasetCache = {}
-    return {'result': get_original_source(identifier, doi, discoverId, path, datasetCache)}
+    return {'result': provenance.resolve(identifier, doi, discoverId, path)}
 
 
 @app.route("/segmentation_info/")
@@ -888,20 +976,206 @@ def get_all_doi():
 
 
 def dataset_search(query):
+    cache_key = make_cache_key(query)
+    cached = dataset_search_cache.get_json(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         payload = query
 
         params = {
             "api_key": Config.KNOWLEDGEBASE_KEY
         }
-        response = requests.post(f'{Config.SCI_CRUNCH_HOST}/_search',
-                                 json=payload, params=params)
+        response = scicrunch.post(f'{Config.SCI_CRUNCH_HOST}/_search', endpoint='dataset_search',
+                                  json=payload, params=params)
 
-        return response.json()
-    except requests.exceptions.HTTPError as err:
+        results = response.json()
+        # Only cache genuine search results, never upstream errors.
+        if response.ok and 'hits' in results:
+            dataset_search_cache.set(cache_key, response.content)
+
+        return results
+    except requests.exceptions.RequestException as err:
+        # Raised to the view, the callers expect search results, see upstream_unreachable.
         logging.error(err)
+        raise
+
 
-        return jsonify({'error': err})
+# Hand back the raw SciCrunch response of a dataset search, as kept in the dataset search cache or
+# streamed from SciCrunch without being decoded.
+def dataset_search_passthrough(query):
+    cached = dataset_search_cache.get(make_cache_key(query))
+    if cached is not None:
+        return Response(cached, mimetype='application/json')
+
+    params = {
+        "api_key": Config.KNOWLEDGEBASE_KEY
+    }
+    try:
+        return scicrunch.passthrough('POST', f'{Config.SCI_CRUNCH_HOST}/_search', endpoint='dataset_search_passthrough',
+                                     json=query, params=params, accept_encoding=request.headers.get('Accept-Encoding'))
+    except requests.exceptions.RequestException as err:
+        logging.error(err)
+        return jsonify({'error': str(err)})
+
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+# Multi-dataset responses can be streamed as newline delimited JSON, with ?format=ndjson or by accepting only
+# application/x-ndjson. The first line holds the number of hits, then every dataset is written as soon as it is ready.
+def ndjson_requested():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+# fields: Selects the keys of the dataset results, ?fields=title,doi or ?fields=title&fields=doi.
+#  The hits are then requested from SciCrunch with only the parts needed for those keys, and the other keys
+#  are never computed. None when the parameter is not given, all the keys are then returned.
+def requested_fields():
+    values = request.args.getlist('fields')
+    if not values:
+        return None
+
+    return frozenset(field.strip() for value in values for field in value.split(',') if field.strip())
+
+
+def _ndjson_response_lines(response, fields):
+    with response:
+        try:
+            yield from process_results_stream_ndjson(response.raw, fields)
+        except Exception as ex:
+            # The status has been sent already, the failure can only be reported in the body.
+            logging.error(f'Streaming SciCrunch results failed: {ex}')
+            yield json.dumps({'error': type(ex).__name__, 'message': 'Could not read the SciCrunch output, the results are incomplete'}) + '\n'
+
+
+# Search for datasets and process the hits while the response is still being read, for queries with many hits.
+# The raw response is never held in memory as a whole, so it is not kept in the dataset search cache either.
+def dataset_search_stream(query, fields=None):
+    params = {
+        "api_key": Config.KNOWLEDGEBASE_KEY
+    }
+    try:
+        response = scicrunch.post(f'{Config.SCI_CRUNCH_HOST}/_search', endpoint='dataset_search_stream',
+                                  json=query, params=params, stream=True)
+        if ndjson_requested():
+            if not response.ok:
+                response.close()
+                response.raise_for_status()
+            response.raw.decode_content = True
+            streamed = Response(_ndjson_response_lines(response, fields), mimetype=NDJSON_MIMETYPE)
+            # The body may never be read if the client goes away first.
+            streamed.call_on_close(response.close)
+            return streamed
+
+        with response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return process_results_stream(response.raw, fields)
+    except requests.exceptions.RequestException as err:
+        logging.error(err)
+        return jsonify({'error': str(err), 'message': 'SciCrunch is not currently reachable, please try again later'}), 502
+    except ijson.JSONError:
+        return jsonify({'message': 'Could not parse SciCrunch output, please try again later',
+                        'error': 'JSONError'}), 502
+
+
+# Set to False once SciCrunch answers that it does not support _msearch, the searches are then sent one at a time.
+msearch_supported = True
+# Statuses that say the _msearch endpoint itself is not available, other errors only affect the request that got them.
+MSEARCH_UNSUPPORTED_STATUS_CODES = (400, 404, 405)
+
+
+# Run several dataset searches with a single Elasticsearch _msearch request.
+# The responses are returned in the same order as the queries, cached responses are not requested again.
+def dataset_msearch(queries):
+    global msearch_supported
+    responses = [None] * len(queries)
+    pending = {}
+    for index, query in enumerate(queries):
+        cache_key = make_cache_key(query)
+        cached = dataset_search_cache.get_json(cache_key)
+        if cached is not None:
+            responses[index] = cached
+        else:
+            pending.setdefault(cache_key, []).append(index)
+
+    if not pending:
+        return responses
+
+    cache_keys = list(pending.keys())
+    results = None
+    if msearch_supported and len(cache_keys) > 1:
+        body = ''.join(f'{{}}\n{json.dumps(queries[pending[cache_key][0]])}\n' for cache_key in cache_keys)
+        params = {
+            "api_key": Config.KNOWLEDGEBASE_KEY
+        }
+        try:
+            response = scicrunch.post(f'{Config.SCI_CRUNCH_HOST}/_msearch', endpoint='dataset_msearch', params=params,
+                                      data=body.encode('utf-8'), headers={'Content-Type': 'application/x-ndjson'})
+            if response.status_code in MSEARCH_UNSUPPORTED_STATUS_CODES:
+                logging.warning(f'SciCrunch does not accept _msearch requests ({response.status_code}), searching one query at a time')
+                msearch_supported = False
+            elif response.ok:
+                results = response.json().get('responses')
+            else:
+                logging.warning(f'SciCrunch _msearch request failed ({response.status_code}), searching one query at a time')
+        except (requests.exceptions.RequestException, ValueError) as err:
+            logging.error(f'SciCrunch _msearch request failed: {err}')
+
+    if results is None or len(results) != len(cache_keys):
+        results = [dataset_search(queries[pending[cache_key][0]]) for cache_key in cache_keys]
+    else:
+        for cache_key, result in zip(cache_keys, results):
+            if 'hits' in result:
+                dataset_search_cache.set_json(cache_key, result)
+
+    for cache_key, result in zip(cache_keys, results):
+        indexes = pending[cache_key]
+        responses[indexes[0]] = result
+        # Results are processed in place by the callers, duplicate queries get their own copy.
+        for index in indexes[1:]:
+            responses[index] = copy.deepcopy(result)
+
+    return responses
+
+
+provenance = ProvenanceResolver(dataset_msearch, SharedCache(Config.SHARED_CACHE_PATH, 'provenance',
+                                                            Config.PROVENANCE_CACHE_TTL, Config.PROVENANCE_CACHE_MAX_BYTES))
+
+
+# Look up many datasets by DOI and/or Pennsieve identifier in one call.
+# Expects a JSON body such as {"dois": ["10.26275/pzek-91wx"], "identifiers": ["55"]} and returns
+# the processed results of every lookup in the order they were given.
+@app.route("/dataset_info/bulk", methods=["POST"])
+def get_dataset_info_bulk():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return abort(400, description="Expected a JSON body with a list of 'dois' and/or 'identifiers'.")
+    dois = data.get('dois', [])
+    identifiers = data.get('identifiers', [])
+    if not isinstance(dois, list) or not isinstance(identifiers, list) or not (dois or identifiers):
+        return abort(400, description="Expected a JSON body with a list of 'dois' and/or 'identifiers'.")
+    if len(dois) + len(identifiers) > Config.BULK_DATASET_LOOKUP_LIMIT:
+        return abort(400, description=f"At most {Config.BULK_DATASET_LOOKUP_LIMIT} datasets can be looked up at once.")
+
+    fields = requested_fields()
+    lookups = [('doi', doi, create_doi_query(doi, fields=fields)) for doi in dois]
+    lookups += [('identifier', identifier, create_pennsieve_identifier_query(identifier, fields=fields)) for identifier in identifiers]
+    responses = dataset_msearch([query for _, _, query in lookups])
+
+    output = []
+    for (kind, value, _), response in zip(lookups, responses):
+        if isinstance(response, dict) and 'hits' in response:
+            output.append({kind: value, 'result': reform_dataset_results(response, fields)['result']})
+        else:
+            # A search of the _msearch request failed, that is not the same as finding nothing.
+            error = response.get('error', 'Unknown error') if isinstance(response, dict) else 'No response'
+            status = response.get('status', 502) if isinstance(response, dict) else 502
+            output.append({kind: value, 'error': error, 'status': status})
+
+    return jsonify({'result': output})
 
 
 # /search/: Returns sci-crunch results for a given <search> query
@@ -917,32 +1191,35 @@ def kb_search(query, limit=10, start=0):
             start = request.args.get('start')
 
         # print(f'{Config.SCI_CRUNCH_HOST}/_search?q={query}&size={limit}&from={start}&api_key={Config.KNOWLEDGEBASE_KEY}')
-        response = requests.get(f'{Config.SCI_CRUNCH_HOST}/_search?q={query}&size={limit}&from={start}&api_key={Config.KNOWLEDGEBASE_KEY}')
-        return process_results(response.json())
-    except requests.exceptions.HTTPError as err:
+        response = scicrunch.get(f'{Config.SCI_CRUNCH_HOST}/_search?q={query}&size={limit}&from={start}&api_key={Config.KNOWLEDGEBASE_KEY}',
+                                 endpoint='kb_search')
+        return process_results(response.json(), requested_fields())
+    except requests.exceptions.RequestException as err:
         logging.error(err)
-        return json.dumps({'error': err})
+        return json.dumps({'error': str(err)})
 
 
 # /filter-search/: Returns sci-crunch results with optional params for facet filtering, sizing, and pagination
 @app.route("/filter-search/", defaults={'query': ''})
 @app.route("/filter-search/<query>/")
+@last_good.serve
 def filter_search(query):
     terms = request.args.getlist('term')
     facets = request.args.getlist('facet')
     size = request.args.get('size')
     start = request.args.get('start')
+    fields = requested_fields()
 
     # Create request
-    data = create_filter_request(query, terms, facets, size, start)
+    data = create_filter_request(query, terms, facets, size, start, fields)
 
     # Send request to sci-crunch
     try:
-        response = requests.post(
+        response = scicrunch.post(
             f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
-            json=data)
-        results = process_results(response.json())
-    except requests.exceptions.HTTPError as err:
+            endpoint='filter_search', json=data)
+        results = process_results(response.json(), fields)
+    except requests.exceptions.RequestException as err:
         logging.error(err)
         return jsonify({'error': str(err), 'message': 'SciCrunch is not currently reachable, please try again later'}), 502
     except json.JSONDecodeError:
@@ -951,32 +1228,84 @@ def filter_search(query):
     return results
 
 
+# Fetch the terms of all the SciCrunch paths of a facet type with a single multi-aggregation request
+def fetch_facets(type_):
+    data = create_facet_query(type_)
+    response = scicrunch.post(
+        f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
+        endpoint='get_facets', json=data)
+
+    return reform_facet_results(response.json(), data['aggregations'].keys())
+
+
+# Facet terms of every facet type, refreshed in the background so /get-facets/ does not need to call SciCrunch.
+# They are shared with the workers, with gunicorn --preload the scheduler only runs in the master process.
+facet_snapshots = SharedCache(Config.SHARED_CACHE_PATH, 'facet_snapshots', Config.FACET_SNAPSHOT_TTL,
+                              Config.FACET_SNAPSHOT_MAX_BYTES)
+
+
+def facet_snapshot_key(type_):
+    return make_cache_key(['facets', type_])
+
+
+def update_facet_snapshots():
+    fetched = {}
+    for type_, paths in get_facet_type_map().items():
+        # Several facet types share the same paths, only request each set of paths once.
+        paths = tuple(paths)
+        if paths not in fetched:
+            try:
+                fetched[paths] = fetch_facets(type_)
+            except Exception as ex:
+                logging.error(f"Could not update the facet snapshot for {type_}: {ex}")
+                fetched[paths] = None
+        if fetched[paths] is not None:
+            facet_snapshots.set_json(facet_snapshot_key(type_), fetched[paths])
+
+
+# Take the facet snapshots on deploy and then every hour
+facets_scheduler.add_job(update_facet_snapshots, OrTrigger([DateTrigger(), IntervalTrigger(hours=1)]))
+
+
+# Search SciCrunch without going through the dataset search cache, errors are raised to the caller.
+def scicrunch_search(query):
+    params = {
+        "api_key": Config.KNOWLEDGEBASE_KEY
+    }
+    response = scicrunch.post(f'{Config.SCI_CRUNCH_HOST}/_search', endpoint='dataset_replica_sync', json=query, params=params)
+    response.raise_for_status()
+
+    return response.json()
+
+
+def sync_dataset_replica():
+    try:
+        # The workers share the replica, only one of them syncs it each interval.
+        dataset_replica.sync_if_stale(scicrunch_search, Config.DATASET_REPLICA_SYNC_INTERVAL / 2)
+    except Exception as ex:
+        logging.error(f"Could not sync the dataset replica: {ex}")
+
+
+# Sync the dataset replica on deploy and then periodically
+dataset_replica_scheduler.add_job(sync_dataset_replica, OrTrigger([DateTrigger(), IntervalTrigger(seconds=Config.DATASET_REPLICA_SYNC_INTERVAL)]))
+
+
 # /get-facets/: Returns available sci-crunch facets for filtering over given a <type> ('species', 'gender' etc)
 @app.route("/get-facets/<type_>")
 def get_facets(type_):
-    # Create facet query
-    type_map, data = create_facet_query(type_)
-
-    # Make a request for each sci-crunch parameter
-    results = []
-    for path in type_map[type_]:
-        data['aggregations'][f'{type_}']['terms']['field'] = path
-        try:
-            response = requests.post(
-                f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
-                json=data)
-            json_result = response.json()
-            results.append(json_result)
-        except json.JSONDecodeError:
-            return jsonify({'message': 'Could not parse SciCrunch output, please try again later',
-                            'error': 'JSONDecodeError'}), 502
-        except Exception as ex:
-            logging.error(f"Could not search SciCrunch for path {path}", ex)
+    terms = facet_snapshots.get_json(facet_snapshot_key(type_))
+    if terms is not None:
+        return jsonify(terms)
 
-    # Select terms from the results
-    terms = []
-    for result in results:
-        terms += result['aggregations'][f'{type_}']['buckets']
+    try:
+        terms = fetch_facets(type_)
+        facet_snapshots.set_json(facet_snapshot_key(type_), terms)
+    except json.JSONDecodeError:
+        return jsonify({'message': 'Could not parse SciCrunch output, please try again later',
+                        'error': 'JSONDecodeError'}), 502
+    except Exception as ex:
+        logging.error(f"Could not search SciCrunch for facet {type_}: {ex}")
+        terms = []
 
     return jsonify(terms)
 
@@ -1115,6 +1444,11 @@ def get_featured_datasets_identifiers():
     return {'identifiers': get_featured_datasets()}
 
 
+def get_discover_datasets(ids):
+    return single_flight.do(('discover_datasets', ids),
+                            lambda: requests.get("{}/datasets?ids={}".format(Config.DISCOVER_API_HOST, ids)).json())
+
+
 @app.route("/get_featured_dataset", methods=["GET"])
 @cache.cached(timeout=300)
 def get_featured_dataset():
@@ -1123,10 +1457,10 @@ def get_featured_dataset():
         # In case there was an error while setting the id, just return a default dataset so the homepage does not break.
         featured_dataset_id = 32
     try:
-        response = requests.get("{}/datasets?ids={}".format(Config.DISCOVER_API_HOST, featured_dataset_id)).json()
+        response = get_discover_datasets(featured_dataset_id)
         # in case the dataset has been unpublished, just return default
         if response['datasets'] == []:
-            response = requests.get("{}/datasets?ids={}".format(Config.DISCOVER_API_HOST, 32)).json()
+            response = get_discover_datasets(32)
         return response
     except Exception as ex:
         logging.error(f"Could not get featured dataset {featured_dataset_id}", ex)
@@ -1324,7 +1658,7 @@ def get_body_scaffold_info(species):
     id = get_body_scaffold_dataset_id(species)
     if id:
         query = create_pennsieve_identifier_query(id)
-        result = process_get_first_scaffold_info(dataset_search(query))
+        result = process_get_first_scaffold_info(dataset_replica.find_by_discover_ids([id]) or dataset_search(query))
         if result:
             return result
 
@@ -1345,8 +1679,9 @@ def thumbnail_by_image_id(image_id, recursive_call=False):
             'token': bl.token(),
         }
 
-        response = requests.request("GET", url, headers=headers)
-        encoded_content = base64.b64encode(response.content)
+        content = single_flight.do(('biolucida_thumbnail', image_id, headers['token']),
+                                   lambda: requests.request("GET", url, headers=headers).content)
+        encoded_content = base64.b64encode(content)
         # Response from this endpoint is binary on success so the easiest thing to do is
         # check for an error response in encoded form.
         if encoded_content == b'eyJzdGF0dXMiOiJBZG1pbiB1c2VyIGF1dGhlbnRpY2F0aW9uIHJlcXVpcmVkIHRvIHZpZXcvZWRpdCB1c2VyIGluZm8uIFlvdSBtYXkgbmVlZCB0byBsb2cgb3V0IGFuZCBsb2cgYmFjayBpbiB0byByZXZlcmlmeSB5b3VyIGNyZWRlbnRpYWxzLiJ9' \
@@ -1378,10 +1713,9 @@ def image_info_by_image_id(image_id):
 def image_search_by_dataset_id(dataset_id):
     url = Config.BIOLUCIDA_ENDPOINT + "/imagemap/search_dataset/discover/{0}".format(dataset_id)
     try:
-        response = requests.request("GET", url)
-        return response.json()
-    except Exception as ex:
-        logging.error(f"Could not search images for dataset {dataset_id}", ex)
+        return scicrunch.passthrough('GET', url, endpoint='image_search', accept_encoding=request.headers.get('Accept-Encoding'))
+    except requests.exceptions.RequestException as ex:
+        logging.error(f"Could not search images for dataset {dataset_id}: {ex}")
     return {"error": "An error occured while searching images for dataset"}, 404
 
 
@@ -2236,9 +2570,9 @@ def get_available_uberonids():
     result = {}
 
     try:
-        response = requests.post(
+        response = scicrunch.post(
             f'{Config.SCI_CRUNCH_HOST}/_search?api_key={Config.KNOWLEDGEBASE_KEY}',
-            json=requestBody)
+            endpoint='get_organ_curies', json=requestBody)
         result = reform_curies_results(response.json())
     except BaseException as ex:
         logging.error("Failed getting Uberon IDs", ex)
@@ -2263,9 +2597,9 @@ def get_related_terms(query):
     result = {}
 
     try:
-        response = requests.get(
+        response = scicrunch.get(
             f'{Config.SCI_CRUNCH_SCIGRAPH_HOST}/graph/neighbors/{query}',
-            params=payload)
+            endpoint='get_related_terms', params=payload)
         result = reform_related_terms(response.json())
     except BaseException as ex:
         logging.error(f"Failed getting related terms with payload {payload}", ex)
@@ -2289,7 +2623,15 @@ def simulation_ui_file(identifier):
         key = re.sub(r"s3://[^/]*/", "", f"{uri}files/{path}")
         s3_bucket_name = re.sub(r"s3://|/.*", "", uri)
 
-        return jsonify(json.loads(direct_download_url(key, s3_bucket_name)))
+        s3_path, _ = resolve_s3_resource(key, s3_bucket_name)
+        try:
+            response = s3.get_object(Bucket=s3_bucket_name, Key=s3_path, RequestPayer="requester")
+        except ClientError as err:
+            if is_stale_head_error(err):
+                s3_metadata.evict(s3_bucket_name, s3_path)
+            raise
+
+        return jsonify(json.loads(response["Body"].read()))
     except Exception:
         abort(404, description="no simulation UI file could be found")
 
@@ -2371,7 +2713,7 @@ def find_by_onto_term():
     query = create_onto_term_query(term)
 
     try:
-        response = requests.get(f'{Config.SCI_CRUNCH_INTERLEX_HOST}/_search', headers=headers, params=params, json=query)
+        response = scicrunch.get(f'{Config.SCI_CRUNCH_INTERLEX_HOST}/_search', endpoint='onto_term_lookup', headers=headers, params=params, json=query)
 
         results = response.json()
         hits = results['hits']['hits']
@@ -2401,7 +2743,7 @@ def get_dataset_citations(dataset_id):
     query = create_citations_query(dataset_id)
 
     try:
-        response = requests.get(f'{Config.SCI_CRUNCH_CITATIONS_HOST}/_search', headers=headers, params=params, json=query)
+        response = scicrunch.get(f'{Config.SCI_CRUNCH_CITATIONS_HOST}/_search', endpoint='dataset_citations', headers=headers, params=params, json=query)
 
         results = response.json()
         hits = results['hits']['hits']
@@ -2441,7 +2783,7 @@ def get_total_dataset_citations():
     }
 
     try:
-        response = requests.get(f'{Config.SCI_CRUNCH_CITATIONS_HOST}/_search', headers=headers, params=params, json=query)
+        response = scicrunch.get(f'{Config.SCI_CRUNCH_CITATIONS_HOST}/_search', endpoint='total_dataset_citations', headers=headers, params=params, json=query)
         results = response.json()
         buckets = results['aggregations']['Citations']['buckets']
         total = sum(bucket["doc_count"] for bucket in buckets)
@@ -1,3 +1,5 @@
+# Source of the path rewriting maps, it is not imported by the app. After editing, regenerate the index
+# read by app.name_map_index with: python -m scripts.build_name_map_index
 name_map = {'files/primary/sub-PR1705/pool-PR1705/PR1705_Blockface_1-531_Shaina-scaling50umx50um.jpx': 'files/primary/sub-PR1705/pool-PR1705/PR1705_Blockface_scaling50umx50um.jpx',
             'files/derivative/sub-1705/pool-1705/PR1705_Blockface_1-531_Shaina-scaling50umX50um_2019-07-16_Blackfynn.xml': 'files/derivative/sub-1705/pool-1705/PR1705_All_Sampled_Points.xml',
             'files/primary/pool-1/Metabolic_data.xlsx': 'files/primary/pool-1/Metabolic data.xlsx',
@@ -0,0 +1,133 @@
+import json
+import mmap
+import os
+import threading
+
+from collections.abc import Mapping
+
+NAME_MAP_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'manifest_name_to_discover_name.idx')
+NAME_MAP_PARTITION_DEPTH = 3
+
+
+def partition_prefix(key, depth):
+    return '/'.join(key.split('/', depth)[:depth])
+
+
+def write_index(path, maps):
+    """
+    Write the name maps to a compact index file.
+
+    maps is a dict of name -> (mapping, depth), each mapping is split into partitions by the
+    first depth components of its keys. The file has one JSON header line, holding the byte
+    range of every partition, followed by the partitions, each a sorted JSON object.
+    """
+    header = {'version': 1, 'maps': {}}
+    chunks = []
+    offset = 0
+    for name, (mapping, depth) in sorted(maps.items()):
+        partitions = {}
+        for key, value in mapping.items():
+            partitions.setdefault(partition_prefix(key, depth), {})[key] = value
+
+        ranges = {}
+        for prefix, partition in sorted(partitions.items()):
+            chunk = json.dumps(partition, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            ranges[prefix] = [offset, offset + len(chunk)]
+            chunks.append(chunk)
+            offset += len(chunk)
+        header['maps'][name] = {'depth': depth, 'partitions': ranges}
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(json.dumps(header, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        f.write(b'\n')
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+class NameMapIndex(Mapping):
+    """
+    Read only mapping over one of the maps of an index file written by write_index.
+
+    Nothing is read until the first lookup, the file is then memory mapped and only the
+    partition a key belongs to is decoded (and kept), so a worker only holds the slices of
+    the map for the paths it is actually asked about.
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        self._data = None
+        self._data_start = 0
+        self._depth = 0
+        self._ranges = None
+        self._partitions = {}
+
+    def _open(self):
+        with self._lock:
+            if self._ranges is None:
+                with open(self.path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                header_end = data.find(b'\n')
+                header = json.loads(data[:header_end].decode('utf-8'))['maps'][self.name]
+                self._data = data
+                self._data_start = header_end + 1
+                self._depth = header['depth']
+                self._ranges = header['partitions']
+
+        return self._ranges
+
+    def _partition(self, key):
+        ranges = self._ranges
+        if ranges is None:
+            ranges = self._open()
+
+        prefix = partition_prefix(key, self._depth)
+        partition = self._partitions.get(prefix)
+        if partition is None:
+            if prefix not in ranges:
+                return None
+            partition = self._partitions[prefix] = self._decode(ranges[prefix])
+
+        return partition
+
+    def _decode(self, byte_range):
+        start, end = byte_range
+        return json.loads(self._data[self._data_start + start:self._data_start + end].decode('utf-8'))
+
+    def get(self, key, default=None):
+        if not isinstance(key, str):
+            return default
+        partition = self._partition(key)
+        if partition is None:
+            return default
+        return partition.get(key, default)
+
+    def __contains__(self, key):
+        if not isinstance(key, str):
+            return False
+        partition = self._partition(key)
+        return partition is not None and key in partition
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        ranges = self._ranges if self._ranges is not None else self._open()
+        for prefix in list(ranges):
+            partition = self._partitions.get(prefix)
+            yield from partition if partition is not None else self._decode(ranges[prefix])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# Mangled manifest paths ('files/primary/...') to the paths used by Pennsieve Discover.
+name_map = NameMapIndex(NAME_MAP_INDEX_PATH, 'name_map')
+# Biolucida image names to the names of the files in the dataset.
+biolucida_name_map = NameMapIndex(NAME_MAP_INDEX_PATH, 'biolucida_name_map')
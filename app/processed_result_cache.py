@@ -0,0 +1,89 @@
+import json
+import threading
+from collections import OrderedDict
+
+
+class ProcessedResultCache(object):
+    """
+    Processed dataset results keyed by (dataset id, dataset version, revision, ...).
+
+    A published revision of a dataset never changes, so its processed result is kept until it
+    is evicted, least recently used first, once max_entries results or about max_bytes of them
+    (their size as JSON) are held, or until a result for another version or revision of the
+    same dataset is stored, the index having moved on. A single result of more than a quarter
+    of max_bytes is not kept. The results are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_entries, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Key -> (result, size).
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Dataset id -> the key of the version that is cached.
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'skipped': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+
+        self._bytes -= entry[1]
+        return True
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+
+        size = 0
+        if self.max_bytes is not None:
+            # Measured once per result, when it is processed, results are mostly lists of file objects.
+            size = len(json.dumps(value, separators=(',', ':'), default=str))
+            if size > self.max_bytes // 4:
+                with self._lock:
+                    self._stats['skipped'] += 1
+                return
+
+        dataset_id = key[0]
+        with self._lock:
+            previous = self._versions.get(dataset_id)
+            if previous is not None and previous != key and self._pop(previous):
+                self._stats['invalidations'] += 1
+
+            self._pop(key)
+            self._versions[dataset_id] = key
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                evicted, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                if self._versions.get(evicted[0]) == evicted:
+                    del self._versions[evicted[0]]
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+
+        return stats
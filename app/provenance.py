@@ -0,0 +1,245 @@
+from app.scicrunch_requests import create_identifier_query, create_multiple_discoverId_query, create_multiple_doi_query
+from app.shared_cache import make_cache_key
+
+# Kinds of lookup used to find the dataset a provenance node belongs to.
+LOOKUP_IDENTIFIER = 'identifier'
+LOOKUP_DOI = 'doi'
+LOOKUP_DISCOVER_ID = 'discoverId'
+
+# Edge types, each node of the provenance graph resolves to an ordered list of these.
+#  ['entry', source]: a source found in the node itself.
+#  ['path', path, fallback]: the sources of another path in the same dataset, or the fallback source when there are none.
+#  ['doi', doi, path]: the sources of a path in another published dataset.
+EDGE_ENTRY = 'entry'
+EDGE_PATH = 'path'
+EDGE_DOI = 'doi'
+
+
+def _lookup_query(kind, value):
+    if kind == LOOKUP_IDENTIFIER:
+        return create_identifier_query(value)
+    if kind == LOOKUP_DOI:
+        return create_multiple_doi_query([value.replace('DOI:', '')])
+
+    return create_multiple_discoverId_query([value])
+
+
+class DatasetIndex(object):
+    """
+    Objects of one dataset version indexed by identifier and by path.
+    """
+
+    def __init__(self, discover_id, version, objects):
+        self.discover_id = discover_id
+        self.version = version
+        self.objects = objects
+        self.by_identifier = {}
+        self.by_path = {}
+        for position, item in enumerate(objects):
+            identifier = item.get('identifier')
+            if identifier:
+                self.by_identifier.setdefault(identifier, []).append(position)
+            self.by_path.setdefault(item.get('dataset', {}).get('path', ''), []).append(position)
+
+    @staticmethod
+    def from_search_results(dataset_info):
+        if not isinstance(dataset_info, dict):
+            return None
+
+        hits = dataset_info.get('hits', {}).get('hits', [])
+        # there should only be one result
+        if len(hits) != 1:
+            return None
+
+        source = hits[0].get('_source', {})
+        objects = source.get('objects')
+        discover_id = source.get('pennsieve', {}).get('identifier')
+        version = source.get('pennsieve', {}).get('version', {}).get('identifier')
+        if objects is None or discover_id is None or version is None:
+            return None
+
+        return DatasetIndex(discover_id, version, objects)
+
+    def match(self, identifier, path):
+        positions = []
+        if identifier:
+            positions.extend(self.by_identifier.get(identifier, []))
+        if path:
+            positions.extend(self.by_path.get(path, []))
+
+        return [self.objects[position] for position in sorted(set(positions))]
+
+    def edges(self, identifier, path):
+        edges = []
+        for item in self.match(identifier, path):
+            datacite = item.get("datacite", {})
+            is_derived_from_paths = datacite.get("isDerivedFrom", {}).get('path')
+            derived_from_dataset = item.get("derived_from_dataset", {})
+            derived_from_dataset_doi = derived_from_dataset.get('uri')
+            derived_from_dataset_path = derived_from_dataset.get('path')
+            flatmap_uuid = item.get("associated_flatmap", {}).get('identifier')
+            if flatmap_uuid:
+                edges.append([EDGE_ENTRY, {
+                    'discoverId': self.discover_id,
+                    'name': item['name'],
+                    'path': item['dataset']['path'],
+                    'version': self.version,
+                    'flatmapUUID': flatmap_uuid
+                }])
+            if is_derived_from_paths is not None:
+                fallback = None
+                if derived_from_dataset_doi is None or derived_from_dataset_path is None:
+                    fallback = {
+                        'discoverId': self.discover_id,
+                        'name': item['name'],
+                        'path': item['dataset']['path'],
+                        'version': self.version
+                    }
+                for derived_path in is_derived_from_paths:
+                    derived_path = derived_path.replace('derivative/sub-f006/derivative/sub-f006', 'derivative/sub-f006')
+                    edges.append([EDGE_PATH, derived_path, fallback])
+            if derived_from_dataset_doi is not None and derived_from_dataset_path is not None:
+                for i in range(len(derived_from_dataset_doi)):
+                    if 0 <= i < len(derived_from_dataset_path):
+                        doi = derived_from_dataset_doi[i].replace('https://doi.org/', '')
+                        edges.append([EDGE_DOI, doi, derived_from_dataset_path[i]])
+
+        return edges
+
+
+class ProvenanceResolver(object):
+    """
+    Trace the original source of a file all the way till it is found or an external dataset is reached.
+
+    The derivation graph is expanded breadth first, the datasets needed by each level are fetched
+    with a single batched search. A published dataset version never changes, so the edges of every
+    node are kept in a shared cache keyed by dataset version, together with the DOI to version mapping,
+    and chains through already resolved DOIs do not need any search at all.
+    """
+
+    def __init__(self, search_many, edge_cache):
+        self.search_many = search_many
+        self.edge_cache = edge_cache
+
+    @staticmethod
+    def root_node(identifier, doi, discover_id, path):
+        if identifier is not None:
+            return LOOKUP_IDENTIFIER, identifier, identifier, path
+        if path is not None:
+            if doi is not None:
+                return LOOKUP_DOI, doi, None, path
+            if discover_id is not None:
+                return LOOKUP_DISCOVER_ID, discover_id, None, path
+
+        return None
+
+    @staticmethod
+    def _edges_key(version, node):
+        return make_cache_key(['provenance-edges', version[0], version[1], node[2], node[3]])
+
+    @staticmethod
+    def _doi_key(doi):
+        return make_cache_key(['provenance-doi', doi])
+
+    def resolve(self, identifier, doi, discover_id, path):
+        root = self.root_node(identifier, doi, discover_id, path)
+        if root is None:
+            return []
+
+        datasets = {}
+        versions = {}
+        edges = {}
+        level = [root]
+        seen = {root}
+        while level:
+            unresolved = [node for node in level if not self._cached_edges(node, versions, edges)]
+            self._load_datasets(unresolved, datasets, versions)
+            for node in unresolved:
+                if not self._cached_edges(node, versions, edges):
+                    dataset = datasets.get(node[:2])
+                    edges[node] = dataset.edges(node[2], node[3]) if dataset is not None else []
+                    if dataset is not None:
+                        self.edge_cache.set_json(self._edges_key(versions[node[:2]], node), edges[node])
+
+            next_level = []
+            for node in level:
+                for child in self._edge_nodes(node, edges[node]):
+                    if child is not None and child not in seen:
+                        seen.add(child)
+                        next_level.append(child)
+            level = next_level
+
+        return self._assemble(root, edges, set(), {})
+
+    def _cached_edges(self, node, versions, edges):
+        if node in edges:
+            return True
+
+        lookup = node[:2]
+        version = versions.get(lookup)
+        if version is None and lookup[0] == LOOKUP_DOI:
+            version = self.edge_cache.get_json(self._doi_key(lookup[1]))
+            if version is not None:
+                versions[lookup] = version
+        if version is None:
+            return False
+
+        cached = self.edge_cache.get_json(self._edges_key(version, node))
+        if cached is None:
+            return False
+
+        edges[node] = cached
+        return True
+
+    def _load_datasets(self, nodes, datasets, versions):
+        lookups = []
+        for node in nodes:
+            lookup = node[:2]
+            if lookup not in datasets and lookup not in lookups:
+                lookups.append(lookup)
+        if not lookups:
+            return
+
+        responses = self.search_many([_lookup_query(kind, value) for kind, value in lookups])
+        for lookup, response in zip(lookups, responses):
+            dataset = DatasetIndex.from_search_results(response)
+            datasets[lookup] = dataset
+            if dataset is not None:
+                versions[lookup] = [dataset.discover_id, dataset.version]
+                if lookup[0] == LOOKUP_DOI:
+                    self.edge_cache.set_json(self._doi_key(lookup[1]), versions[lookup])
+
+    def _assemble(self, node, edges, visiting, resolved):
+        if node in resolved:
+            return resolved[node]
+        # A derivation cycle does not add any source.
+        if node in visiting:
+            return []
+
+        visiting.add(node)
+        sources = []
+        node_edges = edges.get(node, [])
+        for edge, child in zip(node_edges, self._edge_nodes(node, node_edges)):
+            if edge[0] == EDGE_ENTRY:
+                sources.append(edge[1])
+            else:
+                child_sources = self._assemble(child, edges, visiting, resolved)
+                if child_sources:
+                    sources.extend(child_sources)
+                elif edge[0] == EDGE_PATH and edge[2] is not None:
+                    sources.append(edge[2])
+        visiting.discard(node)
+        resolved[node] = sources
+
+        return sources
+
+    # The node each edge points to, None for the sources found in the node itself.
+    @staticmethod
+    def _edge_nodes(node, node_edges):
+        for edge in node_edges:
+            if edge[0] == EDGE_PATH:
+                yield node[0], node[1], None, edge[1]
+            elif edge[0] == EDGE_DOI:
+                yield LOOKUP_DOI, edge[1], None, edge[2]
+            else:
+                yield None
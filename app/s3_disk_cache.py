@@ -0,0 +1,205 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from app.shared_cache import make_cache_key
+
+# Running total of the files in the cache, next to the sharded directories.
+SIZE_FILE = 'size.json'
+
+
+class S3DiskCache(object):
+    """
+    Content addressed cache of S3 objects on the local disk, shared by every worker of the host.
+
+    An object is stored under a name derived from its bucket, key and ETag, so a new version of an
+    object is never served from an old copy. Files are written to a temporary name and renamed once
+    complete, a file in the cache is always whole. The cache is kept under max_bytes by removing the
+    least recently used files, a hit refreshes the modification time of its file. Objects bigger than
+    max_object_bytes are not stored.
+
+    The size of the cache is kept in a file updated by every store, the files are only listed when
+    it goes over max_bytes, or every scan_interval seconds to correct it and remove the temporary
+    files of writes that did not finish.
+    """
+
+    def __init__(self, directory, max_bytes, max_object_bytes, scan_interval=3600):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.scan_interval = scan_interval
+        self._scanned_at = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and self.max_object_bytes > 0
+
+    def path(self, bucket, key, etag):
+        name = make_cache_key(['s3-object', bucket, key, etag])
+        return os.path.join(self.directory, name[:2], name)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, bucket, key, etag):
+        """
+        Returns the path of the cached copy of the object, None when it is not cached.
+        """
+        if not self.enabled or not etag:
+            return None
+
+        path = self.path(bucket, key, etag)
+        try:
+            os.utime(path)
+        except OSError:
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return path
+
+    def store(self, bucket, key, etag, chunks, size=None):
+        """
+        Yield the chunks of an object while writing them to the cache.
+
+        The copy is only kept when all the chunks were read, a client going away part way leaves
+        nothing behind.
+        """
+        if not self.enabled or not etag or size is None or size > self.max_object_bytes:
+            yield from chunks
+            return
+
+        path = self.path(bucket, key, etag)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(tmp_path, 'wb')
+        except OSError as err:
+            logging.warning(f'Could not write to the S3 disk cache: {err}')
+            yield from chunks
+            return
+
+        complete = False
+        total = None
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+                written = f.tell()
+            complete = written == size
+            if complete:
+                # Another worker may have stored the same version in the meantime, it is only counted once.
+                replaced = os.path.exists(path)
+                os.replace(tmp_path, path)
+                self._count('stores')
+                if not replaced:
+                    total = self._update_size(written, 1)['bytes']
+        except OSError as err:
+            logging.warning(f'Could not write to the S3 disk cache: {err}')
+        finally:
+            if not complete:
+                self._remove(tmp_path)
+
+        if complete:
+            self.evict(total)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _size_path(self):
+        return os.path.join(self.directory, SIZE_FILE)
+
+    def _update_size(self, size_delta=0, entries_delta=0, reset=None):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.open(self._size_path(), os.O_RDWR | os.O_CREAT), 'r+') as f:
+            # Held until the file is closed, the workers update the total one at a time.
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                size = json.loads(f.read())
+            except ValueError:
+                size = {'bytes': 0, 'entries': 0}
+            if reset is not None:
+                size = reset
+            else:
+                size = {'bytes': size['bytes'] + size_delta, 'entries': size['entries'] + entries_delta}
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(size))
+
+        return size
+
+    def _files(self):
+        files = []
+        for directory in os.scandir(self.directory):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def evict(self, total=None):
+        """
+        Remove the least recently used files until the cache holds at most max_bytes.
+
+        total is the running size of the cache, the files are not listed while it is under max_bytes
+        and they were listed less than scan_interval seconds ago.
+        """
+        now = time.time()
+        if total is not None and total <= self.max_bytes and now - self._scanned_at < self.scan_interval:
+            return
+
+        self._scanned_at = now
+        try:
+            files = self._files()
+        except OSError as err:
+            logging.warning(f'Could not read the S3 disk cache: {err}')
+            return
+
+        cached = [(modified, size, path) for modified, size, path in files if not path.endswith('.tmp')]
+        remaining = sum(size for _, size, _ in cached)
+        entries = len(cached)
+        # Temporary files of writes that did not finish (killed worker) are removed after an hour.
+        stale = now - 3600
+        for modified, size, path in sorted(files):
+            if path.endswith('.tmp'):
+                if modified < stale:
+                    self._remove(path)
+            elif remaining > self.max_bytes:
+                self._remove(path)
+                remaining -= size
+                entries -= 1
+                self._count('evictions')
+
+        try:
+            self._update_size(reset={'bytes': remaining, 'entries': entries})
+        except OSError as err:
+            logging.warning(f'Could not write the size of the S3 disk cache: {err}')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+
+        try:
+            with open(self._size_path()) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                size = json.loads(f.read())
+        except (OSError, ValueError):
+            size = {'bytes': 0, 'entries': 0}
+        stats['entries'] = size['entries']
+        stats['bytes'] = size['bytes']
+        return stats
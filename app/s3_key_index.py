@@ -0,0 +1,68 @@
+import logging
+
+from botocore.exceptions import ClientError
+
+from app.shared_cache import make_cache_key
+
+
+class S3KeyIndex(object):
+    """
+    The keys of the (non empty) objects of each dataset in an S3 bucket, kept in a shared cache.
+
+    The keys under a dataset prefix ('217/') are listed with ListObjectsV2, page by page, and
+    cached per dataset version, so the index of a dataset is listed again once a new version
+    of it is published (or once the cache entry expires when the version is not known).
+    Datasets with more than max_keys objects are not indexed, keys() then returns None and the
+    objects have to be looked up one at a time.
+    """
+
+    def __init__(self, cache, max_keys, page_size=1000):
+        self.cache = cache
+        self.max_keys = max_keys
+        self.page_size = page_size
+
+    @staticmethod
+    def dataset_prefix(path):
+        dataset_id, separator, _ = path.partition('/')
+        return f'{dataset_id}/' if separator and dataset_id.isdigit() else None
+
+    def keys(self, client, bucket, prefix, version=None):
+        cache_key = make_cache_key(['s3-keys', bucket, prefix, version])
+        cached = self.cache.get_json(cache_key)
+        if cached is None:
+            cached = self._list(client, bucket, prefix)
+            if cached is None:
+                return None
+            self.cache.set_json(cache_key, cached)
+
+        if not cached['complete']:
+            return None
+
+        return frozenset(f'{prefix}{key}' for key in cached['keys'])
+
+    def _list(self, client, bucket, prefix):
+        keys = []
+        kwargs = {}
+        try:
+            while True:
+                response = client.list_objects_v2(
+                    Bucket=bucket,
+                    Prefix=prefix,
+                    MaxKeys=self.page_size,
+                    RequestPayer="requester",
+                    **kwargs
+                )
+                # Keys are stored without the prefix, the same as /exists an empty object does not count.
+                keys.extend(item['Key'][len(prefix):] for item in response.get('Contents', []) if item.get('Size', 0) > 0)
+                if len(keys) > self.max_keys:
+                    # Remembered so that the dataset is not listed again on every request.
+                    return {'complete': False, 'keys': []}
+                if not response.get('IsTruncated'):
+                    return {'complete': True, 'keys': keys}
+                kwargs = {'ContinuationToken': response['NextContinuationToken']}
+        except ClientError as err:
+            logging.warning(f'Could not list the objects of s3://{bucket}/{prefix}: {err}')
+            return None
+
+    def stats(self):
+        return self.cache.stats()
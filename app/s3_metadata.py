@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from app.shared_cache import make_cache_key
+
+# Errors that say an object is not there (or not readable), they are cached for negative_ttl.
+NEGATIVE_ERROR_CODES = ('403', '404', 'NoSuchKey')
+# The parts of a head_object response the app uses.
+HEAD_FIELDS = ('ContentLength', 'ETag', 'ContentType')
+# Errors of a get_object made with a cached head that say the object changed or went away since.
+STALE_ERROR_CODES = ('412', 'PreconditionFailed', 'NoSuchKey')
+
+
+def is_stale_head_error(err):
+    return err.response.get('Error', {}).get('Code') in STALE_ERROR_CODES
+
+
+class S3MetadataCache(object):
+    """
+    Caches the head_object responses of S3 objects, keyed by (bucket, key), in a shared cache.
+
+    Objects that are missing or forbidden are cached too, for a shorter negative_ttl so that a newly
+    published object is found soon. The key a mangled path resolved to is kept as well, so repeat
+    requests for an object do not reach S3 until they actually need its content. A cached head can
+    be out of date by up to the TTL, the callers evict it once S3 tells them so.
+    """
+
+    def __init__(self, cache, negative_ttl):
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+
+    @staticmethod
+    def _head_key(bucket, key):
+        return make_cache_key(['s3-head', bucket, key])
+
+    @staticmethod
+    def _resolved_key(bucket, key):
+        return make_cache_key(['s3-resolved', bucket, key])
+
+    def head_object(self, client, bucket, key):
+        """
+        Same as client.head_object for a requester pays object, a ClientError is raised for a cached
+        missing or forbidden object as for one that was just looked up.
+        """
+        cached = self.cache.get_json(self._head_key(bucket, key))
+        if cached is None:
+            cached = self._head(client, bucket, key)
+
+        if not cached['exists']:
+            raise ClientError({'Error': {'Code': cached['error'], 'Message': cached['message']}}, 'HeadObject')
+
+        head = {name: cached[name] for name in HEAD_FIELDS if name in cached}
+        if 'LastModified' in cached:
+            head['LastModified'] = datetime.fromtimestamp(cached['LastModified'], timezone.utc)
+        return head
+
+    def _head(self, client, bucket, key):
+        try:
+            response = client.head_object(
+                Bucket=bucket,
+                Key=key,
+                RequestPayer="requester"
+            )
+        except ClientError as err:
+            error = err.response.get('Error', {})
+            if error.get('Code') not in NEGATIVE_ERROR_CODES:
+                raise
+            cached = {'exists': False, 'error': error['Code'], 'message': error.get('Message', '')}
+            self.cache.set_json(self._head_key(bucket, key), cached, self.negative_ttl)
+            return cached
+
+        cached = {name: response[name] for name in HEAD_FIELDS if name in response}
+        cached['exists'] = True
+        if response.get('LastModified') is not None:
+            cached['LastModified'] = response['LastModified'].timestamp()
+        self.cache.set_json(self._head_key(bucket, key), cached)
+        return cached
+
+    def evict(self, bucket, key):
+        """
+        Forget the head of an object, to be called when a get_object made with it fails with one of
+        STALE_ERROR_CODES.
+        """
+        self.cache.delete(self._head_key(bucket, key))
+
+    def resolved_key(self, bucket, key):
+        return self.cache.get_json(self._resolved_key(bucket, key))
+
+    def set_resolved_key(self, bucket, key, resolved):
+        self.cache.set_json(self._resolved_key(bucket, key), resolved)
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,257 @@
+import base64
+import uuid
+from datetime import timezone
+
+from botocore.exceptions import ClientError
+from flask import Response, abort, request, send_file
+from werkzeug.http import is_resource_modified, parse_if_range_header
+from werkzeug.wsgi import FileWrapper
+
+from app.s3_metadata import is_stale_head_error
+
+
+def iter_body(body, chunk_size):
+    """
+    Yield the body of an S3 get_object response chunk by chunk, the body is closed once it is read
+    or when the generator is closed early (the client went away).
+    """
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+
+def iter_base64(chunks):
+    """
+    Base64 encode a stream of chunks, the output is the same as encoding the whole content at once.
+    """
+    remainder = b''
+    for chunk in chunks:
+        chunk = remainder + chunk
+        # Only whole groups of 3 bytes are encoded, so no padding is written before the end.
+        end = len(chunk) - len(chunk) % 3
+        remainder = chunk[end:]
+        if end:
+            yield base64.b64encode(chunk[:end])
+
+    if remainder:
+        yield base64.b64encode(remainder)
+
+
+def representation_etag(etag, encode_base64):
+    # The base64 encoded content is another representation of the object, it cannot share its ETag.
+    if etag and encode_base64:
+        return f'{etag[:-1]}-base64"' if etag.endswith('"') else f'{etag}-base64'
+
+    return etag
+
+
+def parse_byte_ranges(header, length, coalesce_gap=0):
+    """
+    Resolve a Range header against the length of an object.
+
+    Returns the requested byte ranges as sorted (start, stop) pairs, stop excluded, with the ranges
+    that overlap or are less than coalesce_gap bytes apart merged into one. None is returned when the
+    header is not a valid bytes range, it is then ignored, and an empty list when no range can be
+    satisfied.
+    """
+    if not header:
+        return None
+    units, _, specs = header.partition('=')
+    if units.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash or not (first + last).isdigit():
+            return None
+        if not first:
+            # A suffix range, the last bytes of the object.
+            if int(last) > 0 and length > 0:
+                ranges.append((max(length - int(last), 0), length))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < length:
+            ranges.append((start, min(int(last) + 1, length) if last else length))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1] + coalesce_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+
+    return merged
+
+
+def _if_range_matches(etag, last_modified):
+    header = request.headers.get('If-Range')
+    if not header:
+        return True
+    if_range = parse_if_range_header(header)
+    if if_range.etag is not None:
+        # If-Range uses the strong comparison, a weak ETag never matches.
+        return etag is not None and not etag.startswith('W/') and etag.strip('"') == if_range.etag
+    return if_range.date is not None and last_modified is not None and last_modified.replace(microsecond=0) == if_range.date
+
+
+def _naive_utc(value):
+    # boto returns aware datetimes, werkzeug 0.16 compares them with the naive UTC dates of the request headers.
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return value
+
+
+def _get_range(client, bucket, key, etag, start, stop):
+    kwargs = {'IfMatch': etag} if etag else {}
+    # IfMatch makes sure all the parts come from the version of the object the head was read from.
+    return client.get_object(
+        Bucket=bucket,
+        Key=key,
+        Range=f"bytes={start}-{stop - 1}",
+        RequestPayer="requester",
+        **kwargs
+    )
+
+
+def _iter_byteranges(client, bucket, key, etag, ranges, length, content_type, boundary, chunk_size, first_body):
+    for index, (start, stop) in enumerate(ranges):
+        yield f'--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n'.encode()
+        body = first_body if index == 0 else _get_range(client, bucket, key, etag, start, stop)["Body"]
+        yield from iter_body(body, chunk_size)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def _ranged_response(client, bucket, key, head, ranges, chunk_size):
+    length = head['ContentLength']
+    content_type = head.get('ContentType', 'application/octet-stream')
+    start, stop = ranges[0]
+    # The first range is read before answering, a head that is out of date fails here and not part way through the body.
+    body = _get_range(client, bucket, key, head.get('ETag'), start, stop)["Body"]
+    if len(ranges) > 1:
+        boundary = uuid.uuid4().hex
+        chunks = _iter_byteranges(client, bucket, key, head.get('ETag'), ranges, length, content_type, boundary, chunk_size, body)
+        response = Response(chunks, status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+        response.call_on_close(body.close)
+        return response
+
+    response = Response(iter_body(body, chunk_size), status=206, content_type=content_type)
+    response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{length}'
+    response.headers['Content-Length'] = str(stop - start)
+    response.call_on_close(body.close)
+    return response
+
+
+def _cached_object_response(path, head, encode_base64, chunk_size):
+    try:
+        if encode_base64:
+            f = open(path, 'rb')
+            response = Response(iter_base64(FileWrapper(f, chunk_size)), mimetype='text/plain')
+            response.call_on_close(f.close)
+        else:
+            # send_file hands the file to the server (wsgi.file_wrapper or X-Sendfile), it is not copied through Python.
+            response = send_file(path, mimetype=head.get('ContentType', 'application/octet-stream'), add_etags=False)
+            # The object is revalidated with its ETag as when it is streamed from S3, not cached as a static file.
+            response.headers.pop('Cache-Control', None)
+            response.headers.pop('Expires', None)
+    except FileNotFoundError:
+        # Evicted by another worker in the meantime.
+        return None
+
+    return response
+
+
+def s3_object_response(client, bucket, key, head, encode_base64=False, chunk_size=65536, max_bytes=None, coalesce_gap=0,
+                       disk_cache=None, max_ranges=None, refresh_head=None):
+    """
+    Stream an S3 object to the client of the current request.
+
+    head is the head_object response of the object, a conditional request (If-None-Match,
+    If-Modified-Since) for an object the client has already got is answered with a 304 without
+    requesting the object itself. The body is otherwise streamed chunk by chunk, optionally base64
+    encoded, with the ETag and Last-Modified of the object.
+
+    A Range request (not for base64 output) is answered with a 206 streaming a ranged get_object
+    of each range, the ranges less than coalesce_gap bytes apart are read as one, several ranges
+    are sent as multipart/byteranges. A Range header asking for more than max_ranges ranges is
+    ignored. Requests for max_bytes or more are refused with a 413, so objects too big to be
+    downloaded whole can still be read piece by piece.
+
+    Whole objects are served from disk_cache (an S3DiskCache) when it holds the version of the head,
+    and are otherwise stored in it while they are streamed.
+
+    head may come from a cache, when S3 answers that the object changed or went away since,
+    refresh_head() is called for a new head and the object is read once more with it.
+    """
+    try:
+        return _object_response(client, bucket, key, head, encode_base64, chunk_size, max_bytes, coalesce_gap, disk_cache,
+                                max_ranges)
+    except ClientError as err:
+        if refresh_head is None or not is_stale_head_error(err):
+            raise
+
+    return _object_response(client, bucket, key, refresh_head(), encode_base64, chunk_size, max_bytes, coalesce_gap,
+                            disk_cache, max_ranges)
+
+
+def _object_response(client, bucket, key, head, encode_base64, chunk_size, max_bytes, coalesce_gap, disk_cache, max_ranges):
+    etag = representation_etag(head.get('ETag'), encode_base64)
+    last_modified = _naive_utc(head.get('LastModified'))
+    length = head.get('ContentLength')
+    ranges = None
+    if not encode_base64 and length is not None and _if_range_matches(etag, last_modified):
+        ranges = parse_byte_ranges(request.headers.get('Range'), length, coalesce_gap)
+        # Every range is a get_object of its own, too many of them get the whole object instead.
+        if ranges and max_ranges is not None and len(ranges) > max_ranges:
+            ranges = None
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    elif ranges == []:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{length}'
+    elif ranges:
+        size = sum(stop - start for start, stop in ranges)
+        if max_bytes is not None and not size < max_bytes:
+            abort(413, description=f"Requested ranges too big to download: {size}")
+        response = _ranged_response(client, bucket, key, head, ranges, chunk_size)
+    else:
+        if max_bytes is not None and length and not length < max_bytes:
+            abort(413, description=f"File too big to download: {length}")
+        cached_path = disk_cache.get(bucket, key, head.get('ETag')) if disk_cache is not None else None
+        response = _cached_object_response(cached_path, head, encode_base64, chunk_size) if cached_path else None
+        if response is None:
+            s3_response = client.get_object(
+                Bucket=bucket,
+                Key=key,
+                RequestPayer="requester"
+            )
+            etag = representation_etag(s3_response.get('ETag'), encode_base64)
+            last_modified = _naive_utc(s3_response.get('LastModified'))
+            body = s3_response["Body"]
+            chunks = iter_body(body, chunk_size)
+            if disk_cache is not None:
+                chunks = disk_cache.store(bucket, key, s3_response.get('ETag'), chunks, s3_response.get('ContentLength'))
+            if encode_base64:
+                response = Response(iter_base64(chunks), mimetype='text/plain')
+            else:
+                response = Response(chunks, content_type=s3_response.get('ContentType', 'application/octet-stream'))
+                if s3_response.get('ContentLength') is not None:
+                    response.headers['Content-Length'] = str(s3_response['ContentLength'])
+            # The generator is not started when the client goes away before the body is sent.
+            response.call_on_close(body.close)
+
+    if not encode_base64:
+        response.headers['Accept-Ranges'] = 'bytes'
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.last_modified = last_modified
+
+    return response
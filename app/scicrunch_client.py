@@ -0,0 +1,224 @@
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from flask import Response
+from requests.adapters import HTTPAdapter
+
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.config import Config
+from app.shared_cache import make_cache_key
+from app.single_flight import SingleFlight
+
+# Status codes that are worth another attempt, anything else is handed back to the caller.
+RETRY_STATUS_CODES = frozenset([429, 502, 503, 504])
+# Headers of an upstream response that still hold when its body is handed on untouched.
+PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Encoding', 'Content-Length')
+PASSTHROUGH_CHUNK_SIZE = 64 * 1024
+
+
+class SciCrunchClient(object):
+    """
+    Shared HTTP client for the SciCrunch family of services.
+
+    A keep-alive connection pool is kept per host so repeated calls reuse the same
+    TLS connection, every call gets a (connect, read) timeout, connection failures and
+    gateway errors are retried a bounded number of times with jittered backoff and
+    the latency of each call is recorded against the endpoint name given by the caller.
+    Identical requests made while one is already in flight wait for that response
+    instead of going upstream again. A circuit breaker per upstream fails requests fast
+    while that upstream keeps failing, the upstreams are the base URLs of the services
+    (several of them are on the same host) and otherwise the hosts.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, max_retries=None, pool_size=None,
+                 backoff_base=0.25, backoff_cap=2.0, upstreams=None):
+        self.connect_timeout = Config.SCI_CRUNCH_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = Config.SCI_CRUNCH_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = Config.SCI_CRUNCH_MAX_RETRIES if max_retries is None else max_retries
+        self.pool_size = Config.SCI_CRUNCH_POOL_SIZE if pool_size is None else pool_size
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        if upstreams is None:
+            upstreams = [Config.SCI_CRUNCH_HOST, Config.SCI_CRUNCH_INTERLEX_HOST, Config.SCI_CRUNCH_SCIGRAPH_HOST,
+                         Config.SCI_CRUNCH_CITATIONS_HOST, Config.SCI_CRUNCH_QDB_HOST]
+        # The longest base URL a request URL starts with is its upstream.
+        self.upstreams = sorted((upstream.rstrip('/') for upstream in upstreams), key=len, reverse=True)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._sessions = {}
+        self._breakers = {}
+        self._sessions_lock = threading.Lock()
+        self.single_flight = SingleFlight(Config.SINGLE_FLIGHT_TIMEOUT)
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # A worker forked from a process that already made requests (gunicorn --preload) must not share
+        # its keep-alive sockets, locks or in flight calls.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _upstream(self, url):
+        for upstream in self.upstreams:
+            if url == upstream or url.startswith(f'{upstream}/') or url.startswith(f'{upstream}?'):
+                return upstream
+
+        return urlparse(url).netloc
+
+    def _session(self, url):
+        host = urlparse(url).netloc
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # Retries are handled in request() so they can be counted and jittered.
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+
+        return session
+
+    def _breaker(self, url):
+        upstream = self._upstream(url)
+        with self._sessions_lock:
+            breaker = self._breakers.get(upstream)
+            if breaker is None:
+                breaker = CircuitBreaker(Config.SCI_CRUNCH_BREAKER_FAILURES, Config.SCI_CRUNCH_BREAKER_RESET)
+                self._breakers[upstream] = breaker
+
+        return breaker
+
+    def _backoff(self, attempt):
+        # Full jitter, spreads out retries from concurrent workers.
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, endpoint, elapsed, retries, failed):
+        elapsed_ms = elapsed * 1000
+        with self._stats_lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = {'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0}
+                self._stats[endpoint] = stats
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['total_ms'] += elapsed_ms
+            stats['last_ms'] = elapsed_ms
+            if elapsed_ms > stats['max_ms']:
+                stats['max_ms'] = elapsed_ms
+            if failed:
+                stats['errors'] += 1
+
+    def request(self, method, url, endpoint=None, timeout=None, **kwargs):
+        if endpoint is None:
+            endpoint = urlparse(url).path
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        self._check_pid()
+
+        # A streamed body can only be read once, so it cannot be shared.
+        if kwargs.get('stream'):
+            return self._request(method, url, endpoint, timeout, **kwargs)
+
+        # The body of a non streamed response is read before it is returned, every
+        # waiter gets the same response object and decodes its own copy of the JSON.
+        key = (endpoint, method, url, make_cache_key(kwargs))
+        return self.single_flight.do(key, lambda: self._request(method, url, endpoint, timeout, **kwargs), group=endpoint)
+
+    def _request(self, method, url, endpoint, timeout, **kwargs):
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            self._record(endpoint, 0, 0, True)
+            raise CircuitOpenError(f'Circuit open for {self._upstream(url)}, not requesting {endpoint}')
+
+        session = self._session(url)
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError:
+                # Covers refused connections, connect timeouts and stale keep-alive sockets.
+                # Read timeouts are not retried, the upstream is already slow.
+                if attempt >= self.max_retries:
+                    self._record(endpoint, time.monotonic() - start, attempt, True)
+                    breaker.record_failure()
+                    raise
+            except requests.exceptions.RequestException:
+                self._record(endpoint, time.monotonic() - start, attempt, True)
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    failed = response.status_code >= 500
+                    self._record(endpoint, time.monotonic() - start, attempt, failed)
+                    if failed:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return response
+                response.close()
+
+            delay = self._backoff(attempt)
+            attempt += 1
+            logging.warning(f'Retrying SciCrunch request for {endpoint} (attempt {attempt}) in {delay:.2f}s')
+            time.sleep(delay)
+
+    def passthrough(self, method, url, endpoint=None, accept_encoding=None, **kwargs):
+        """
+        Proxy a request, returning a flask Response that streams the upstream body to the
+        client as it arrives. The body is neither decoded nor parsed: the upstream is asked
+        for an encoding the client accepts (accept_encoding, usually the Accept-Encoding
+        header of the client request) and the compressed bytes are passed on as they are.
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Accept-Encoding'] = accept_encoding or 'identity'
+        response = self.request(method, url, endpoint=endpoint, headers=headers, stream=True, **kwargs)
+
+        def body():
+            try:
+                yield from response.raw.stream(PASSTHROUGH_CHUNK_SIZE, decode_content=False)
+            finally:
+                response.close()
+
+        passed_headers = {name: response.headers[name] for name in PASSTHROUGH_HEADERS if name in response.headers}
+        passed_headers['Vary'] = 'Accept-Encoding'
+        proxied = Response(body(), status=response.status_code, headers=passed_headers)
+        # The body may never be read if the client goes away first.
+        proxied.call_on_close(response.close)
+        return proxied
+
+    def get(self, url, endpoint=None, **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def post(self, url, endpoint=None, **kwargs):
+        return self.request('POST', url, endpoint=endpoint, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = {endpoint: dict(values) for endpoint, values in self._stats.items()}
+
+        for values in snapshot.values():
+            values['avg_ms'] = values['total_ms'] / values['calls'] if values['calls'] else 0.0
+
+        return snapshot
+
+    def circuit_open(self, url):
+        self._check_pid()
+        with self._sessions_lock:
+            breaker = self._breakers.get(self._upstream(url))
+
+        return breaker is not None and breaker.is_open()
+
+    def breaker_stats(self):
+        with self._sessions_lock:
+            breakers = dict(self._breakers)
+
+        return {host: breaker.stats() for host, breaker in breakers.items()}
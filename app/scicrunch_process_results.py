@@ -1,8 +1,17 @@
 import importlib
 import re
 
+import ijson
+
 from flask import jsonify
-from app.scicrunch_processing_common import SKIPPED_OBJ_ATTRIBUTES
+from app.config import Config
+from app.fast_json import FastJSONEncoder
+from app.processed_result_cache import ProcessedResultCache
+from app.scicrunch_processing_common import CONTEXT_INFORMATION, OBJECT_RESULT_KEYS
+
+
+# Prepared hits of published dataset versions, shared by all the requests of the worker.
+processed_result_cache = ProcessedResultCache(Config.PROCESSED_RESULT_CACHE_SIZE, Config.PROCESSED_RESULT_CACHE_MAX_BYTES)
 
 
 def _convert_patch_to_x(version):
@@ -10,70 +19,179 @@ def _convert_patch_to_x(version):
 
 
 # process_kb_results: Loop through SciCrunch results pulling out desired attributes and processing DOIs and CSV files
-def _prepare_results(results):
-    output = []
-    hits = results['hits']['hits']
-    for i, hit in enumerate(hits):
-        try:
-            version = hit['_source']['item']['version']['keyword']
-            version = _convert_patch_to_x(version)
-        except KeyError:
-            # Try to get minimal information out from the datasets
-            version = 'undefined'
+#  When fields is given only those keys of each result are computed and returned.
+def _prepare_results(results, fields=None):
+    return [_prepare_hit(hit, results['took'], fields) for hit in results['hits']['hits']]
+
+
+def _prepare_hit(hit, took, fields=None):
+    try:
+        version = hit['_source']['item']['version']['keyword']
+        version = _convert_patch_to_x(version)
+    except KeyError:
+        # Try to get minimal information out from the datasets
+        version = 'undefined'
+
+    # A published dataset version does not change, only the hits that are not cached yet are processed.
+    key = _processed_result_key(hit, version)
+    cached = processed_result_cache.get(key) if key is not None else None
+    if cached is not None:
+        return _select_fields(cached, fields, took)
+
+    processor = get_processor(version)
+    # print_hit_structure(hit)
+    attr = processor.transform_attributes(hit)
+    attr['doi'] = _convert_doi_to_url(attr['doi'])
+    attr['took'] = took
+
+    # Find context files and sort the files by mime type in one go, datasets may have no objects.
+    #  The objects are copied without the unused information, the hit itself is not modified.
+    categories = None if fields is None else fields & OBJECT_RESULT_KEYS
+    if categories is None or categories:
+        context_files, sorted_files = processor.prepare_objects(attr['files'], categories=categories)
+    else:
+        context_files, sorted_files = [], {}
+    attr[CONTEXT_INFORMATION] = context_files
 
-        package_version = f'scicrunch_processing_v_{version.replace(".", "_")}'
-        m = importlib.import_module(f'app.{package_version}')
-        attributes_map = getattr(m, 'ATTRIBUTES_MAP')
-        sort_files_by_mime_type = getattr(m, 'sort_files_by_mime_type')
-        # print_hit_structure(hit)
-        attr = _transform_attributes(attributes_map, hit)
-        attr['doi'] = _convert_doi_to_url(attr['doi'])
-        attr['took'] = results['took']
-
-        # Hot fix for some datasets having no objects:
-        if 'objects' in hit['_source'].keys():
-            # Find context files by looking through object mimetypes.
-            attr['abi-contextual-information'] = [
-                file['dataset']['path']
-                for file in hit['_source']['objects']
-                if 'additional_mimetype' in file and \
-                   file['additional_mimetype']['name'].find('abi.context-information') != -1
-            ]
-        else:
-            attr['abi-contextual-information'] = []
+    try:
+        attr['readme'] = hit['_source']['item']['readme']['description']
+    except KeyError:
+        attr['readme'] = ''
 
-        try:
-            attr['readme'] = hit['_source']['item']['readme']['description']
-        except KeyError:
-            attr['readme'] = ''
+    try:
+        attr['title'] = hit['_source']['item']['name']
+    except KeyError:
+        attr['title'] = ''
 
-        try:
-            attr['title'] = hit['_source']['item']['name']
-        except KeyError:
-            attr['title'] = ''
+    attr.update(sorted_files)
+    # All files are sorted, files are not required anymore
+    del attr['files']
 
-        _remove_unused_files_information(attr['files'])
-        attr.update(sort_files_by_mime_type(attr['files']))
-        # All files are sorted, files are not required anymore
-        del attr['files']
-        output.append(attr)
+    # Only complete results are cached.
+    if fields is not None:
+        return _select_fields(attr, fields, took)
 
-    return output
+    if key is not None:
+        processed_result_cache.set(key, attr)
+        return dict(attr)
+
+    return attr
 
 
-# Remove unused attributes in the obj list, this does not need to be version dependent at this moment
-def _remove_unused_files_information(obj_list):
-    if not obj_list:
+def _select_fields(attr, fields, took):
+    if fields is None:
+        return dict(attr, took=took)
+
+    selected = {name: attr[name] for name in fields if name in attr}
+    if 'took' in fields:
+        selected['took'] = took
+    return selected
+
+
+def _processed_result_key(hit, version):
+    try:
+        pennsieve = hit['_source']['pennsieve']
+        # The metadata of a version can be revised (title, description, readme) without a new version.
+        revision = (pennsieve.get('revision') or {}).get('identifier')
+        return str(pennsieve['identifier']), str(pennsieve['version']['identifier']), str(revision), version
+    except (KeyError, TypeError, AttributeError):
         return None
 
-    for obj in obj_list:
-        for key in SKIPPED_OBJ_ATTRIBUTES:
-            if key in obj:
-                del obj[key]
+
+def process_results(results, fields=None):
+    return jsonify({'numberOfHits': results['hits']['total'], 'results': _prepare_results(results, fields)})
+
+
+# _stream_events: Read a SciCrunch response incrementally, yielding ('took', value), ('total', value) and
+#  ('hit', hit) as they are found. Only one raw hit is held in memory at a time however many hits are returned.
+def _stream_events(stream):
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == building and event in ('end_map', 'end_array'):
+                yield ('total' if building == 'hits.total' else 'hit'), builder.value
+                builder = None
+        elif prefix == 'took':
+            yield 'took', value
+        elif prefix == 'hits.total':
+            if event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                building = prefix
+            else:
+                yield 'total', value
+        elif prefix == 'hits.hits.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            building = prefix
+
+
+def _result_events(results):
+    yield 'took', results['took']
+    yield 'total', results['hits']['total']
+    for hit in results['hits']['hits']:
+        yield 'hit', hit
+
+
+# process_results_stream: Same output as process_results for a SciCrunch response that is still being read.
+#  The response is decoded incrementally and every hit is processed and released as soon as it is complete.
+def process_results_stream(stream, fields=None):
+    took = None
+    total = None
+    output = []
+    for kind, value in _stream_events(stream):
+        if kind == 'hit':
+            output.append(_prepare_hit(value, took, fields))
+        elif kind == 'took':
+            took = value
+        else:
+            total = value
+
+    # Elasticsearch writes 'took' first, in case it did not the hits are patched up afterwards.
+    if fields is None or 'took' in fields:
+        for attr in output:
+            attr['took'] = took
+
+    return jsonify({'numberOfHits': total, 'results': output})
+
+
+# The compact encoder jsonify uses, the lines are written one by one so sorting the keys is not worth it.
+_NDJSON_ENCODER = FastJSONEncoder(ensure_ascii=False, separators=(',', ':'))
 
 
-def process_results(results):
-    return jsonify({'numberOfHits': results['hits']['total'], 'results': _prepare_results(results)})
+def _ndjson_line(value):
+    return _NDJSON_ENCODER.encode(value) + '\n'
+
+
+def _ndjson_lines(events, fields):
+    took = None
+    total = None
+    started = False
+    for kind, value in events:
+        if kind == 'hit':
+            if not started:
+                started = True
+                yield _ndjson_line({'numberOfHits': total})
+            yield _ndjson_line(_prepare_hit(value, took, fields))
+        elif kind == 'took':
+            took = value
+        else:
+            total = value
+
+    if not started:
+        yield _ndjson_line({'numberOfHits': total})
+
+
+# process_results_ndjson: The output of process_results as newline delimited JSON lines, a {"numberOfHits": ...}
+#  line followed by one line per dataset, each written out as soon as the dataset is processed.
+def process_results_ndjson(results, fields=None):
+    return _ndjson_lines(_result_events(results), fields)
+
+
+# process_results_stream_ndjson: process_results_ndjson for a SciCrunch response that is still being read.
+def process_results_stream_ndjson(stream, fields=None):
+    return _ndjson_lines(_stream_events(stream), fields)
 
 
 # process the search result to get the first scaffold of the first dataset
@@ -107,9 +225,10 @@ def reform_anatomy_results(results):
     return {'result': processed_outputs}
 
 
-def reform_dataset_results(results):
+def reform_dataset_results(results, fields=None):
     processed_outputs = []
-    kb_results = _prepare_results(results)
+    # The version picks the processing of each result, it is prepared even when it was not asked for.
+    kb_results = _prepare_results(results, None if fields is None else fields | {'version'})
     for kb_result in kb_results:
         try:
             version = kb_result['version']
@@ -117,10 +236,10 @@ def reform_dataset_results(results):
         except KeyError:
             # Try to get minimal information out from the datasets
             version = 'undefined'
-        package_version = f'scicrunch_processing_v_{version.replace(".", "_")}'
-        m = importlib.import_module(f'app.{package_version}')
-        process_result = getattr(m, 'process_result')
-        processed_outputs.append(process_result(kb_result))
+        output = get_processor(version).process_result(kb_result)
+        if fields is not None:
+            output = {name: value for name, value in output.items() if name in fields}
+        processed_outputs.append(output)
 
     return {'result': processed_outputs}
 
@@ -133,27 +252,87 @@ def reform_aggregation_results(results):
     return processed_results
 
 
+# Concatenate the buckets of each facet aggregation, keeping the order in which the aggregations were requested.
+def reform_facet_results(results, aggregation_names):
+    terms = []
+    aggregations = results.get('aggregations', {})
+    for name in aggregation_names:
+        terms += aggregations.get(name, {}).get('buckets', [])
+
+    return terms
+
+
 def _convert_doi_to_url(doi):
     if not doi:
         return doi
     return doi.replace('DOI:', 'https://doi.org/')
 
 
-# _transform_attributes: Use 'attributes' (defined per version) to step through the large sci-crunch result dict
-#  and cherry-pick the attributes of interest
-def _transform_attributes(attributes_, dataset):
-    found_attr = {}
-    for k, attr in attributes_.items():
-        subset = dataset['_source']  # set our subset to the full dataset result
-        key_attr = False
-        for n, key in enumerate(attr):
-            if isinstance(subset, dict):
-                if key in subset.keys():  # continue if keys are found
-                    subset = subset[key]
-                    if n + 1 is len(attr):  # if we made it to the end, save this subset
-                        key_attr = subset
-        found_attr[k] = key_attr
-    return found_attr
+# _walk_attribute_path: Step through the large sci-crunch result dict along one 'attributes' path (defined per version).
+#  Keys that are not found are skipped, the value is only kept when the last key of the path is found.
+def _walk_attribute_path(source, path):
+    subset = source
+    key_attr = False
+    for n, key in enumerate(path):
+        if isinstance(subset, dict):
+            if key in subset:  # continue if keys are found
+                subset = subset[key]
+                if n + 1 == len(path):  # if we made it to the end, save this subset
+                    key_attr = subset
+    return key_attr
+
+
+# _compile_attributes_map: Generate a function that cherry-picks all the attributes of interest of a dataset at once.
+#  Every path is read with a direct chain of lookups, a path that is not complete in the dataset falls back to
+#  _walk_attribute_path so the result is the same as walking each path.
+def _compile_attributes_map(attributes_map):
+    lines = [
+        'def transform_attributes(dataset):',
+        '    source = dataset["_source"]',
+        '    found_attr = {}'
+    ]
+    for name, path in attributes_map.items():
+        if not path:
+            lines.append(f'    found_attr[{name!r}] = False')
+            continue
+        lookup = ''.join(f'[{key!r}]' for key in path)
+        lines += [
+            '    try:',
+            f'        found_attr[{name!r}] = source{lookup}',
+            '    except (KeyError, TypeError):',
+            f'        found_attr[{name!r}] = _walk_attribute_path(source, {tuple(path)!r})'
+        ]
+    lines.append('    return found_attr')
+
+    namespace = {'_walk_attribute_path': _walk_attribute_path}
+    exec('\n'.join(lines), namespace)
+    return namespace['transform_attributes']
+
+
+class ResultProcessor(object):
+    """
+    The processing functions of one scicrunch_processing_v_* module, with its ATTRIBUTES_MAP compiled.
+    """
+
+    def __init__(self, module):
+        self.attributes_map = module.ATTRIBUTES_MAP
+        self.transform_attributes = _compile_attributes_map(module.ATTRIBUTES_MAP)
+        self.sort_files_by_mime_type = module.sort_files_by_mime_type
+        self.prepare_objects = module.prepare_objects
+        self.process_result = module.process_result
+
+
+# Processors by version ('1.2.X', 'undefined', ...), each version module is imported and compiled on first use.
+_processors = {}
+
+
+def get_processor(version):
+    processor = _processors.get(version)
+    if processor is None:
+        processor = ResultProcessor(importlib.import_module(f'app.scicrunch_processing_v_{version.replace(".", "_")}'))
+        _processors[version] = processor
+
+    return processor
 
 
 # Manipulate the output to make it easier to use in the front-end.
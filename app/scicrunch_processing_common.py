@@ -1,3 +1,7 @@
+import functools
+import logging
+
+from app.name_map_index import name_map
 from app.scicrunch_processing_skipped_mimetypes import SKIPPED_MIME_TYPES
 
 NOT_SPECIFIED = 'not-specified'
@@ -67,6 +71,10 @@ MAPPED_MIME_TYPES = {
     'video/mp4': VIDEO
 }
 
+CONTEXT_INFORMATION = 'abi-contextual-information'
+# The keys of a dataset result that are filled from the objects of the dataset.
+OBJECT_RESULT_KEYS = frozenset([*MAPPED_MIME_TYPES.values(), CONTEXT_INFORMATION])
+
 SKIPPED_OBJ_ATTRIBUTES = [
     'bytes',
     'checksums',
@@ -76,27 +84,109 @@ SKIPPED_OBJ_ATTRIBUTES = [
 ]
 
 
-def map_mime_type(mime_type, obj):
+SKIPPED_MIME_TYPE_SET = frozenset(SKIPPED_MIME_TYPES)
+# Images of these types are only listed when they are not derived files.
+PRIMARY_ONLY_MIME_TYPES = frozenset(['image/jpeg', 'image/png'])
+
+
+# Classify a raw mime type string, the result does not depend on the object so it is memoised.
+#  Returns the category and whether the category only applies to files outside of the derivative folder.
+@functools.lru_cache(maxsize=4096)
+def classify_mime_type(mime_type):
     mime_type = mime_type.strip()
 
     if mime_type == '':
-        return SKIP
+        return SKIP, False
 
     if mime_type == NOT_SPECIFIED:
-        return SKIP
+        return SKIP, False
 
     lower_mime_type = mime_type.lower()
 
-    if lower_mime_type in SKIPPED_MIME_TYPES:
-        return SKIP
+    if lower_mime_type in SKIPPED_MIME_TYPE_SET:
+        return SKIP, False
 
     if lower_mime_type in MAPPED_MIME_TYPES:
-        if lower_mime_type in ["image/jpeg", "image/png"]:
+        return MAPPED_MIME_TYPES[lower_mime_type], lower_mime_type in PRIMARY_ONLY_MIME_TYPES
+
+    return NOT_SPECIFIED, False
+
+
+def map_mime_type(mime_type, obj):
+    category, primary_only = classify_mime_type(mime_type)
+    if primary_only:
+        try:
+            if obj['dataset']['path'].startswith('derivative'):
+                return SKIP
+        except KeyError:
+            return SKIP
+
+    return category
+
+
+SKIPPED_OBJ_ATTRIBUTE_SET = frozenset(SKIPPED_OBJ_ATTRIBUTES)
+
+
+# Prepare the objects of a dataset in one pass over the list:
+#  - find the context information files (by the path given in the index),
+#  - sort the objects into their mime type categories, when sort_files is set (only into the given categories),
+#  - drop the unused attributes and rewrite mangled paths from the name map.
+#  The objects that are kept are compact copies, the objects of the search result are left untouched.
+#  Each distinct mime type string is only classified once and unhandled mime types are reported once per call.
+def prepare_objects(obj_list, sort_files=True, categories=None):
+    context_files = []
+    sorted_files = {}
+    if not obj_list:
+        return context_files, sorted_files
+
+    classified = {}
+    unhandled = set()
+    for obj in obj_list:
+
+        mime_type = obj.get('additional_mimetype', NOT_SPECIFIED)
+        if mime_type != NOT_SPECIFIED:
+            if mime_type['name'].find('abi.context-information') != -1:
+                context_files.append(obj['dataset']['path'])
+            mime_type = mime_type.get('name')
+
+        if not sort_files:
+            continue
+
+        if not mime_type:
+            mime_type = obj['mimetype'].get('name', NOT_SPECIFIED)
+
+        classification = classified.get(mime_type)
+        if classification is None:
+            classification = classified[mime_type] = classify_mime_type(mime_type)
+        mapped_mime_type, primary_only = classification
+        if primary_only:
             try:
                 if obj['dataset']['path'].startswith('derivative'):
-                    return SKIP
+                    continue
             except KeyError:
-                return SKIP
-        return MAPPED_MIME_TYPES[lower_mime_type]
+                continue
+
+        if mapped_mime_type == NOT_SPECIFIED:
+            unhandled.add(mime_type)
+        elif mapped_mime_type != SKIP and (categories is None or mapped_mime_type in categories):
+            compact = {key: value for key, value in obj.items() if key not in SKIPPED_OBJ_ATTRIBUTE_SET}
+            if 'dataset' in obj and 'path' in obj['dataset']:
+                dataset_path = 'files/' + obj['dataset']['path']
+                if dataset_path in name_map:
+                    compact['dataset'] = dict(obj['dataset'], path=name_map[dataset_path].replace('files/', '', 1))
+
+            files = sorted_files.get(mapped_mime_type)
+            if files is None:
+                sorted_files[mapped_mime_type] = [compact]
+            else:
+                files.append(compact)
+
+    for mime_type in sorted(unhandled):
+        logging.warning(f'Unhandled mime type: {mime_type}')
+
+    return context_files, sorted_files
+
 
-    return NOT_SPECIFIED
+# Sort the objects of a dataset into their mime type categories, shared by the processing versions.
+def sort_files_by_mime_type(obj_list):
+    return prepare_objects(obj_list)[1]
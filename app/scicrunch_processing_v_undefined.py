@@ -1,4 +1,5 @@
 from app.scicrunch_processing_common import PASS_THROUGH_KEYS as BASE_PASS_THROUGH_KEYS
+from app.scicrunch_processing_common import prepare_objects as common_prepare_objects
 
 PASS_THROUGH_KEYS = ["doi", "dataset_identifier", "dataset_version", "dataset_revision", *BASE_PASS_THROUGH_KEYS]
 
@@ -26,6 +27,11 @@ def sort_files_by_mime_type(obj_list):
     return {}
 
 
+# Only the context information files are looked for, the objects are not sorted.
+def prepare_objects(obj_list, categories=None):
+    return common_prepare_objects(obj_list, sort_files=False)
+
+
 def process_result(result):
     output = dict(filter(lambda x: x[0] in PASS_THROUGH_KEYS, result.items()))
     return output
@@ -1,3 +1,10 @@
+import functools
+import importlib
+import os
+import pkgutil
+
+from app.scicrunch_processing_common import OBJECT_RESULT_KEYS, SKIPPED_OBJ_ATTRIBUTES
+
 #Hardcoded list for getting whole body scaffold,
 #Update this list as needed
 BODY_SCAFFOLD_DATASET = {
@@ -8,6 +15,79 @@ BODY_SCAFFOLD_DATASET = {
 }
 
 
+# Parts of a dataset read by _prepare_results on top of the ATTRIBUTES_MAP paths.
+DATASET_RESULT_EXTRA_PATHS = [
+    'item.version.keyword',
+    'item.readme.description',
+    'item.name',
+    'objects'
+]
+
+
+# Parts of a dataset that are read whichever fields of the results are selected, to pick the processing
+#  version and to look up the processed result cache.
+DATASET_RESULT_KEY_PATHS = [
+    'item.version.keyword',
+    'pennsieve.identifier',
+    'pennsieve.version.identifier',
+    'pennsieve.revision.identifier'
+]
+# Result keys that do not come from an ATTRIBUTES_MAP.
+DATASET_RESULT_FIELD_PATHS = {
+    'readme': ['item.readme.description'],
+    'title': ['item.name']
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _attribute_paths():
+    # The processing modules import the app, so they are only loaded once the first query is built.
+    paths = {}
+    for module_info in pkgutil.iter_modules([os.path.dirname(__file__)]):
+        if module_info.name.startswith('scicrunch_processing_v_'):
+            module = importlib.import_module(f'app.{module_info.name}')
+            for name, path in module.ATTRIBUTES_MAP.items():
+                paths.setdefault(name, set()).add('.'.join(path))
+
+    return paths
+
+
+@functools.lru_cache(maxsize=256)
+def _dataset_result_source(fields):
+    attribute_paths = _attribute_paths()
+    if fields is None:
+        includes = set(DATASET_RESULT_EXTRA_PATHS)
+        for paths in attribute_paths.values():
+            includes.update(paths)
+    else:
+        includes = set(DATASET_RESULT_KEY_PATHS)
+        for field in fields:
+            includes.update(attribute_paths.get(field, ()))
+            includes.update(DATASET_RESULT_FIELD_PATHS.get(field, ()))
+            if field in OBJECT_RESULT_KEYS:
+                includes.add('objects')
+
+    return tuple(sorted(includes)), tuple(f'objects.{key}' for key in SKIPPED_OBJ_ATTRIBUTES)
+
+
+# dataset_result_source: The _source filter for queries whose hits are processed into dataset results,
+#  only the parts of a dataset that one of the processing versions reads are requested from SciCrunch.
+#  With fields, only the parts needed for those keys of the results are requested.
+def dataset_result_source(fields=None):
+    includes, excludes = _dataset_result_source(None if fields is None else frozenset(fields))
+    return {
+        "includes": list(includes),
+        "excludes": list(excludes)
+    }
+
+
+def _project(query, projected, fields=None):
+    if projected:
+        query["_source"] = dataset_result_source(fields)
+
+    return query
+
+
 def create_query_string(query_string):
     return {
         "from": 0,
@@ -20,46 +100,46 @@ def create_query_string(query_string):
     }
 
 
-def create_doi_query(doi):
-    return {
+def create_doi_query(doi, projected=True, fields=None):
+    return _project({
         "query": {
             "term": {
                 "item.curie": doi
             }
         }
-    }
+    }, projected, fields)
 
 
-def create_multiple_doi_query(dois):
-    return {
+def create_multiple_doi_query(dois, projected=True, fields=None):
+    return _project({
         "size": 999,
         "query": {
             "terms": {
                 "item.curie": dois
             }
         }
-    }
+    }, projected, fields)
 
 
-def create_multiple_discoverId_query(ids):
-    return {
+def create_multiple_discoverId_query(ids, projected=True, fields=None):
+    return _project({
         "size": 999,
         "query": {
             "terms": {
                 "pennsieve.identifier": ids
             }
         }
-    }
+    }, projected, fields)
 
 
-def create_title_query(title):
+def create_title_query(title, projected=True, fields=None):
     parts = title.split(' ')
     alphanum_parts = []
     for p in parts:
         alphanum_parts.append(''.join(e for e in p if e.isalnum()))
 
     query = ['(' + p + ')' for p in alphanum_parts if p]
-    return {
+    return _project({
         "size": 10,
         "from": 0,
         "query": {
@@ -70,7 +150,7 @@ def create_title_query(title):
                 "query": " AND ".join(query)
             }
         }
-    }
+    }, projected, fields)
 
 
 def create_anatomy_query(identifier):
@@ -92,11 +172,11 @@ def create_anatomy_query(identifier):
     }
 
 
-def create_identifier_query(identifier):
+def create_identifier_query(identifier, projected=True, fields=None):
     parts = identifier.split(':')
     query = f'*{parts[1]}'
 
-    return {
+    return _project({
         "size": 10,
         "from": 0,
         "query": {
@@ -107,17 +187,17 @@ def create_identifier_query(identifier):
                 "query": query
             }
         }
-    }
+    }, projected, fields)
 
 
-def create_pennsieve_identifier_query(identifier):
-    return {
+def create_pennsieve_identifier_query(identifier, projected=True, fields=None):
+    return _project({
         "query": {
             "term": {
                 "pennsieve.identifier.aggregate": identifier
             }
         }
-    }
+    }, projected, fields)
 
 
 def create_field_query(field, search_term, size=10, from_=0):
@@ -199,7 +279,7 @@ def create_doi_request(doi):
     return query
 
 
-def create_multiple_mimetype_query(mimetype_query):
+def create_multiple_mimetype_query(mimetype_query, projected=True, fields=None):
     query = {
         "query": {
             "query_string": {
@@ -210,48 +290,49 @@ def create_multiple_mimetype_query(mimetype_query):
             }
         }
     }
-    return query
+    return _project(query, projected, fields)
 
 # create_facet_query(type): Generates facet search request data for sci-crunch  given a 'type'; where
-# 'type' is either 'species', 'gender', or 'organ' at this stage.
-#  Returns a tuple of the type-map and request data ( type_map, data )
+# 'type' is one of the keys of the facet type map ('species', 'sex', 'organ', ...).
+#  Every SciCrunch path of the type gets its own named aggregation so all of them are answered by a single request.
+#  Returns the request data, the aggregation names are in the same order as the paths in the type map.
 def create_facet_query(type_):
-    data = {
-        "from": 0,
-        "size": 0,
-        "aggregations": {
-            f"{type_}": {
-                "terms": {
-                    "field": "",
-                    "size": 200,
-                    "order": [
-                        {
-                            "_count": "desc"
-                        },
-                        {
-                            "_key": "asc"
-                        }
-                    ]
-                }
+    aggregations = {}
+    for index, path in enumerate(get_facet_type_map()[type_]):
+        aggregations[f"{type_}_{index}"] = {
+            "terms": {
+                "field": path,
+                "size": 200,
+                "order": [
+                    {
+                        "_count": "desc"
+                    },
+                    {
+                        "_key": "asc"
+                    }
+                ]
             }
         }
-    }
 
-    return get_facet_type_map(), data
+    return {
+        "from": 0,
+        "size": 0,
+        "aggregations": aggregations
+    }
 
 
 # create_facet_query(query, terms, facets, size, start): Generates filter search request data for SciCrunch
 #  All inputs to facet query have defaults defined as 'None' (this is done so we can directly take in URL params
 #  as input).
 #  Returns a json query to be used in a SciCrunch request as request json data
-def create_filter_request(query, terms, facets, size, start):
+def create_filter_request(query, terms, facets, size, start, fields=None):
     if size is None:
         size = 10
     if start is None:
         start = 0
 
     if not query and not terms and not facets:
-        return {"size": size, "from": start}
+        return _project({"size": size, "from": start}, fields is not None, fields)
 
     # Data structure of a sci-crunch search
     data = {
@@ -266,7 +347,7 @@ def create_filter_request(query, terms, facets, size, start):
 
     qs = facet_query_string(query, terms, facets, get_facet_type_map())
     data["query"]["query_string"]["query"] = qs
-    return data
+    return _project(data, fields is not None, fields)
 
 # Get the id for the current body scaffold dataset id
 # of the specified species
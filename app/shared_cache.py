@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_cache_key(value):
+    """
+    Hash a JSON serialisable value into a stable key, dict ordering does not matter.
+    """
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SharedCache(object):
+    """
+    TTL and byte-budgeted LRU cache stored in a SQLite file so that every gunicorn
+    worker on the host reads and writes the same entries. Several caches can live in
+    the same file, each one is identified by its namespace. Any database error is
+    logged and treated as a cache miss, the cache must never fail a request.
+
+    A hit only writes to the database when the access time of the entry is more than
+    touch_interval old (by default a hundredth of the TTL, at most a minute), the
+    counters are kept in memory and written every flush_interval seconds, and the total
+    size of each namespace is kept up to date as entries are written and removed, so
+    reads do not queue up on the write lock of the database.
+    """
+
+    def __init__(self, path, namespace, ttl, max_bytes, touch_interval=None, flush_interval=10):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.touch_interval = min(60.0, ttl / 100) if touch_interval is None else touch_interval
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._counters = {}
+        self._counters_lock = threading.Lock()
+        self._flushed_at = time.time()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def _connection(self):
+        # Connections are per thread and must not survive a fork into a new worker.
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                           'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, '
+                           'expires REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))')
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (namespace, accessed)')
+        connection.execute('CREATE TABLE IF NOT EXISTS cache_counters ('
+                           'namespace TEXT NOT NULL, name TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (namespace, name))')
+        # Total size of the entries of each namespace, filled in from the entries for a file written before it existed.
+        connection.execute('CREATE TABLE IF NOT EXISTS cache_sizes (namespace TEXT PRIMARY KEY, total INTEGER NOT NULL)')
+        connection.execute('INSERT OR IGNORE INTO cache_sizes (namespace, total) '
+                           'SELECT ?, COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?', (self.namespace, self.namespace))
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def _flush_counters(self, connection, force=False):
+        with self._counters_lock:
+            if not self._counters or not (force or time.time() - self._flushed_at >= self.flush_interval):
+                return
+            counters = self._counters
+            self._counters = {}
+            self._flushed_at = time.time()
+
+        try:
+            connection.executemany('INSERT INTO cache_counters (namespace, name, value) VALUES (?, ?, ?) '
+                                   'ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value',
+                                   [(self.namespace, name, value) for name, value in counters.items()])
+        except sqlite3.Error:
+            # Kept for the next flush.
+            with self._counters_lock:
+                for name, value in counters.items():
+                    self._counters[name] = self._counters.get(name, 0) + value
+            raise
+
+    def _add_size(self, connection, amount):
+        connection.execute('UPDATE cache_sizes SET total = total + ? WHERE namespace = ?', (amount, self.namespace))
+
+    def _delete(self, connection, key):
+        row = connection.execute('SELECT size FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key)).fetchone()
+        if row is not None:
+            connection.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+            self._add_size(connection, -row[0])
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute('SELECT value, expires, accessed FROM cache_entries WHERE namespace = ? AND key = ?',
+                                     (self.namespace, key)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    with connection:
+                        connection.execute('BEGIN IMMEDIATE')
+                        self._delete(connection, key)
+                self._count('misses')
+                self._flush_counters(connection)
+                return None
+
+            # The least recently used order only needs to be right to within touch_interval.
+            if now - row[2] >= self.touch_interval:
+                connection.execute('UPDATE cache_entries SET accessed = ? WHERE namespace = ? AND key = ?', (now, self.namespace, key))
+            self._count('hits')
+            self._flush_counters(connection)
+            return row[0]
+        except sqlite3.Error as err:
+            logging.warning(f'Shared cache {self.namespace} read failed: {err}')
+            return None
+
+    def set(self, key, value, ttl=None):
+        if not self.enabled:
+            return
+
+        size = len(value)
+        # A single entry is not allowed to flush most of the cache.
+        if size > self.max_bytes // 4:
+            logging.debug(f'Shared cache {self.namespace} entry of {size} bytes not stored')
+            self._count('skipped')
+            return
+
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                self._delete(connection, key)
+                connection.execute('INSERT INTO cache_entries (namespace, key, value, size, expires, accessed) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)', (self.namespace, key, sqlite3.Binary(value), size, expires, now))
+                self._add_size(connection, size)
+                self._evict(connection)
+            self._flush_counters(connection)
+        except sqlite3.Error as err:
+            logging.warning(f'Shared cache {self.namespace} write failed: {err}')
+
+    def delete(self, key):
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN IMMEDIATE')
+                self._delete(connection, key)
+        except sqlite3.Error as err:
+            logging.warning(f'Shared cache {self.namespace} delete failed: {err}')
+
+    def _total(self, connection):
+        return connection.execute('SELECT total FROM cache_sizes WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+
+    def _evict(self, connection):
+        if self._total(connection) <= self.max_bytes:
+            return
+
+        now = time.time()
+        expired = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ? AND expires < ?',
+                                     (self.namespace, now)).fetchone()[0]
+        connection.execute('DELETE FROM cache_entries WHERE namespace = ? AND expires < ?', (self.namespace, now))
+        self._add_size(connection, -expired)
+        excess = self._total(connection) - self.max_bytes
+        if excess <= 0:
+            return
+
+        evicted = []
+        evicted_bytes = 0
+        for key, size in connection.execute('SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed',
+                                            (self.namespace,)):
+            evicted.append((self.namespace, key))
+            evicted_bytes += size
+            if evicted_bytes >= excess:
+                break
+        connection.executemany('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', evicted)
+        self._add_size(connection, -evicted_bytes)
+        self._count('evictions', len(evicted))
+
+    def get_json(self, key):
+        value = self.get(key)
+        if value is None:
+            return None
+
+        return json.loads(value)
+
+    def set_json(self, key, value, ttl=None):
+        self.set(key, json.dumps(value, separators=(',', ':')).encode('utf-8'), ttl)
+
+    def stats(self):
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'skipped': 0, 'entries': 0, 'bytes': 0}
+        try:
+            connection = self._connection()
+            self._flush_counters(connection, force=True)
+            for name, value in connection.execute('SELECT name, value FROM cache_counters WHERE namespace = ?', (self.namespace,)):
+                stats[name] = value
+            stats['entries'] = connection.execute('SELECT COUNT(*) FROM cache_entries WHERE namespace = ?',
+                                                  (self.namespace,)).fetchone()[0]
+            stats['bytes'] = self._total(connection)
+        except sqlite3.Error as err:
+            logging.warning(f'Shared cache {self.namespace} stats failed: {err}')
+
+        return stats
@@ -0,0 +1,81 @@
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Coalesce identical calls that are in flight at the same time.
+
+    The first caller for a key runs the function, callers arriving with the same key while
+    it runs wait for its result (or exception) instead of repeating the work. A waiter gives
+    up after the timeout and runs the function itself, so a stuck leader can only delay the
+    others for that long. Callers share the returned object and must not modify it.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, group, name):
+        stats = self._stats.get(group)
+        if stats is None:
+            stats = {'calls': 0, 'coalesced': 0, 'timeouts': 0}
+            self._stats[group] = stats
+        stats[name] += 1
+
+    def do(self, key, fn, timeout=None, group=None):
+        if group is None:
+            group = key[0] if isinstance(key, tuple) else key
+        if timeout is None:
+            timeout = self.timeout
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self._count(group, 'calls')
+            else:
+                call.waiters += 1
+                leader = False
+                self._count(group, 'coalesced')
+
+        if not leader:
+            if call.done.wait(timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+
+            with self._lock:
+                self._count(group, 'timeouts')
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as err:
+            # Also a timeout or exit interrupting the leader, the waiters must not take the missing result for None.
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            snapshot = {group: dict(values) for group, values in self._stats.items()}
+            in_flight = len(self._calls)
+
+        return {'groups': snapshot, 'in_flight': in_flight}
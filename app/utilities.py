@@ -1,6 +1,6 @@
 import base64
 from io import BytesIO
-from app.manifest_name_to_discover_name import name_map
+from app.name_map_index import name_map
 import os
 
 def get_path_from_mangled_list(s3_path):
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the JSON encoding of the app responses.
+
+Compares the app encoder (app.fast_json.FastJSONEncoder, orjson backed when orjson is
+installed) with the standard library encoder Flask uses by default, called the way
+jsonify calls them, on the payload of a /filter-search/ page and of a 999 hit
+/dataset_info/using_multiple_dois response. Pass recorded responses of any endpoint
+as arguments to encode those instead.
+
+    python -m scripts.benchmark_json_encoding [response.json ...] [--repeat 20]
+"""
+import argparse
+import json
+import time
+
+from flask.json import JSONEncoder
+
+from app import fast_json
+from app.fast_json import FastJSONEncoder
+from app.scicrunch_process_results import _prepare_results
+from scripts.benchmark_object_pipeline import synthetic_hits as synthetic_object_hits
+from scripts.benchmark_result_processing import synthetic_hits
+
+
+def processed_results(hit_count, objects_per_hit):
+    hits = synthetic_hits(hit_count)
+    for hit, object_hit in zip(hits, synthetic_object_hits(hit_count, objects_per_hit)):
+        hit['_source']['objects'] = object_hit['_source']['objects']
+        hit['_source']['item']['name'] = f'Dataset {hit["_source"]["item"]["name"][8:]} – Schwann cells µCT'
+    results = {'took': 12, 'hits': {'total': hit_count, 'hits': hits}}
+    return {'numberOfHits': hit_count, 'results': _prepare_results(results)}
+
+
+def encode(cls, payload, ensure_ascii):
+    # As flask.jsonify encodes, it adds the trailing newline itself.
+    return json.dumps(payload, cls=cls, sort_keys=True, separators=(',', ':'), ensure_ascii=ensure_ascii) + '\n'
+
+
+def cpu_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.process_time()
+        function()
+        times.append(time.process_time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('responses', nargs='*', help='recorded JSON responses')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    samples = []
+    for path in args.responses:
+        with open(path) as f:
+            samples.append((path, json.load(f)))
+    if not samples:
+        samples.append(('/filter-search/ page of 20 datasets', processed_results(20, 200)))
+        samples.append(('using_multiple_dois with 999 datasets', processed_results(999, 20)))
+
+    print(f'FastJSONEncoder backend: {"orjson " + fast_json.orjson.__version__ if fast_json.orjson else "standard library"}')
+    for name, payload in samples:
+        stdlib_output = encode(JSONEncoder, payload, True)
+        fast_output = encode(FastJSONEncoder, payload, False)
+        assert json.loads(fast_output) == json.loads(stdlib_output), 'the encoders disagree'
+        stdlib = cpu_time(lambda: encode(JSONEncoder, payload, True), args.repeat)
+        fast = cpu_time(lambda: encode(FastJSONEncoder, payload, False), args.repeat)
+        print(f'{name}: {len(stdlib_output.encode("utf-8")) / 1024:.0f} KiB')
+        print(f'  standard library {stdlib * 1000:8.2f} ms cpu per response')
+        print(f'  FastJSONEncoder  {fast * 1000:8.2f} ms cpu per response'
+              f'  ({stdlib / fast:.1f}x, {(stdlib - fast) * 1000:.2f} ms saved)')
+
+
+if __name__ == '__main__':
+    main()
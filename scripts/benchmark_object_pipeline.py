@@ -0,0 +1,168 @@
+"""
+Micro-benchmark of the preparation of the objects (files) of SciCrunch search results.
+
+Compares the single pass prepare_objects of app.scicrunch_processing_common with the
+previous three passes over the objects of every hit (collect the context information
+files, delete the unused attributes, sort by mime type and rewrite the mangled paths).
+The previous passes modify the objects of the hits in place, they are measured as they
+were and on copies of the objects, which they need for the hits to stay untouched. Pass
+recorded SciCrunch _search responses as arguments, otherwise a synthetic response of
+large datasets is used.
+
+    python -m scripts.benchmark_object_pipeline [response.json ...] [--repeat 10]
+"""
+import argparse
+import copy
+import json
+import time
+import tracemalloc
+
+from app.name_map_index import name_map
+from app.scicrunch_processing_common import NOT_SPECIFIED, SKIP, SKIPPED_OBJ_ATTRIBUTES, map_mime_type, \
+    prepare_objects
+
+
+def legacy_context_files(objects):
+    return [
+        file['dataset']['path']
+        for file in objects
+        if 'additional_mimetype' in file and file['additional_mimetype']['name'].find('abi.context-information') != -1
+    ]
+
+
+def legacy_remove_unused_files_information(obj_list):
+    if not obj_list:
+        return None
+
+    for obj in obj_list:
+        for key in SKIPPED_OBJ_ATTRIBUTES:
+            if key in obj:
+                del obj[key]
+
+
+def legacy_sort_files_by_mime_type(obj_list):
+    sorted_files = {}
+    if not obj_list:
+        return sorted_files
+
+    for obj in obj_list:
+        mime_type = obj.get('additional_mimetype', NOT_SPECIFIED)
+        if mime_type != NOT_SPECIFIED:
+            mime_type = mime_type.get('name')
+
+        if not mime_type:
+            mime_type = obj['mimetype'].get('name', NOT_SPECIFIED)
+
+        mapped_mime_type = map_mime_type(mime_type, obj)
+        if mapped_mime_type not in (NOT_SPECIFIED, SKIP):
+            if 'dataset' in obj and 'path' in obj['dataset']:
+                dataset_path = 'files/' + obj['dataset']['path']
+                if dataset_path in name_map:
+                    obj['dataset']['path'] = name_map[dataset_path].replace('files/', '', 1)
+
+            sorted_files.setdefault(mapped_mime_type, []).append(obj)
+
+    return sorted_files
+
+
+def legacy_prepare(hits):
+    output = []
+    for hit in hits:
+        objects = hit['_source'].get('objects', [])
+        context_files = legacy_context_files(objects)
+        legacy_remove_unused_files_information(objects)
+        output.append((context_files, legacy_sort_files_by_mime_type(objects)))
+    return output
+
+
+def legacy_prepare_copies(hits):
+    output = []
+    for hit in hits:
+        objects = [dict(obj, dataset=dict(obj['dataset'])) if 'dataset' in obj else dict(obj)
+                   for obj in hit['_source'].get('objects', [])]
+        context_files = legacy_context_files(objects)
+        legacy_remove_unused_files_information(objects)
+        output.append((context_files, legacy_sort_files_by_mime_type(objects)))
+    return output
+
+
+def fused_prepare(hits):
+    return [prepare_objects(hit['_source'].get('objects', [])) for hit in hits]
+
+
+def synthetic_hits(count, objects_per_hit):
+    mangled_paths = [key.replace('files/', '', 1) for key, _ in zip(name_map, range(objects_per_hit // 10))]
+    mime_types = ['text/csv', 'image/jpeg', 'image/png', 'application/json', 'image/jp2', 'video/mp4',
+                  'application/x.vnd.abi.context-information+json', 'inode/vnd.abi.scaffold+file', 'model/stl']
+    hits = []
+    for i in range(count):
+        objects = []
+        for j in range(objects_per_hit):
+            folder = 'derivative' if j % 3 == 0 else 'primary'
+            path = mangled_paths[j % len(mangled_paths)] if j % 10 == 0 and mangled_paths else f'{folder}/sub-{i}/file_{j}.dat'
+            obj = {
+                'bytes': {'count': 1024 * j},
+                'checksums': [{'type': 'md5', 'value': f'{j:032x}'}],
+                'distributions': {'api': [{'uri': f'https://api.pennsieve.io/files/{j}'}]},
+                'updated': [{'timestamp': '2022-01-01T00:00:00Z'}],
+                'dataset': {'id': f'N:dataset:{i}', 'path': path},
+                'identifier': f'N:package:{j}',
+                'mimetype': {'name': mime_types[j % len(mime_types)]},
+            }
+            if j % 7 == 0:
+                obj['additional_mimetype'] = {'name': mime_types[(j // 7) % len(mime_types)]}
+            objects.append(obj)
+        hits.append({'_source': {'item': {'name': f'Dataset {i}'}, 'objects': objects}})
+    return hits
+
+
+def measure(function, hits, repeat):
+    cpu = []
+    for _ in range(repeat):
+        sample = copy.deepcopy(hits)
+        start = time.process_time()
+        function(sample)
+        cpu.append(time.process_time() - start)
+
+    sample = copy.deepcopy(hits)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function(sample)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del result
+    return min(cpu), blocks, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('responses', nargs='*', help='recorded SciCrunch _search responses')
+    parser.add_argument('--hits', type=int, default=20, help='hits in the synthetic response')
+    parser.add_argument('--objects', type=int, default=2000, help='objects per hit in the synthetic response')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    samples = []
+    for path in args.responses:
+        with open(path) as f:
+            samples.append((path, json.load(f)['hits']['hits']))
+    if not samples:
+        samples.append((f'synthetic {args.hits} hits x {args.objects} objects',
+                        synthetic_hits(args.hits, args.objects)))
+
+    for name, hits in samples:
+        assert fused_prepare(copy.deepcopy(hits)) == legacy_prepare(copy.deepcopy(hits)), \
+            'the single pass disagrees with the legacy passes'
+        print(f'{name}: {sum(len(hit["_source"].get("objects", [])) for hit in hits)} objects')
+        fused = measure(fused_prepare, hits, args.repeat)
+        for label, function in (('legacy in place', legacy_prepare), ('legacy on copies', legacy_prepare_copies),
+                                ('single pass', fused_prepare)):
+            cpu, blocks, peak = fused if function is fused_prepare else measure(function, hits, args.repeat)
+            print(f'  {label:16} {cpu * 1000:8.2f} ms cpu ({cpu / fused[0]:4.1f}x)'
+                  f'  {blocks:8d} new blocks  {peak / 1024:8.0f} KiB peak')
+
+
+if __name__ == '__main__':
+    main()
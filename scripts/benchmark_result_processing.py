@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of the per-hit attribute extraction of SciCrunch search results.
+
+Compares the compiled processors of app.scicrunch_process_results with the previous
+implementation (an importlib lookup and a key by key walk of every ATTRIBUTES_MAP path
+for each hit). Pass recorded SciCrunch _search responses as arguments, for example the
+response of /dataset_info/using_multiple_discoverIds for a 999 hit query, otherwise a
+synthetic 999 hit response is used.
+
+    python -m scripts.benchmark_result_processing [response.json ...] [--repeat 20]
+"""
+import argparse
+import importlib
+import json
+import timeit
+
+from app.scicrunch_process_results import _convert_patch_to_x, get_processor
+
+
+def legacy_transform_attributes(attributes_, dataset):
+    found_attr = {}
+    for k, attr in attributes_.items():
+        subset = dataset['_source']  # set our subset to the full dataset result
+        key_attr = False
+        for n, key in enumerate(attr):
+            if isinstance(subset, dict):
+                if key in subset.keys():  # continue if keys are found
+                    subset = subset[key]
+                    if n + 1 is len(attr):  # if we made it to the end, save this subset
+                        key_attr = subset
+        found_attr[k] = key_attr
+    return found_attr
+
+
+def _hit_version(hit):
+    try:
+        return _convert_patch_to_x(hit['_source']['item']['version']['keyword'])
+    except KeyError:
+        return 'undefined'
+
+
+def legacy_extract(hits):
+    output = []
+    for hit in hits:
+        package_version = f'scicrunch_processing_v_{_hit_version(hit).replace(".", "_")}'
+        m = importlib.import_module(f'app.{package_version}')
+        attributes_map = getattr(m, 'ATTRIBUTES_MAP')
+        getattr(m, 'sort_files_by_mime_type')
+        output.append(legacy_transform_attributes(attributes_map, hit))
+    return output
+
+
+def compiled_extract(hits):
+    return [get_processor(_hit_version(hit)).transform_attributes(hit) for hit in hits]
+
+
+def synthetic_hits(count):
+    hits = []
+    for i in range(count):
+        source = {
+            'item': {
+                'name': f'Dataset {i}',
+                'description': 'A dataset',
+                'identifier': f'N:dataset:{i}',
+                'curie': f'DOI:10.26275/{i:04d}',
+                'statistics': {'samples': {'count': i % 40}, 'subjects': {'count': i % 12}},
+            },
+            'pennsieve': {
+                'identifier': str(i),
+                'uri': f's3://pennsieve-prod-discover-publish-use1/{i}',
+                'version': {'identifier': 1 + i % 3},
+                'firstPublishedAt': {'timestamp': '2021-01-01T00:00:00Z'},
+            },
+            'anatomy': {'organ': [{'curie': 'UBERON:0000948', 'name': 'heart'}]},
+            'organisms': {'subject': [{'species': {'name': 'Rattus norvegicus'}}]},
+            'contributors': [{'first': {'name': 'Ada'}, 'last': {'name': 'Lovelace'}}],
+            'dates': {'updated': [{'timestamp': '2022-01-01T00:00:00Z'}]},
+            'distributions': {'current': [{'uri': f'https://sparc.science/datasets/{i}'}]},
+            'objects': [{'dataset': {'path': f'primary/file_{j}.json'}, 'mimetype': {'name': 'application/json'}} for j in range(20)],
+        }
+        # Mix in the older schema, unversioned datasets (every tenth) and incomplete paths.
+        if i % 10 == 0:
+            hits.append({'_source': source})
+            continue
+        if i % 4 == 0:
+            source['item']['version'] = {'keyword': '1.1.4'}
+            source['xrefs'] = {'additionalLinks': []}
+        else:
+            source['item']['version'] = {'keyword': '1.2.3'}
+            if i % 3 == 0:
+                del source['item']['statistics']
+        hits.append({'_source': source})
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('responses', nargs='*', help='recorded SciCrunch _search responses')
+    parser.add_argument('--hits', type=int, default=999, help='hits in the synthetic response')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    samples = []
+    for path in args.responses:
+        with open(path) as f:
+            samples.append((path, json.load(f)['hits']['hits']))
+    if not samples:
+        samples.append((f'synthetic {args.hits} hits', synthetic_hits(args.hits)))
+
+    for name, hits in samples:
+        assert compiled_extract(hits) == legacy_extract(hits), 'compiled processors disagree with the legacy walk'
+        legacy = min(timeit.repeat(lambda: legacy_extract(hits), number=1, repeat=args.repeat))
+        compiled = min(timeit.repeat(lambda: compiled_extract(hits), number=1, repeat=args.repeat))
+        print(f'{name}: {len(hits)} hits')
+        print(f'  legacy   {legacy * 1000:8.2f} ms  {len(hits) / legacy:10.0f} hits/s')
+        print(f'  compiled {compiled * 1000:8.2f} ms  {len(hits) / compiled:10.0f} hits/s  ({legacy / compiled:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
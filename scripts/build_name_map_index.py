@@ -0,0 +1,69 @@
+"""
+Generate app/manifest_name_to_discover_name.idx from app/manifest_name_to_discover_name.py.
+
+The maps of the source module are read without importing it, and written to the compact
+index read (lazily) by app.name_map_index. Run it after editing the source module:
+
+    python -m scripts.build_name_map_index [--check]
+"""
+import argparse
+import ast
+import importlib.util
+import os
+import sys
+import tempfile
+
+
+def _load_name_map_index():
+    # Loaded from its file, importing it through the app package would import app.main, with its schedulers and clients.
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'name_map_index.py')
+    spec = importlib.util.spec_from_file_location('name_map_index', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+name_map_index = _load_name_map_index()
+NAME_MAP_INDEX_PATH = name_map_index.NAME_MAP_INDEX_PATH
+NAME_MAP_PARTITION_DEPTH = name_map_index.NAME_MAP_PARTITION_DEPTH
+write_index = name_map_index.write_index
+
+SOURCE_PATH = os.path.join(os.path.dirname(NAME_MAP_INDEX_PATH), 'manifest_name_to_discover_name.py')
+# Map name in the source module -> partition depth, biolucida image names have no folders.
+MAP_DEPTHS = {'name_map': NAME_MAP_PARTITION_DEPTH, 'biolucida_name_map': 0}
+
+
+def read_source_maps(path=SOURCE_PATH):
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+
+    maps = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            maps[node.targets[0].id] = ast.literal_eval(node.value)
+
+    return {name: (maps[name], depth) for name, depth in MAP_DEPTHS.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='only check that the index is up to date')
+    args = parser.parse_args()
+
+    maps = read_source_maps()
+    if not args.check:
+        write_index(NAME_MAP_INDEX_PATH, maps)
+        print(f'Wrote {NAME_MAP_INDEX_PATH} ({os.path.getsize(NAME_MAP_INDEX_PATH)} bytes)')
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        expected_path = os.path.join(directory, 'expected.idx')
+        write_index(expected_path, maps)
+        with open(expected_path, 'rb') as expected, open(NAME_MAP_INDEX_PATH, 'rb') as current:
+            if expected.read() != current.read():
+                sys.exit(f'{NAME_MAP_INDEX_PATH} is out of date, run python -m scripts.build_name_map_index')
+    print('The name map index is up to date')
+
+
+if __name__ == '__main__':
+    main()
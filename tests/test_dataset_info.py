@@ -1,6 +1,8 @@
 import json
 import pytest
+import app.main as main
 from app import app
+from app.shared_cache import SharedCache
 
 from app.config import Config
 
@@ -341,3 +343,93 @@ def test_size_limit_on_mangled_s3_resource(client):
     Config.DIRECT_DOWNLOAD_LIMIT = config_download_limit  # set limit back
 
     assert r.status_code == 413  # Check we got the correct response
+
+
+class FakeSearchResponse(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._body = body
+        self.content = json.dumps(body).encode('utf-8')
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def offline_search(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'dataset_search_cache', SharedCache(str(tmp_path / 'cache.sqlite3'), 'test', 60, 1 << 20))
+    monkeypatch.setattr(main, 'msearch_supported', True)
+    requests_made = []
+
+    def fake_post(url, endpoint=None, **kwargs):
+        requests_made.append(url)
+        if url.endswith('/_msearch'):
+            lines = kwargs['data'].decode('utf-8').splitlines()
+            queries = [json.loads(line) for line in lines[1::2]]
+            return FakeSearchResponse(200, {'responses': [{'hits': {'total': 1, 'hits': [q]}} for q in queries]})
+        return FakeSearchResponse(200, {'hits': {'total': 1, 'hits': [kwargs['json']]}})
+
+    monkeypatch.setattr(main.scicrunch, 'post', fake_post)
+    return requests_made
+
+
+def test_dataset_msearch_demultiplexes_in_order(offline_search):
+    queries = [{'query': {'term': {'item.curie': doi}}} for doi in ['a', 'b', 'a', 'c']]
+    responses = main.dataset_msearch(queries)
+    assert [response['hits']['hits'][0] for response in responses] == queries
+    assert responses[0] is not responses[2]
+    assert len(offline_search) == 1
+
+    # Everything is cached now, no further request is needed.
+    main.dataset_msearch(queries)
+    assert len(offline_search) == 1
+
+
+def test_dataset_msearch_falls_back_to_single_searches(offline_search, monkeypatch):
+    monkeypatch.setattr(main, 'msearch_supported', False)
+    queries = [{'query': {'term': {'item.curie': doi}}} for doi in ['a', 'b']]
+    responses = main.dataset_msearch(queries)
+    assert [response['hits']['hits'][0] for response in responses] == queries
+    assert all(url.endswith('/_search') for url in offline_search)
+
+
+def test_dataset_info_bulk_requires_lookups(client):
+    r = client.post('/dataset_info/bulk', json={})
+    assert r.status_code == 400
+
+
+def test_dataset_msearch_only_stops_using_msearch_when_it_is_unsupported(offline_search, monkeypatch):
+    statuses = [401, 404]
+
+    def fake_post(url, endpoint=None, **kwargs):
+        offline_search.append(url)
+        if url.endswith('/_msearch'):
+            return FakeSearchResponse(statuses.pop(0), {'error': 'refused'})
+        return FakeSearchResponse(200, {'hits': {'total': 1, 'hits': [kwargs['json']]}})
+
+    monkeypatch.setattr(main.scicrunch, 'post', fake_post)
+    for dois in (['a', 'b'], ['c', 'd']):
+        responses = main.dataset_msearch([{'query': {'term': {'item.curie': doi}}} for doi in dois])
+        assert all('hits' in response for response in responses)
+        assert main.msearch_supported == (dois == ['a', 'b'])
+
+
+def test_dataset_info_bulk_reports_failed_lookups(offline_search, monkeypatch):
+    def fake_post(url, endpoint=None, **kwargs):
+        return FakeSearchResponse(200, {'responses': [{'hits': {'total': 0, 'hits': []}},
+                                                      {'error': {'type': 'search_phase_execution_exception'}, 'status': 503}]})
+
+    monkeypatch.setattr(main.scicrunch, 'post', fake_post)
+    with main.app.test_request_context('/dataset_info/bulk', method='POST', json={'dois': ['10.26275/none'], 'identifiers': ['55']}):
+        result = main.get_dataset_info_bulk().get_json()['result']
+    assert result[0] == {'doi': '10.26275/none', 'result': []}
+    assert result[1] == {'identifier': '55', 'error': {'type': 'search_phase_execution_exception'}, 'status': 503}
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'dois', 7])
+def test_dataset_info_bulk_rejects_bodies_that_are_not_objects(body):
+    from werkzeug.exceptions import BadRequest
+    with main.app.test_request_context('/dataset_info/bulk', method='POST', json=body):
+        with pytest.raises(BadRequest):
+            main.get_dataset_info_bulk()
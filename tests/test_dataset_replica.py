@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from app.dataset_replica import DatasetReplica
+
+
+def _hit(discover_id, doi):
+    return {'_source': {'item': {'curie': f'DOI:{doi}', 'name': f'Dataset {discover_id}'}, 'pennsieve': {'identifier': discover_id}}}
+
+
+HITS = {'10.26275/aaaa': _hit('17', '10.26275/aaaa'), '10.26275/bbbb': _hit('18', '10.26275/bbbb'), '10.26275/cccc': _hit('19', '10.26275/cccc')}
+
+
+class FakeIndex:
+
+    def __init__(self, page_size=2):
+        self.page_size = page_size
+        self.queries = []
+
+    def __call__(self, query):
+        self.queries.append(query)
+        if 'aggregations' in query:
+            after = query['aggregations']['doi']['composite']['after']['curie']
+            keys = sorted(f'DOI:{doi}' for doi in HITS if f'DOI:{doi}' > after)[:self.page_size]
+            query['aggregations']['doi']['composite']['size'] = self.page_size
+            return {'aggregations': {'doi': {'buckets': [{'key': {'curie': key}} for key in keys],
+                                             'after_key': {'curie': keys[-1]} if keys else None}}}
+
+        dois = [curie.replace('DOI:', '') for curie in query['query']['terms']['item.curie']]
+        return {'hits': {'total': {'value': len(dois)}, 'hits': [HITS[doi] for doi in dois]}}
+
+
+def test_replica_answers_lookups_after_sync(tmp_path):
+    replica = DatasetReplica(str(tmp_path / 'replica.sqlite3'), max_age=60)
+    assert replica.find_by_doi('10.26275/aaaa') is None
+
+    assert replica.sync(FakeIndex()) == 3
+    result = replica.find_by_doi('DOI:10.26275/AAAA')
+    assert result['hits']['hits'] == [HITS['10.26275/aaaa']]
+    assert result['hits']['total'] == {'value': 1, 'relation': 'eq'}
+    assert [hit['_source']['pennsieve']['identifier'] for hit in replica.find_by_discover_ids(['19', 17])['hits']['hits']] == ['17', '19']
+
+
+def test_replica_defers_to_the_remote_index_when_unsure(tmp_path, monkeypatch):
+    replica = DatasetReplica(str(tmp_path / 'replica.sqlite3'), max_age=60)
+    replica.sync(FakeIndex())
+    # A dataset published since the last sync.
+    assert replica.find_by_discover_ids(['17', '20']) is None
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert replica.find_by_discover_ids(['17']) is None
+    assert replica.stats()['misses'] == 2
+
+
+def test_only_one_worker_syncs_per_interval(tmp_path):
+    path = str(tmp_path / 'replica.sqlite3')
+    index = FakeIndex()
+    assert DatasetReplica(path, max_age=60).sync_if_stale(index, 30)
+    searches = len(index.queries)
+    assert not DatasetReplica(path, max_age=60).sync_if_stale(index, 30)
+    assert len(index.queries) == searches
+
+
+def test_replica_is_kept_when_a_sync_fails_part_way(tmp_path):
+    replica = DatasetReplica(str(tmp_path / 'replica.sqlite3'), max_age=60, batch_size=2)
+    replica.sync(FakeIndex())
+
+    class FailingIndex(FakeIndex):
+
+        def __call__(self, query):
+            if 'query' in query and len(self.queries) > 2:
+                raise ConnectionError('SciCrunch went away')
+            return super().__call__(query)
+
+    with pytest.raises(ConnectionError):
+        replica.sync(FailingIndex())
+    assert replica.find_by_discover_ids(['17', '18', '19']) is not None
+    assert replica.sync(FakeIndex()) == 3
+    assert replica.stats()['datasets'] == 3
@@ -0,0 +1,36 @@
+import collections
+import datetime
+import uuid
+
+from flask import Flask, jsonify
+from flask.json import JSONEncoder
+
+from app.fast_json import FastJSONEncoder
+
+Pair = collections.namedtuple('Pair', 'first second')
+
+
+def _jsonify_with(encoder, payload):
+    test_app = Flask(__name__)
+    test_app.json_encoder = encoder
+    test_app.config['JSON_AS_ASCII'] = False
+    with test_app.app_context():
+        return jsonify(payload).get_data(as_text=True)
+
+
+def test_output_matches_the_standard_library_encoder():
+    payload = {
+        'results': [{'name': 'Schwann cells µCT', 'size': 2.5, 'files': None, 'public': True}],
+        'numberOfHits': 1,
+        'updated': datetime.datetime(2020, 1, 2, 3, 4, 5),
+        'id': uuid.UUID(int=5),
+    }
+    output = _jsonify_with(FastJSONEncoder, payload)
+    assert output == _jsonify_with(JSONEncoder, payload)
+    assert output.startswith('{"id":"00000000-0000-0000-0000-000000000005","numberOfHits":1,')
+    assert output.endswith('"updated":"Thu, 02 Jan 2020 03:04:05 GMT"}\n')
+
+
+def test_values_the_fast_encoder_cannot_write_fall_back():
+    payload = {'big': 2 ** 70, 'pair': Pair(1, 2)}
+    assert _jsonify_with(FastJSONEncoder, payload) == '{"big":1180591620717411303424,"pair":[1,2]}\n'
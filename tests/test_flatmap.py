@@ -95,3 +95,42 @@ def test_reform_flatmap_query_result_valid_input():
 
     output = reform_flatmap_query_result(sci_crunch_data, 'sub-f005', '12345-6789-123-45')
     assert output == {'dataset': '12345-6789-123-45', 'subject': 'sub-f005', 'left': '54321-6789-123-45'}
+
+
+class FakeQDBResponse:
+    status_code = 200
+
+    def __init__(self, datasets):
+        self.datasets = datasets
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'result': [{'dataset': dataset} for dataset in self.datasets]}
+
+
+def test_find_flatmap_batches_and_caches_datasets(monkeypatch, tmp_path):
+    import app.main as main
+    from app.shared_cache import SharedCache
+
+    batches = []
+
+    def fake_msearch(queries):
+        batches.append(queries)
+        hits = {'hits': {'hits': [{'_source': {'objects': [
+            {'dataset': {'path': 'derivative/sub-f006/L/flatmap'}, 'associated_flatmap': {'identifier': 'uuid-left'}}]}}]}}
+        return [hits if 'dataset-b' in query['query']['match']['item.identifier']['query'] else {'hits': {'hits': []}}
+                for query in queries]
+
+    monkeypatch.setattr(main.scicrunch, 'get', lambda *args, **kwargs: FakeQDBResponse(['dataset-a', 'dataset-b', 'dataset-c']))
+    monkeypatch.setattr(main, 'dataset_msearch', fake_msearch)
+    monkeypatch.setattr(main, 'flatmap_cache', SharedCache(str(tmp_path / 'cache.sqlite3'), 'flatmap', 60, 1 << 20))
+
+    for _ in range(2):
+        with app.test_request_context('/flatmap/find', query_string={'subject': 'sub-f006', 'dataset': 'dataset-a'}):
+            response = main.find_associated_flatmap_for_subject()
+            assert response.get_json() == [{'left': 'uuid-left', 'subject': 'sub-f006', 'dataset': 'N:dataset:dataset-b'}]
+
+    # Both related datasets are searched in one batch and the second request is served from the cache.
+    assert [len(batch) for batch in batches] == [2]
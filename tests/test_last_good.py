@@ -0,0 +1,162 @@
+import threading
+
+import pytest
+from flask import Flask, Response, abort
+
+from app.last_good import LastGoodResponses
+from app.shared_cache import SharedCache
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    test_app = Flask(__name__)
+    state = {'mode': 'ok', 'release': threading.Event(), 'circuit_open': False, 'calls': 0}
+    last_good = LastGoodResponses(SharedCache(str(tmp_path / 'cache.sqlite3'), 'last_good', 60, 1 << 20), 0.2, 2,
+                                  max_pending=2, is_open=lambda: state['circuit_open'])
+
+    @test_app.route('/search')
+    @last_good.serve
+    def search():
+        state['calls'] += 1
+        if state['mode'] == 'slow':
+            state['release'].wait(5)
+        if state['mode'] == 'down':
+            abort(502, description='SciCrunch is down')
+        if state['mode'] == 'missing':
+            abort(404)
+        if state['mode'] == 'stream':
+            return Response((chunk for chunk in [b'{"result": ', b'"stream"}']), mimetype='application/json')
+        return {'result': state['mode']}
+
+    state['client'] = test_app.test_client()
+    state['last_good'] = last_good
+    return state
+
+
+def _wait_for_stored(last_good):
+    # The last good copy is stored by the worker thread once the view has finished.
+    for _ in range(100):
+        if last_good.cache.stats()['entries']:
+            return
+        threading.Event().wait(0.01)
+
+
+def test_fresh_responses_are_kept_and_served_when_upstream_fails(upstream):
+    response = upstream['client'].get('/search?q=heart')
+    assert response.get_json() == {'result': 'ok'}
+    assert 'Warning' not in response.headers
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['mode'] = 'down'
+    response = upstream['client'].get('/search?q=heart')
+    assert response.status_code == 200
+    assert response.get_json() == {'result': 'ok'}
+    assert response.headers['Warning'].startswith('110')
+
+    # Nothing stored for these arguments, the failure is passed on.
+    assert upstream['client'].get('/search?q=lung').status_code == 502
+
+
+def test_stale_copy_is_served_once_the_budget_is_spent(upstream):
+    upstream['client'].get('/search')
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['mode'] = 'slow'
+    response = upstream['client'].get('/search')
+    assert response.get_json() == {'result': 'ok'}
+    upstream['release'].set()
+    assert upstream['last_good'].stats()['over_budget'] == 1
+
+
+def test_client_errors_are_not_replaced(upstream):
+    upstream['client'].get('/search')
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['mode'] = 'missing'
+    assert upstream['client'].get('/search').status_code == 404
+
+
+def test_streamed_responses_are_passed_on_unread(upstream):
+    upstream['mode'] = 'stream'
+    response = upstream['client'].get('/search')
+    assert response.get_json() == {'result': 'stream'}
+    assert upstream['last_good'].cache.stats()['entries'] == 0
+
+
+def test_stale_copy_is_served_while_the_circuit_is_open(upstream):
+    upstream['client'].get('/search')
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['circuit_open'] = True
+    upstream['mode'] = 'down'
+    response = upstream['client'].get('/search')
+    assert response.get_json() == {'result': 'ok'}
+    assert response.headers['Warning'].startswith('110')
+    assert upstream['calls'] == 1
+    # Nothing stored, the view fails for itself.
+    assert upstream['client'].get('/search?q=lung').status_code == 502
+
+
+def test_responses_are_kept_per_mimetype(upstream):
+    upstream['client'].get('/search', headers={'Accept': 'application/json'})
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['mode'] = 'down'
+    assert upstream['client'].get('/search', headers={'Accept': 'application/json'}).status_code == 200
+    assert upstream['client'].get('/search', headers={'Accept': 'application/x-ndjson'}).status_code == 502
+
+
+def test_concurrent_requests_run_the_view_once(upstream):
+    upstream['client'].get('/search')
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['mode'] = 'slow'
+    upstream['last_good'].budget = 5
+    test_app = upstream['client'].application
+    responses = []
+
+    def get():
+        responses.append(test_app.test_client().get('/search'))
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while upstream['last_good'].stats()['coalesced'] < 2:
+        threading.Event().wait(0.01)
+    upstream['mode'] = 'refreshed'
+    upstream['release'].set()
+    for thread in threads:
+        thread.join()
+
+    assert upstream['calls'] == 2
+    assert sorted(response.get_json()['result'] for response in responses) == ['refreshed'] * 3
+    assert all('Warning' not in response.headers for response in responses)
+
+
+def test_stale_copy_is_served_once_too_many_views_are_pending(upstream):
+    for query in ('heart', 'lung', 'brain'):
+        upstream['client'].get(f'/search?q={query}')
+    _wait_for_stored(upstream['last_good'])
+
+    upstream['mode'] = 'slow'
+    for query in ('heart', 'lung'):
+        assert upstream['client'].get(f'/search?q={query}').headers['Warning'].startswith('110')
+    calls = upstream['calls']
+    response = upstream['client'].get('/search?q=brain')
+    assert response.headers['Warning'].startswith('110')
+    assert upstream['calls'] == calls
+    assert upstream['last_good'].stats()['rejected'] == 1
+    upstream['release'].set()
+
+
+def test_unchanged_responses_are_not_written_again(upstream):
+    for _ in range(2):
+        upstream['client'].get('/search')
+    upstream['mode'] = 'changed'
+    upstream['client'].get('/search')
+    stats = upstream['last_good'].stats()
+    assert stats['stored'] == 2
+    assert stats['unchanged'] == 1
+
+    upstream['mode'] = 'down'
+    assert upstream['client'].get('/search').get_json() == {'result': 'changed'}
@@ -0,0 +1,28 @@
+from app.name_map_index import NAME_MAP_INDEX_PATH, NameMapIndex, write_index
+from scripts.build_name_map_index import read_source_maps
+
+
+def test_lookups_only_decode_the_partition_of_the_key(tmp_path):
+    path = str(tmp_path / 'names.idx')
+    mapping = {
+        'files/primary/sub-1/a b.jpx': 'files/primary/sub-1/a_b.jpx',
+        'files/primary/sub-2/c.xml': 'files/primary/sub-2/c (1).xml',
+        'files/README.xlsx': 'files/readme.xlsx',
+    }
+    write_index(path, {'name_map': (mapping, 3), 'images': ({'x.jp2': 'x (1).jp2'}, 0)})
+    index = NameMapIndex(path, 'name_map')
+    assert index.get('files/primary/sub-1/a b.jpx') == 'files/primary/sub-1/a_b.jpx'
+    assert index.get('files/primary/sub-3/missing.jpx', 'fallback') == 'fallback'
+    assert 'files/primary/sub-1/unknown.jpx' not in index
+    assert list(index._partitions) == ['files/primary/sub-1']
+    assert index['files/README.xlsx'] == 'files/readme.xlsx'
+    assert dict(index.items()) == mapping
+    assert len(index) == 3
+    assert NameMapIndex(path, 'images')['x.jp2'] == 'x (1).jp2'
+
+
+def test_index_is_up_to_date_with_the_source_maps():
+    for name, (mapping, _) in read_source_maps().items():
+        index = NameMapIndex(NAME_MAP_INDEX_PATH, name)
+        assert len(index) == len(mapping)
+        assert all(index.get(key) == value for key, value in mapping.items())
@@ -0,0 +1,44 @@
+from app.processed_result_cache import ProcessedResultCache
+
+
+def test_least_recently_used_results_are_evicted():
+    cache = ProcessedResultCache(2)
+    cache.set(('1', '1', '1.2.X'), {'title': 'one'})
+    cache.set(('2', '1', '1.2.X'), {'title': 'two'})
+    assert cache.get(('1', '1', '1.2.X')) == {'title': 'one'}
+    cache.set(('3', '1', '1.2.X'), {'title': 'three'})
+    assert cache.get(('2', '1', '1.2.X')) is None
+    assert cache.get(('1', '1', '1.2.X')) is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['entries'] == 2
+
+
+def test_a_new_version_replaces_the_cached_one():
+    cache = ProcessedResultCache(10)
+    cache.set(('1', '1', '1.2.X'), {'title': 'one'})
+    cache.set(('1', '2', '1.2.X'), {'title': 'one, again'})
+    assert cache.get(('1', '1', '1.2.X')) is None
+    assert cache.get(('1', '2', '1.2.X')) == {'title': 'one, again'}
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['entries'] == 1
+
+
+def test_results_are_evicted_by_size():
+    cache = ProcessedResultCache(10, 200)
+    # 50 bytes each as JSON.
+    for dataset_id in ['1', '2', '3', '4', '5']:
+        cache.set((dataset_id, '1', 'None', '1.2.X'), {'files': 'x' * 38})
+    assert cache.get(('1', '1', 'None', '1.2.X')) is None
+    assert cache.get(('2', '1', 'None', '1.2.X')) is not None
+    assert cache.stats()['entries'] == 4
+    assert cache.stats()['bytes'] == 200
+    cache.set(('6', '1', 'None', '1.2.X'), {'files': 'x' * 39})
+    assert cache.stats()['skipped'] == 1
+
+
+def test_a_new_revision_replaces_the_cached_one():
+    cache = ProcessedResultCache(10)
+    cache.set(('1', '1', '7', '1.2.X'), {'title': 'one'})
+    cache.set(('1', '1', '8', '1.2.X'), {'title': 'one, revised'})
+    assert cache.get(('1', '1', '7', '1.2.X')) is None
+    assert cache.stats()['invalidations'] == 1
@@ -0,0 +1,67 @@
+import pytest
+
+from app.provenance import ProvenanceResolver
+from app.shared_cache import SharedCache
+
+
+def _dataset(discover_id, objects):
+    return {'hits': {'hits': [{'_source': {'objects': objects, 'pennsieve': {'identifier': discover_id, 'version': {'identifier': 1}}}}]}}
+
+
+DATASETS = {
+    '10.1/derived': _dataset('2', [
+        {'name': 'mesh.json', 'identifier': 'package:mesh', 'dataset': {'path': 'derivative/mesh.json'},
+         'datacite': {'isDerivedFrom': {'path': ['derivative/fit.json']}}},
+        {'name': 'fit.json', 'identifier': 'package:fit', 'dataset': {'path': 'derivative/fit.json'},
+         'derived_from_dataset': {'uri': ['https://doi.org/10.1/a', 'https://doi.org/10.1/b'],
+                                  'path': ['primary/a.json', 'primary/b.json']}},
+    ]),
+    '10.1/a': _dataset('3', [
+        {'name': 'a.json', 'dataset': {'path': 'primary/a.json'}, 'associated_flatmap': {'identifier': 'flatmap-a'}},
+    ]),
+    '10.1/b': _dataset('4', [
+        {'name': 'b.json', 'dataset': {'path': 'primary/b.json'}, 'associated_flatmap': {'identifier': 'flatmap-b'}},
+    ]),
+}
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    batches = []
+
+    def search_many(queries):
+        batches.append(queries)
+        return [DATASETS.get(query['query']['terms']['item.curie'][0], {'hits': {'hits': []}}) for query in queries]
+
+    resolver = ProvenanceResolver(search_many, SharedCache(str(tmp_path / 'cache.sqlite3'), 'provenance', 3600, 1 << 20))
+    resolver.batches = batches
+    return resolver
+
+
+def test_provenance_follows_derived_datasets(resolver):
+    result = resolver.resolve(None, '10.1/derived', None, 'derivative/mesh.json')
+    assert [source['flatmapUUID'] for source in result] == ['flatmap-a', 'flatmap-b']
+    assert [source['discoverId'] for source in result] == ['3', '4']
+    # One search for the starting dataset, then both derived-from datasets in a single batch.
+    assert [len(batch) for batch in resolver.batches] == [1, 2]
+
+
+def test_provenance_edges_are_cached_across_requests(resolver):
+    first = resolver.resolve(None, '10.1/derived', None, 'derivative/mesh.json')
+    searches = len(resolver.batches)
+    assert resolver.resolve(None, '10.1/derived', None, 'derivative/mesh.json') == first
+    assert len(resolver.batches) == searches
+
+
+def test_provenance_falls_back_to_the_derived_file(resolver, monkeypatch):
+    monkeypatch.setitem(DATASETS, '10.1/local', _dataset('5', [
+        {'name': 'mesh.json', 'dataset': {'path': 'derivative/mesh.json'},
+         'datacite': {'isDerivedFrom': {'path': ['derivative/missing.json']}}},
+    ]))
+    result = resolver.resolve(None, '10.1/local', None, 'derivative/mesh.json')
+    assert result == [{'discoverId': '5', 'name': 'mesh.json', 'path': 'derivative/mesh.json', 'version': 1}]
+
+
+def test_provenance_requires_a_lookup(resolver):
+    assert resolver.resolve(None, '10.1/derived', None, None) == []
+    assert resolver.batches == []
@@ -0,0 +1,64 @@
+import os
+import time
+
+import pytest
+
+from app.s3_disk_cache import S3DiskCache
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    return S3DiskCache(str(tmp_path / 'objects'), 100, 60)
+
+
+def _store(cache, key, content, etag='"abc"'):
+    return b''.join(cache.store('bucket', key, etag, [content[i:i + 7] for i in range(0, len(content), 7)], len(content)))
+
+
+def test_objects_are_stored_per_version(disk_cache):
+    assert disk_cache.get('bucket', 'mesh.json', '"abc"') is None
+    assert _store(disk_cache, 'mesh.json', b'x' * 30) == b'x' * 30
+    with open(disk_cache.get('bucket', 'mesh.json', '"abc"'), 'rb') as f:
+        assert f.read() == b'x' * 30
+    assert disk_cache.get('bucket', 'mesh.json', '"def"') is None
+    assert disk_cache.get('other-bucket', 'mesh.json', '"abc"') is None
+    assert disk_cache.stats()['entries'] == 1
+
+
+def test_incomplete_and_big_objects_are_not_stored(disk_cache):
+    chunks = disk_cache.store('bucket', 'mesh.json', '"abc"', iter([b'x' * 10, b'y' * 10]), 20)
+    assert next(chunks) == b'x' * 10
+    # The client went away.
+    chunks.close()
+    assert disk_cache.get('bucket', 'mesh.json', '"abc"') is None
+    assert _store(disk_cache, 'big.json', b'x' * 61) == b'x' * 61
+    assert disk_cache.get('bucket', 'big.json', '"abc"') is None
+    assert disk_cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_objects_are_evicted(disk_cache):
+    for index, key in enumerate(['a', 'b', 'c']):
+        _store(disk_cache, key, b'x' * 40)
+        # Make the order of the modification times certain.
+        os.utime(disk_cache.path('bucket', key, '"abc"'), (time.time() - 100 + index, time.time() - 100 + index))
+        if key == 'b':
+            assert disk_cache.get('bucket', 'a', '"abc"') is not None
+    assert disk_cache.get('bucket', 'b', '"abc"') is None
+    assert disk_cache.get('bucket', 'a', '"abc"') is not None
+    assert disk_cache.get('bucket', 'c', '"abc"') is not None
+    assert disk_cache.stats()['bytes'] == 80
+
+
+def test_files_are_only_listed_when_the_cache_is_full(disk_cache, monkeypatch):
+    _store(disk_cache, 'a', b'x' * 40)
+    listed = []
+    files = disk_cache._files
+    monkeypatch.setattr(disk_cache, '_files', lambda: listed.append(1) or files())
+    _store(disk_cache, 'b', b'x' * 40)
+    assert listed == []
+    assert disk_cache.stats() == {'hits': 0, 'misses': 0, 'stores': 2, 'evictions': 0, 'entries': 2, 'bytes': 80}
+    _store(disk_cache, 'c', b'x' * 40)
+    assert listed == [1]
+    assert disk_cache.stats()['bytes'] == 80
+    # The running total is shared with the other workers.
+    assert S3DiskCache(disk_cache.directory, 100, 60).stats()['entries'] == 2
@@ -0,0 +1,94 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from app.s3_key_index import S3KeyIndex
+from app.shared_cache import SharedCache
+
+
+class FakeS3(object):
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.list_calls = []
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys, RequestPayer, ContinuationToken=None):
+        self.list_calls.append((Prefix, ContinuationToken))
+        if Bucket == 'private':
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'ListObjectsV2')
+        keys = sorted(key for key in self.keys if key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {'Contents': [{'Key': key, 'Size': self.keys[key]} for key in page], 'IsTruncated': start + MaxKeys < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + MaxKeys)
+        return response
+
+
+@pytest.fixture
+def key_index(tmp_path):
+    return S3KeyIndex(SharedCache(str(tmp_path / 'cache.sqlite3'), 's3_key_index', 60, 1 << 20), 5, page_size=2)
+
+
+def test_dataset_prefix():
+    assert S3KeyIndex.dataset_prefix('217/files/derivative/scaffold_meta.json') == '217/'
+    assert S3KeyIndex.dataset_prefix('328/1/files/derivative/thumbnail.jpeg') == '328/'
+    assert S3KeyIndex.dataset_prefix('files/derivative/thumbnail.jpeg') is None
+    assert S3KeyIndex.dataset_prefix('217') is None
+
+
+def test_keys_are_listed_page_by_page_and_cached_per_version(key_index):
+    s3 = FakeS3({'217/files/a.json': 10, '217/files/b.json': 10, '217/files/empty.json': 0, '217/files/c.json': 10,
+                 '2170/files/a.json': 10})
+    keys = key_index.keys(s3, 'bucket', '217/', 3)
+    assert keys == {'217/files/a.json', '217/files/b.json', '217/files/c.json'}
+    assert s3.list_calls == [('217/', None), ('217/', '2')]
+    assert key_index.keys(s3, 'bucket', '217/', 3) == keys
+    assert len(s3.list_calls) == 2
+    # A new version of the dataset is listed again.
+    s3.keys['217/files/d.json'] = 10
+    assert '217/files/d.json' in key_index.keys(s3, 'bucket', '217/', 4)
+
+
+def test_big_datasets_and_listing_errors_are_not_indexed(key_index):
+    s3 = FakeS3({f'61/files/{index}.tif': 10 for index in range(8)})
+    assert key_index.keys(s3, 'bucket', '61/', 1) is None
+    calls = len(s3.list_calls)
+    assert key_index.keys(s3, 'bucket', '61/', 1) is None
+    assert len(s3.list_calls) == calls
+    assert key_index.keys(s3, 'private', '61/', 1) is None
+
+
+def test_bulk_exists_uses_the_key_index_and_heads_the_rest(monkeypatch, tmp_path):
+    import app.main as main
+    from app import app
+    from app.s3_metadata import S3MetadataCache
+    from test_s3_metadata import FakeS3 as FakeHeadS3
+
+    class FakeBucket(FakeS3, FakeHeadS3):
+        def __init__(self, keys):
+            FakeS3.__init__(self, keys)
+            self.objects = keys
+            self.head_calls = []
+
+    s3 = FakeBucket({'217/files/derivative/scaffold_meta.json': 100, 'files/readme.md': 5})
+    monkeypatch.setattr(main, 's3', s3)
+    monkeypatch.setattr(main, 's3_metadata', S3MetadataCache(SharedCache(str(tmp_path / 'cache.sqlite3'), 's3_metadata', 60, 1 << 20), 5))
+    monkeypatch.setattr(main, 's3_key_index', S3KeyIndex(SharedCache(str(tmp_path / 'cache.sqlite3'), 's3_key_index', 60, 1 << 20), 100))
+    monkeypatch.setattr(main, 'published_dataset_version', lambda discover_id: 2)
+    paths = ['217/files/derivative/scaffold_meta.json', '217/files/derivative/missing.json', 'files/readme.md', 'other.json']
+    with app.test_request_context('/exists', method='POST', json={'paths': paths}):
+        result = main.bulk_url_exists().get_json()['result']
+    assert [(item['path'], item['exists']) for item in result] == list(zip(paths, ['true', 'false', 'true', 'false']))
+    assert s3.list_calls == [('217/', None)]
+    assert sorted(s3.head_calls) == ['files/readme.md', 'other.json']
+
+
+@pytest.mark.parametrize('body', [['217/files/readme.md'], 'paths', None])
+def test_bulk_exists_rejects_bodies_that_are_not_objects(body):
+    import app.main as main
+    from app import app
+    from werkzeug.exceptions import BadRequest
+
+    with app.test_request_context('/exists', method='POST', json=body):
+        with pytest.raises(BadRequest):
+            main.bulk_url_exists()
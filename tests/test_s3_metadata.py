@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.s3_metadata import S3MetadataCache, is_stale_head_error
+from app.shared_cache import SharedCache
+
+LAST_MODIFIED = datetime(2023, 5, 4, 10, 30, tzinfo=timezone.utc)
+
+
+class FakeS3(object):
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.head_calls = []
+
+    def head_object(self, Bucket, Key, RequestPayer):
+        self.head_calls.append(Key)
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        if self.objects[Key] is None:
+            raise ClientError({'Error': {'Code': '500', 'Message': 'Internal Error'}}, 'HeadObject')
+        return {'ContentLength': self.objects[Key], 'ETag': '"abc"', 'LastModified': LAST_MODIFIED,
+                'ContentType': 'application/json', 'ResponseMetadata': {}}
+
+
+@pytest.fixture
+def metadata(tmp_path):
+    return S3MetadataCache(SharedCache(str(tmp_path / 'cache.sqlite3'), 's3_metadata', 60, 1 << 20), 5)
+
+
+def test_heads_are_cached_per_bucket_and_key(metadata):
+    s3 = FakeS3({'217/files/mesh.json': 1200})
+    head = metadata.head_object(s3, 'bucket', '217/files/mesh.json')
+    assert head == {'ContentLength': 1200, 'ETag': '"abc"', 'LastModified': LAST_MODIFIED, 'ContentType': 'application/json'}
+    assert metadata.head_object(s3, 'bucket', '217/files/mesh.json') == head
+    metadata.head_object(s3, 'other-bucket', '217/files/mesh.json')
+    assert s3.head_calls == ['217/files/mesh.json', '217/files/mesh.json']
+
+
+def test_missing_objects_are_cached_for_the_negative_ttl(metadata, monkeypatch):
+    s3 = FakeS3({})
+    for _ in range(2):
+        with pytest.raises(ClientError) as raised:
+            metadata.head_object(s3, 'bucket', 'missing.json')
+        assert raised.value.response['Error']['Code'] == '404'
+    assert s3.head_calls == ['missing.json']
+
+    s3.objects['missing.json'] = 10
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 6)
+    assert metadata.head_object(s3, 'bucket', 'missing.json')['ContentLength'] == 10
+
+
+def test_other_errors_are_not_cached(metadata):
+    s3 = FakeS3({'flaky.json': None})
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            metadata.head_object(s3, 'bucket', 'flaky.json')
+    assert s3.head_calls == ['flaky.json', 'flaky.json']
+
+
+def test_resolved_keys_are_kept(metadata):
+    assert metadata.resolved_key('bucket', '328/1/files/derivative/mapped_Pig 7_thumbnail.jpeg') is None
+    metadata.set_resolved_key('bucket', '328/1/files/derivative/mapped_Pig 7_thumbnail.jpeg',
+                              '328/1/files/derivative/mapped_Pig_7_thumbnail.jpeg')
+    assert metadata.resolved_key('bucket', '328/1/files/derivative/mapped_Pig 7_thumbnail.jpeg') == \
+        '328/1/files/derivative/mapped_Pig_7_thumbnail.jpeg'
+
+
+def test_evicted_heads_are_looked_up_again(metadata):
+    s3 = FakeS3({'mesh.json': 1200})
+    metadata.head_object(s3, 'bucket', 'mesh.json')
+    s3.objects['mesh.json'] = 1300
+    assert metadata.head_object(s3, 'bucket', 'mesh.json')['ContentLength'] == 1200
+    assert is_stale_head_error(ClientError({'Error': {'Code': 'PreconditionFailed', 'Message': ''}}, 'GetObject'))
+    metadata.evict('bucket', 'mesh.json')
+    assert metadata.head_object(s3, 'bucket', 'mesh.json')['ContentLength'] == 1300
@@ -0,0 +1,209 @@
+import base64
+import io
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from flask import Flask, request
+
+from app.s3_disk_cache import S3DiskCache
+from app.s3_resource import iter_base64, parse_byte_ranges, s3_object_response
+
+CONTENT = b'{"mesh": "' + b'x' * 200 + b'"}'
+LAST_MODIFIED = datetime(2023, 5, 4, 10, 30, tzinfo=timezone.utc)
+
+
+class FakeS3(object):
+
+    def __init__(self):
+        self.etag = '"abc123"'
+        self.get_object_calls = []
+        self.bodies = []
+
+    def head_object(self, **kwargs):
+        return {'ETag': self.etag, 'LastModified': LAST_MODIFIED, 'ContentLength': len(CONTENT), 'ContentType': 'application/json'}
+
+    def get_object(self, **kwargs):
+        self.get_object_calls.append(kwargs)
+        content = CONTENT
+        if 'Range' in kwargs:
+            if kwargs['IfMatch'] != self.etag:
+                raise ClientError({'Error': {'Code': 'PreconditionFailed', 'Message': 'At least one of the pre-conditions '
+                                                                                      'you specified did not hold'}}, 'GetObject')
+            start, stop = kwargs['Range'][len('bytes='):].split('-')
+            content = CONTENT[int(start):int(stop) + 1]
+        body = StreamingBody(io.BytesIO(content), len(content))
+        self.bodies.append(body)
+        return dict(self.head_object(), ContentLength=len(content), Body=body)
+
+
+@pytest.fixture
+def s3_app():
+    test_app = Flask(__name__)
+    s3 = FakeS3()
+
+    @test_app.route('/s3-resource/<path:path>')
+    def s3_resource(path):
+        head = s3.head_object(Bucket='bucket', Key=path)
+        return s3_object_response(s3, 'bucket', path, head, request.args.get('encodeBase64') is not None, chunk_size=16,
+                                  max_bytes=int(request.args.get('limit', 1000)), coalesce_gap=10, max_ranges=3)
+
+    return test_app.test_client(), s3
+
+
+def test_objects_are_streamed_with_their_validators(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/217/files/derivative/mesh.json')
+    assert r.status_code == 200
+    assert r.data == CONTENT
+    assert r.headers['ETag'] == '"abc123"'
+    assert r.headers['Content-Length'] == str(len(CONTENT))
+    assert r.mimetype == 'application/json'
+    assert r.last_modified == LAST_MODIFIED.replace(tzinfo=None)
+    assert s3.get_object_calls == [{'Bucket': 'bucket', 'Key': '217/files/derivative/mesh.json', 'RequestPayer': 'requester'}]
+
+
+def test_conditional_requests_are_answered_without_getting_the_object(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/mesh.json', headers={'If-None-Match': '"abc123"'})
+    assert r.status_code == 304
+    assert r.data == b''
+    r = client.get('/s3-resource/mesh.json', headers={'If-Modified-Since': 'Thu, 04 May 2023 10:30:00 GMT'})
+    assert r.status_code == 304
+    assert s3.get_object_calls == []
+    r = client.get('/s3-resource/mesh.json', headers={'If-None-Match': '"older"'})
+    assert r.status_code == 200
+    assert len(s3.get_object_calls) == 1
+
+
+def test_base64_output_is_streamed_with_its_own_etag(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/mesh.json?encodeBase64=true')
+    assert r.data == base64.b64encode(CONTENT)
+    assert r.headers['ETag'] == '"abc123-base64"'
+    assert client.get('/s3-resource/mesh.json?encodeBase64=true', headers={'If-None-Match': '"abc123"'}).status_code == 200
+    assert client.get('/s3-resource/mesh.json?encodeBase64=true', headers={'If-None-Match': '"abc123-base64"'}).status_code == 304
+
+
+def test_iter_base64_matches_encoding_at_once():
+    data = bytes(range(256)) * 3
+    for size in (1, 2, 3, 7, 64):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert b''.join(iter_base64(chunks)) == base64.b64encode(data)
+
+
+def test_parse_byte_ranges():
+    assert parse_byte_ranges('bytes=0-99', 1000) == [(0, 100)]
+    assert parse_byte_ranges('bytes=-100', 1000) == [(900, 1000)]
+    assert parse_byte_ranges('bytes=900-', 1000) == [(900, 1000)]
+    assert parse_byte_ranges('bytes=990-2000', 1000) == [(990, 1000)]
+    assert parse_byte_ranges('bytes=50-59, 0-9,5-14', 1000, coalesce_gap=0) == [(0, 15), (50, 60)]
+    assert parse_byte_ranges('bytes=50-59,0-9', 1000, coalesce_gap=40) == [(0, 60)]
+    assert parse_byte_ranges('bytes=2000-', 1000) == []
+    assert parse_byte_ranges('bytes=20-10', 1000) is None
+    assert parse_byte_ranges('items=0-9', 1000) is None
+    assert parse_byte_ranges('bytes=a-b', 1000) is None
+
+
+def test_ranges_are_streamed_as_partial_content(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=2-9'})
+    assert r.status_code == 206
+    assert r.data == CONTENT[2:10]
+    assert r.headers['Content-Range'] == f'bytes 2-9/{len(CONTENT)}'
+    assert r.headers['Content-Length'] == '8'
+    assert r.headers['Accept-Ranges'] == 'bytes'
+    # Ranges close to each other are read with a single get_object.
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=20-29,0-9,-5'})
+    assert r.status_code == 206
+    assert r.mimetype == 'multipart/byteranges'
+    boundary = r.mimetype_params['boundary']
+    parts = r.data.split(f'--{boundary}'.encode())
+    assert parts[0] == b'' and parts[-1] == b'--\r\n'
+    assert parts[1] == f'\r\nContent-Type: application/json\r\nContent-Range: bytes 0-29/{len(CONTENT)}\r\n\r\n'.encode() + CONTENT[:30] + b'\r\n'
+    assert parts[2].endswith(b'\r\n\r\n' + CONTENT[-5:] + b'\r\n')
+    assert [call['Range'] for call in s3.get_object_calls] == ['bytes=2-9', 'bytes=0-29', f'bytes={len(CONTENT) - 5}-{len(CONTENT) - 1}']
+
+
+def test_range_requests_read_objects_too_big_to_download(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/mesh.json?limit=100')
+    assert r.status_code == 413
+    assert 'File too big to download' in r.get_data(as_text=True)
+    assert client.get('/s3-resource/mesh.json?limit=100', headers={'Range': 'bytes=0-49'}).status_code == 206
+    assert client.get('/s3-resource/mesh.json?limit=100', headers={'Range': 'bytes=0-149'}).status_code == 413
+    assert all('Range' in call for call in s3.get_object_calls)
+
+
+def test_unsatisfiable_and_outdated_ranges(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=5000-'})
+    assert r.status_code == 416
+    assert r.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+    # The object changed since the client read the first part, it gets the whole object.
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=0-9', 'If-Range': '"older"'})
+    assert r.status_code == 200
+    assert r.data == CONTENT
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=0-9', 'If-Range': '"abc123"'})
+    assert r.status_code == 206
+
+
+def test_too_many_ranges_get_the_whole_object(s3_app):
+    client, s3 = s3_app
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=0-0,20-20,40-40,60-60'})
+    assert r.status_code == 200
+    assert r.data == CONTENT
+    assert 'Range' not in s3.get_object_calls[0]
+
+
+def test_ranges_are_read_again_with_a_new_head_when_it_was_out_of_date():
+    test_app = Flask(__name__)
+    s3 = FakeS3()
+    stale_head = s3.head_object()
+    refreshed = []
+
+    def refresh_head():
+        refreshed.append(1)
+        return s3.head_object()
+
+    @test_app.route('/s3-resource/<path:path>')
+    def s3_resource(path):
+        return s3_object_response(s3, 'bucket', path, stale_head, chunk_size=16, refresh_head=refresh_head)
+
+    client = test_app.test_client()
+    s3.etag = '"def456"'
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=0-9'})
+    assert r.status_code == 206
+    assert r.data == CONTENT[:10]
+    assert r.headers['ETag'] == '"def456"'
+    r = client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=0-9,100-109'})
+    assert r.status_code == 206
+    assert r.mimetype == 'multipart/byteranges'
+    assert r.data.count(b'Content-Range') == 2
+    assert len(refreshed) == 2
+
+
+def test_whole_objects_are_served_from_the_disk_cache(tmp_path):
+    test_app = Flask(__name__)
+    s3 = FakeS3()
+    disk_cache = S3DiskCache(str(tmp_path / 'objects'), 1 << 20, 1 << 20)
+
+    @test_app.route('/s3-resource/<path:path>')
+    def s3_resource(path):
+        head = s3.head_object(Bucket='bucket', Key=path)
+        return s3_object_response(s3, 'bucket', path, head, request.args.get('encodeBase64') is not None, chunk_size=16,
+                                  disk_cache=disk_cache)
+
+    client = test_app.test_client()
+    first = client.get('/s3-resource/mesh.json')
+    # The object is stored once it has been sent.
+    assert first.data == CONTENT
+    second = client.get('/s3-resource/mesh.json')
+    assert second.data == CONTENT
+    assert client.get('/s3-resource/mesh.json?encodeBase64=true').data == base64.b64encode(CONTENT)
+    assert len(s3.get_object_calls) == 1
+    for header in ('ETag', 'Last-Modified', 'Content-Type', 'Content-Length'):
+        assert second.headers[header] == first.headers[header]
+    assert 'Cache-Control' not in second.headers
+    assert client.get('/s3-resource/mesh.json', headers={'Range': 'bytes=0-9'}).data == CONTENT[:10]
@@ -7,7 +7,9 @@ import os
 
 from app import app
 from app.main import dataset_search
-from app.scicrunch_requests import create_query_string
+from app.scicrunch_requests import create_query_string, create_facet_query, get_facet_type_map, create_doi_query, \
+    create_filter_request
+from app.scicrunch_process_results import reform_facet_results
 from app.config import Config
 
 from known_uberons import UBERONS_DICT
@@ -538,3 +540,236 @@ def test_dataset_citations_search(client):
     json_data = json.loads(data)
     assert 'id' in json_data
     assert json_data['id'] == identifier
+
+
+def test_create_facet_query_single_request():
+    data = create_facet_query('species')
+    paths = get_facet_type_map()['species']
+    assert list(data['aggregations'].keys()) == ['species_0', 'species_1', 'species_2']
+    assert [aggregation['terms']['field'] for aggregation in data['aggregations'].values()] == paths
+
+
+def test_reform_facet_results_keeps_aggregation_order():
+    results = {
+        'aggregations': {
+            'species_1': {'buckets': [{'key': 'rat', 'doc_count': 2}]},
+            'species_0': {'buckets': [{'key': 'human', 'doc_count': 5}]},
+        }
+    }
+    terms = reform_facet_results(results, ['species_0', 'species_1', 'species_2'])
+    assert [term['key'] for term in terms] == ['human', 'rat']
+
+
+def test_dataset_queries_project_processed_attributes():
+    from app import scicrunch_processing_v_1_2_X
+    source = create_doi_query('10.26275/mlua-o9oj')['_source']
+    for path in scicrunch_processing_v_1_2_X.ATTRIBUTES_MAP.values():
+        assert '.'.join(path) in source['includes']
+    assert 'objects.checksums' in source['excludes']
+    assert '_source' not in create_doi_query('10.26275/mlua-o9oj', projected=False)
+
+
+def test_dataset_queries_project_the_requested_fields():
+    source = create_doi_query('10.26275/mlua-o9oj', fields=frozenset(['title', 'doi']))['_source']
+    assert set(source['includes']) == {'item.name', 'item.curie', 'item.version.keyword', 'pennsieve.identifier',
+                                       'pennsieve.revision.identifier', 'pennsieve.version.identifier'}
+    assert 'objects' in create_doi_query('10.26275/mlua-o9oj', fields=frozenset(['abi-scaffold-metadata-file']))['_source']['includes']
+    assert '_source' not in create_filter_request('vagus', [], [], 10, 0)
+    assert create_filter_request('vagus', [], [], 10, 0, frozenset(['title']))['_source']['includes'] == \
+        ['item.name', 'item.version.keyword', 'pennsieve.identifier', 'pennsieve.revision.identifier', 'pennsieve.version.identifier']
+
+
+def test_process_results_selects_the_requested_fields(monkeypatch):
+    from app import scicrunch_process_results
+    from app.scicrunch_process_results import process_results, processed_result_cache, reform_dataset_results
+    results = {'took': 3, 'hits': {'total': 1, 'hits': [{'_source': {
+        'item': {'version': {'keyword': '1.2.3'}, 'name': 'Vagus', 'curie': 'DOI:10.26275/abcd'},
+        'pennsieve': {'identifier': '17', 'version': {'identifier': 3}},
+        'objects': [{'additional_mimetype': {'name': 'application/x.vnd.abi.context-information+json'},
+                     'dataset': {'path': 'derivative/context.json'}, 'bytes': {'count': 10}},
+                    {'additional_mimetype': {'name': 'application/x.vnd.abi.scaffold.meta+json'},
+                     'dataset': {'path': 'derivative/scaffold_meta.json'}, 'bytes': {'count': 10}}]}}]}}
+
+    prepared = []
+    prepare_objects = scicrunch_process_results.get_processor('1.2.X').prepare_objects
+    monkeypatch.setattr(scicrunch_process_results.get_processor('1.2.X'), 'prepare_objects',
+                        lambda objects, **kwargs: prepared.append(kwargs['categories']) or prepare_objects(objects, **kwargs))
+    processed_result_cache.clear()
+    with app.app_context():
+        assert process_results(results, frozenset(['title', 'took'])).get_json()['results'] == [{'title': 'Vagus', 'took': 3}]
+        assert prepared == []
+        scaffolds = process_results(results, frozenset(['abi-scaffold-metadata-file', 'doi'])).get_json()['results']
+    assert prepared == [frozenset(['abi-scaffold-metadata-file'])]
+    assert set(scaffolds[0]) == {'abi-scaffold-metadata-file', 'doi'}
+    assert scaffolds[0]['abi-scaffold-metadata-file'][0]['dataset']['path'] == 'derivative/scaffold_meta.json'
+    assert processed_result_cache.stats()['entries'] == 0
+    assert reform_dataset_results(results, frozenset(['title'])) == {'result': [{'title': 'Vagus'}]}
+
+
+def test_process_results_stream_matches_process_results():
+    import copy
+    import io
+    from app.scicrunch_process_results import process_results, process_results_stream, processed_result_cache
+    results = {
+        'took': 12,
+        'hits': {
+            'total': 2,
+            'hits': [
+                {'_source': {
+                    'item': {'version': {'keyword': '1.2.3'}, 'name': 'Vagus', 'curie': 'DOI:10.26275/abcd'},
+                    'pennsieve': {'identifier': '17', 'version': {'identifier': 3}},
+                    'objects': [
+                        {'mimetype': {'name': 'image/png'}, 'dataset': {'path': 'derivative/thumbnail.png'}, 'bytes': {'count': 10}},
+                        {'additional_mimetype': {'name': 'application/x.vnd.abi.context-information+json'},
+                         'mimetype': {'name': 'application/json'}, 'dataset': {'path': 'derivative/context.json'}},
+                    ],
+                    'contributors': [{'first': {'name': 'A'}, 'weight': 0.5}],
+                }},
+                {'_source': {'item': {'curie': 'DOI:10.26275/efgh'}, 'pennsieve': {'identifier': '18'}}},
+            ]
+        }
+    }
+    with app.app_context():
+        expected = process_results(copy.deepcopy(results)).get_json()
+        processed_result_cache.clear()
+        streamed = process_results_stream(io.BytesIO(json.dumps(results).encode('utf-8'))).get_json()
+    assert streamed == expected
+    assert streamed['numberOfHits'] == 2
+
+
+def test_compiled_attributes_match_walking_the_paths():
+    from app.scicrunch_process_results import _compile_attributes_map, _walk_attribute_path
+    attributes_map = {'full': ['a', 'b', 'c'], 'skipped': ['a', 'x', 'd'], 'list': ['a', 'l', 'c'], 'missing': ['z'], 'falsy': ['a', 'f']}
+    dataset = {'_source': {'a': {'b': {'c': 1}, 'd': 2, 'l': [{'c': 3}], 'f': 0}}}
+    found = _compile_attributes_map(attributes_map)(dataset)
+    assert found == {name: _walk_attribute_path(dataset['_source'], path) for name, path in attributes_map.items()}
+    assert found == {'full': 1, 'skipped': 2, 'list': False, 'missing': False, 'falsy': 0}
+
+
+def test_sort_files_by_mime_type_classifies_each_mime_type_once(caplog):
+    from app.scicrunch_processing_common import sort_files_by_mime_type, classify_mime_type, COMMON_IMAGES, CSV
+    objects = [
+        {'additional_mimetype': {'name': 'image/png'}, 'dataset': {'path': 'primary/sub-1/image.png'}},
+        {'additional_mimetype': {'name': 'image/png'}, 'dataset': {'path': 'derivative/sub-1/image.png'}},
+        {'additional_mimetype': {'name': ' Text/CSV '}, 'dataset': {'path': 'primary/data.csv'}},
+        {'additional_mimetype': {'name': 'application/json'}, 'dataset': {'path': 'primary/data.json'}},
+    ] + [{'additional_mimetype': {'name': 'chemical/x-unknown'}, 'dataset': {'path': f'primary/{i}.mol'}} for i in range(3)]
+    sorted_files = sort_files_by_mime_type(objects)
+    assert [obj['dataset']['path'] for obj in sorted_files[COMMON_IMAGES]] == ['primary/sub-1/image.png']
+    assert [obj['dataset']['path'] for obj in sorted_files[CSV]] == ['primary/data.csv']
+    assert len(sorted_files) == 2
+    assert caplog.text.count('Unhandled mime type: chemical/x-unknown') == 1
+    assert classify_mime_type('image/jpeg') == (COMMON_IMAGES, True)
+
+
+def test_prepare_objects_copies_the_objects_in_one_pass():
+    import copy
+    from app.name_map_index import name_map
+    from app.scicrunch_processing_common import prepare_objects, CONTEXT_FILE, BIOLUCIDA_3D
+    mangled_path, discover_path = next(iter(name_map.items()))
+    objects = [
+        {'additional_mimetype': {'name': 'application/x.vnd.abi.context-information+json'}, 'bytes': {'count': 10},
+         'dataset': {'path': 'derivative/context.json'}},
+        {'additional_mimetype': {'name': 'image/jpx'}, 'checksums': [], 'updated': [],
+         'dataset': {'path': mangled_path.replace('files/', '', 1)}},
+    ]
+    original = copy.deepcopy(objects)
+    context_files, sorted_files = prepare_objects(objects)
+    assert objects == original
+    assert context_files == ['derivative/context.json']
+    assert sorted_files[CONTEXT_FILE] == [{'additional_mimetype': objects[0]['additional_mimetype'], 'dataset': {'path': 'derivative/context.json'}}]
+    assert sorted_files[BIOLUCIDA_3D][0]['dataset']['path'] == discover_path.replace('files/', '', 1)
+    assert set(sorted_files[BIOLUCIDA_3D][0]) == {'additional_mimetype', 'dataset'}
+    assert prepare_objects(objects, sort_files=False) == (['derivative/context.json'], {})
+
+
+def test_prepared_hits_are_cached_per_dataset_version(monkeypatch):
+    from app import scicrunch_process_results
+    from app.scicrunch_process_results import _prepare_results, processed_result_cache
+
+    def hit(identifier, version, name):
+        return {'_source': {'item': {'version': {'keyword': '1.2.3'}, 'name': name, 'curie': f'DOI:10.26275/{identifier}'},
+                            'pennsieve': {'identifier': identifier, 'version': {'identifier': version}}}}
+
+    prepared = []
+    prepare_objects = scicrunch_process_results.get_processor('1.2.X').prepare_objects
+    monkeypatch.setattr(scicrunch_process_results.get_processor('1.2.X'), 'prepare_objects',
+                        lambda objects, **kwargs: prepared.append(objects) or prepare_objects(objects, **kwargs))
+    processed_result_cache.clear()
+    first = _prepare_results({'took': 1, 'hits': {'hits': [hit('101', 1, 'One'), hit('102', 1, 'Two')]}})
+    second = _prepare_results({'took': 2, 'hits': {'hits': [hit('101', 1, 'One'), hit('103', 1, 'Three'), hit('102', 2, 'Two v2')]}})
+    assert len(prepared) == 4
+    assert [result['title'] for result in second] == ['One', 'Three', 'Two v2']
+    assert [result['took'] for result in first + second] == [1, 1, 2, 2, 2]
+    assert processed_result_cache.stats()['invalidations'] == 1
+
+    revised = hit('101', 1, 'One, revised')
+    revised['_source']['pennsieve']['revision'] = {'identifier': 2}
+    assert [result['title'] for result in _prepare_results({'took': 3, 'hits': {'hits': [revised]}})] == ['One, revised']
+
+
+def test_multiple_dois_can_be_streamed_as_ndjson(monkeypatch):
+    import io
+    import app.main as main
+    from requests.structures import CaseInsensitiveDict
+    from urllib3 import HTTPResponse
+    from app.scicrunch_process_results import process_results, process_results_ndjson
+
+    results = {'took': 7, 'hits': {'total': 2, 'hits': [
+        {'_source': {'item': {'version': {'keyword': '1.2.3'}, 'name': f'Dataset {i}', 'curie': f'DOI:10.26275/{i}'},
+                     'pennsieve': {'identifier': str(200 + i), 'version': {'identifier': 1}}}} for i in range(2)]}}
+
+    def fake_post(*args, **kwargs):
+        assert kwargs['stream']
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response.raw = HTTPResponse(body=io.BytesIO(json.dumps(results).encode('utf-8')), preload_content=False)
+        return response
+
+    monkeypatch.setattr(main.scicrunch, 'post', fake_post)
+    with app.test_request_context('/dataset_info/using_multiple_dois', query_string={'dois': ['10.26275/0', '10.26275/1'], 'format': 'ndjson'}):
+        response = main.get_dataset_info_dois()
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.is_streamed
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        expected = process_results(results).get_json()
+    assert lines[0] == {'numberOfHits': 2}
+    assert lines[1:] == expected['results']
+    assert [json.loads(line) for line in process_results_ndjson(results)] == lines
+
+
+def test_dataset_search_failures_are_bad_gateway_errors(monkeypatch):
+    import app.main as main
+    from app.circuit_breaker import CircuitOpenError
+
+    def open_circuit(*args, **kwargs):
+        raise CircuitOpenError('Circuit open for scicrunch.org, not requesting dataset_search')
+
+    monkeypatch.setattr(main.scicrunch, 'post', open_circuit)
+    with pytest.raises(requests.exceptions.RequestException) as raised:
+        dataset_search({'query': {'term': {'item.name': 'never cached'}}})
+    with app.test_request_context('/dataset_info/using_title'):
+        response, status = main.upstream_unreachable(raised.value)
+    assert status == 502
+    assert 'Circuit open' in response.get_json()['error']
+
+
+def test_facet_snapshots_are_shared_with_the_workers(monkeypatch, tmp_path):
+    import app.main as main
+    from app.shared_cache import SharedCache
+
+    path = str(tmp_path / 'cache.sqlite3')
+    monkeypatch.setattr(main, 'facet_snapshots', SharedCache(path, 'facet_snapshots', 60, 1 << 20))
+    monkeypatch.setattr(main, 'fetch_facets', lambda type_: [{'key': type_}])
+    main.update_facet_snapshots()
+
+    # A worker forked before the snapshots were taken.
+    monkeypatch.setattr(main, 'facet_snapshots', SharedCache(path, 'facet_snapshots', 60, 1 << 20))
+
+    def unreachable(type_):
+        raise AssertionError('SciCrunch was called')
+
+    monkeypatch.setattr(main, 'fetch_facets', unreachable)
+    with app.test_request_context('/get-facets/species'):
+        assert main.get_facets('species').get_json() == [{'key': 'species'}]
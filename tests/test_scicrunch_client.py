@@ -0,0 +1,136 @@
+import os
+
+import pytest
+import requests
+
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.config import Config
+from app.scicrunch_client import SciCrunchClient
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+def _client_with_responses(monkeypatch, outcomes):
+    client = SciCrunchClient(max_retries=2, backoff_base=0)
+    calls = []
+
+    def fake_request(self, method, url, timeout=None, **kwargs):
+        calls.append((method, url, timeout))
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+    return client, calls
+
+
+def test_retries_gateway_errors(monkeypatch):
+    client, calls = _client_with_responses(monkeypatch, [503, 200])
+    response = client.post('https://scicrunch.example/_search', endpoint='search')
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert calls[0][2] == (client.connect_timeout, client.read_timeout)
+    stats = client.stats()['search']
+    assert stats['calls'] == 1
+    assert stats['retries'] == 1
+    assert stats['errors'] == 0
+
+
+def test_retries_are_bounded(monkeypatch):
+    client, calls = _client_with_responses(monkeypatch, [requests.exceptions.ConnectionError()] * 3)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('https://scicrunch.example/_search', endpoint='search')
+    assert len(calls) == 3
+    assert client.stats()['search']['errors'] == 1
+
+
+def test_read_timeouts_are_not_retried(monkeypatch):
+    client, calls = _client_with_responses(monkeypatch, [requests.exceptions.ReadTimeout()])
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get('https://scicrunch.example/_search')
+    assert len(calls) == 1
+    assert '/_search' in client.stats()
+
+
+def test_session_is_shared_per_host():
+    client = SciCrunchClient()
+    assert client._session('https://scicrunch.org/a') is client._session('https://scicrunch.org/b')
+    assert client._session('https://scicrunch.org/a') is not client._session('https://api.scicrunch.io/a')
+
+
+def test_circuit_opens_after_repeated_failures(monkeypatch):
+    monkeypatch.setattr(Config, 'SCI_CRUNCH_BREAKER_FAILURES', 2)
+    monkeypatch.setattr(Config, 'SCI_CRUNCH_BREAKER_RESET', 30)
+    client, calls = _client_with_responses(monkeypatch, [500, 500])
+    for _ in range(2):
+        assert client.get('https://scicrunch.example/_search', endpoint='search').status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.get('https://scicrunch.example/_search', endpoint='search')
+    assert len(calls) == 2
+    assert client.breaker_stats()['scicrunch.example']['state'] == 'open'
+    assert client.circuit_open('https://scicrunch.example/other')
+    assert not client.circuit_open('https://api.scicrunch.example/_search')
+
+
+def test_circuits_are_kept_per_upstream_on_the_same_host(monkeypatch):
+    monkeypatch.setattr(Config, 'SCI_CRUNCH_BREAKER_FAILURES', 1)
+    client, calls = _client_with_responses(monkeypatch, [500, 200])
+    client.upstreams = ['https://scicrunch.example/api/scigraph', 'https://scicrunch.example/api/datasets']
+    assert client.get('https://scicrunch.example/api/scigraph/related', endpoint='related').status_code == 500
+    assert client.circuit_open('https://scicrunch.example/api/scigraph')
+    assert not client.circuit_open('https://scicrunch.example/api/datasets')
+    assert client.post('https://scicrunch.example/api/datasets/_search', endpoint='search').status_code == 200
+
+
+def test_forked_workers_get_their_own_sessions(monkeypatch):
+    client = SciCrunchClient()
+    session = client._session('https://scicrunch.org/a')
+    monkeypatch.setattr(os, 'getpid', lambda: client._pid + 1)
+    client._check_pid()
+    assert client._session('https://scicrunch.org/a') is not session
+
+
+def test_circuit_half_opens_after_the_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.allow()
+    assert breaker.state == 'half-open'
+    # Only the probe goes through while half-open.
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_passthrough_streams_the_encoded_body(monkeypatch):
+    import gzip
+    import io
+    from requests.structures import CaseInsensitiveDict
+    from urllib3 import HTTPResponse
+
+    body = gzip.compress(b'{"hits": {"total": 1, "hits": []}}')
+    sent = {}
+
+    def fake_request(self, method, url, timeout=None, **kwargs):
+        sent.update(kwargs)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        response.raw = HTTPResponse(body=io.BytesIO(body), headers=response.headers, preload_content=False)
+        return response
+
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+    proxied = SciCrunchClient().passthrough('POST', 'https://scicrunch.example/_search', endpoint='search',
+                                            json={}, accept_encoding='gzip, deflate')
+    assert sent['stream'] and sent['headers']['Accept-Encoding'] == 'gzip, deflate'
+    assert proxied.is_streamed
+    assert proxied.headers['Content-Encoding'] == 'gzip'
+    assert proxied.mimetype == 'application/json'
+    assert proxied.get_data() == body
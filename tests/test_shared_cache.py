@@ -0,0 +1,67 @@
+import time
+
+from app.shared_cache import SharedCache, make_cache_key
+
+
+def test_cache_key_is_canonical():
+    assert make_cache_key({'a': 1, 'b': {'c': 2, 'd': 3}}) == make_cache_key({'b': {'d': 3, 'c': 2}, 'a': 1})
+    assert make_cache_key({'a': 1}) != make_cache_key({'a': 2})
+
+
+def test_cache_round_trip_and_counters(tmp_path):
+    cache = SharedCache(str(tmp_path / 'cache.sqlite3'), 'test', 60, 1024)
+    assert cache.get_json('missing') is None
+    cache.set_json('key', {'hits': {'hits': []}})
+    assert cache.get_json('key') == {'hits': {'hits': []}}
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+
+
+def test_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    SharedCache(path, 'test', 60, 1024).set('key', b'value')
+    assert SharedCache(path, 'test', 60, 1024).get('key') == b'value'
+    assert SharedCache(path, 'other', 60, 1024).get('key') is None
+
+
+def test_cache_entries_expire(tmp_path, monkeypatch):
+    cache = SharedCache(str(tmp_path / 'cache.sqlite3'), 'test', 10, 1024)
+    cache.set('key', b'value')
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert cache.get('key') is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    cache = SharedCache(str(tmp_path / 'cache.sqlite3'), 'test', 60, 400)
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    for key in ['a', 'b', 'c', 'd']:
+        cache.set(key, b'x' * 100)
+        clock[0] += 1
+    assert cache.get('a') is not None
+    clock[0] += 1
+    cache.set('e', b'x' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cache_keeps_its_size_and_skips_big_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = SharedCache(path, 'test', 60, 400)
+    cache.set('a', b'x' * 100)
+    cache.set('a', b'x' * 50)
+    cache.set('b', b'x' * 20)
+    cache.set('big', b'x' * 101)
+    cache.delete('b')
+    stats = cache.stats()
+    assert stats['bytes'] == 50
+    assert stats['skipped'] == 1
+    # The counters of the other instances are written when they flush.
+    other = SharedCache(path, 'test', 60, 400)
+    assert other.get('a') == b'x' * 50
+    assert cache.stats()['hits'] == 0
+    assert other.stats()['hits'] == 1
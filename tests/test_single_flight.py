@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from app.single_flight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    single_flight = SingleFlight(timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {'value': 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do(('search', 'doi'), fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while single_flight.stats()['groups'].get('search', {}).get('coalesced', 0) < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{'value': 42}] * 5
+    assert single_flight.stats() == {'groups': {'search': {'calls': 1, 'coalesced': 4, 'timeouts': 0}}, 'in_flight': 0}
+
+
+def test_errors_are_shared_and_not_remembered():
+    single_flight = SingleFlight(timeout=5)
+
+    def fail():
+        raise ValueError('upstream failed')
+
+    with pytest.raises(ValueError):
+        single_flight.do('key', fail)
+    assert single_flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_waiters_give_up_after_the_timeout():
+    single_flight = SingleFlight(timeout=0.01)
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: single_flight.do('key', lambda: release.wait(5)))
+    leader.start()
+    while single_flight.stats()['in_flight'] == 0:
+        pass
+
+    assert single_flight.do('key', lambda: 'own result') == 'own result'
+    release.set()
+    leader.join()
+    assert single_flight.stats()['groups']['key']['timeouts'] == 1
+
+
+def test_waiters_get_the_base_exceptions_of_the_leader():
+    single_flight = SingleFlight(timeout=5)
+    release = threading.Event()
+
+    def interrupted():
+        release.wait(5)
+        raise KeyboardInterrupt()
+
+    errors = []
+
+    def leader():
+        try:
+            single_flight.do('key', interrupted)
+        except KeyboardInterrupt as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    while single_flight.stats()['in_flight'] == 0:
+        pass
+    waiter_thread = threading.Thread(target=leader)
+    waiter_thread.start()
+    while single_flight.stats()['groups']['key']['coalesced'] == 0:
+        pass
+    release.set()
+    thread.join()
+    waiter_thread.join()
+
+    assert len(errors) == 2
+    assert single_flight.stats()['in_flight'] == 0